@@ -36,12 +36,33 @@ EXPERIMENTS, LAYOUTS, _, EXTS = glob_wildcards(
 )
 
 
-checkpoint create_instances:
-    input:
-        COMPILED_PROTOS[0],
-        "Shuntyard-Instance-Generator/settings.ini",
-    output:
-        sentinel=SCEN_FILE,
-        all_files=directory("Shuntyard-Instance-Generator/quasi_real_instances"),
-    shell:
-        "cd Shuntyard-Instance-Generator && python main.py"
+# Generate each experiment (section of settings.ini) in its own job, with
+# --config sharded_generation=True, so that experiments are generated in parallel
+# and converted as soon as they are generated
+SHARDED_GENERATION = config.get("sharded_generation", False)
+
+if not SHARDED_GENERATION:
+
+    # Its outputs overlap the experiment directories, so it is only defined when
+    # all experiments are generated at once
+    checkpoint create_instances:
+        input:
+            COMPILED_PROTOS[0],
+            "Shuntyard-Instance-Generator/settings.ini",
+        output:
+            sentinel=SCEN_FILE,
+            all_files=directory("Shuntyard-Instance-Generator/quasi_real_instances"),
+        shell:
+            "cd Shuntyard-Instance-Generator && python main.py"
+
+else:
+
+    checkpoint create_experiment:
+        input:
+            COMPILED_PROTOS[0],
+            "Shuntyard-Instance-Generator/settings.ini",
+            script="workflow/scripts/generate_instances.py",
+        output:
+            directory("Shuntyard-Instance-Generator/quasi_real_instances/exp/{exp,[^/]+}"),
+        shell:
+            "python {input.script} {wildcards.exp}"
@@ -0,0 +1,657 @@
+"""
+Converts a whole tree of generated instances, optionally split into shards.
+
+Instances are grouped by layout (the directory that holds a .graph file and its
+.scen files), and every layout is assigned to a shard by a stable hash of its
+path. Each location is therefore converted on one shard only, and shards can run
+as separate processes or on separate machines. Every shard writes a manifest of
+what it converted; the merge command combines the manifests and checks that
+every instance in the tree was converted exactly once.
+"""
+import hashlib
+import json
+import logging
+import sys
+import time
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import Counter
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+
+from conversion_cost import (
+    COST_MODEL,
+    CostModel,
+    fit_cost_model,
+    longest_first,
+    makespan,
+    predict_seconds,
+)
+from conversion_guard import GuardedRunner, Limits, Progress, QuarantineRecord
+from id_mapping import IdMapping, id_mapping_path
+from instance_catalog import record_location, record_scenario
+from instance_conversion import (
+    GENERATOR_INSTANCES,
+    TORS_INSTANCES,
+    ConversionSettings,
+    LocationCache,
+    convert_graph_file,
+    convert_scenario,
+    location_output_path,
+    read_graph_file,
+    read_scenario_file,
+    scenario_graph_path,
+    scenario_output_path,
+    write_atomically,
+    write_location,
+    write_scenario,
+)
+from protobuf_to_tors_location import graph_to_location
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIRECTORY = "manifests"
+
+
+@dataclass
+class Layout:
+    # Relative to the instances root, e.g. "1a/shuffleboard_..._0.0r"
+    key: str
+    graphs: list[Path] = field(default_factory=list)
+    scenarios: list[Path] = field(default_factory=list)
+
+
+@dataclass
+class ManifestEntry:
+    kind: str
+    # Relative to the instances root
+    input: str
+    # Relative to the output root
+    output: str
+    ok: bool
+    error: str | None = None
+    # Wall-clock seconds of the conversion
+    seconds: float | None = None
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parses "i/N" into (i, N), with 0 <= i < N.
+    """
+    try:
+        index, n_shards = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ArgumentTypeError(f"Expected a shard as i/N, got {shard!r}")
+    if not 0 <= index < n_shards:
+        raise ArgumentTypeError(f"Shard index {index} is not in [0, {n_shards})")
+    return index, n_shards
+
+
+def shard_of(layout_key: str, n_shards: int) -> int:
+    """
+    Returns the shard of a layout. Unlike hash(), the result is the same in every
+    process and on every machine.
+    """
+    digest = hashlib.sha256(layout_key.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % n_shards
+
+
+def discover_layouts(instances_root: Path) -> list[Layout]:
+    """
+    Returns the layouts under the instances root, ordered by key.
+    """
+    layouts: dict[Path, Layout] = {}
+    for path in sorted(instances_root.rglob("*")):
+        if path.suffix not in (".graph", ".scen"):
+            continue
+        directory = path.parent
+        if directory not in layouts:
+            layouts[directory] = Layout(
+                directory.relative_to(instances_root).as_posix()
+            )
+        if path.suffix == ".graph":
+            layouts[directory].graphs.append(path)
+        else:
+            layouts[directory].scenarios.append(path)
+    return sorted(layouts.values(), key=lambda layout: layout.key)
+
+
+def layout_entries(
+    layout: Layout, instances_root: Path, output_root: Path
+) -> list[ManifestEntry]:
+    """
+    Returns a manifest entry for every instance of a layout, locations first, all
+    marked as not converted.
+    """
+    return [
+        ManifestEntry(
+            kind,
+            path.relative_to(instances_root).as_posix(),
+            output_path(path, instances_root, output_root)
+            .relative_to(output_root)
+            .as_posix(),
+            ok=False,
+        )
+        for kind, paths, output_path in [
+            ("location", layout.graphs, location_output_path),
+            ("scenario", layout.scenarios, scenario_output_path),
+        ]
+        for path in paths
+    ]
+
+
+def convert_layout(
+    layout: Layout,
+    instances_root: Path,
+    output_root: Path,
+    settings: ConversionSettings,
+    catalog: Path | None = None,
+    skip: frozenset[str] = frozenset(),
+    quarantined: frozenset[str] = frozenset(),
+    stage: Callable[[str, str], None] | None = None,
+) -> Iterator[ManifestEntry]:
+    """
+    Converts the locations and scenarios of a layout, each location only once,
+    and yields a manifest entry per instance.
+
+    Instances in skip (relative to the instances root) are not converted, and the
+    scenarios of a quarantined location fail. Failed conversions are logged and
+    recorded in the entries. Converted instances are recorded in the catalog if
+    one is given. stage is called with the instance and the name of every stage
+    it enters: read, convert and write.
+    """
+    locations = LocationCache(maxsize=len(layout.graphs) or 1)
+    stage = stage or (lambda instance, name: None)
+
+    def cached_location(graph_path: Path):
+        graph = graph_path.relative_to(instances_root).as_posix()
+        if graph in quarantined:
+            raise ValueError(f"The location {graph} is quarantined")
+        return locations.get_or_convert(
+            graph_path, lambda: convert_graph_file(graph_path, settings)
+        )
+
+    def convert_location(graph_path: Path, output_path: Path, enter):
+        enter("read")
+        mapf_graph = read_graph_file(graph_path)
+        enter("convert")
+        location = graph_to_location(mapf_graph, length=settings.track_length)
+        locations.put(graph_path, location)
+        enter("write")
+        write_location(location, output_path)
+        IdMapping.build(mapf_graph, location).save(id_mapping_path(output_path))
+        if catalog is not None:
+            record_location(catalog, output_path, location, source=graph_path)
+
+    def convert_scenario_file(scenario_path: Path, output_path: Path, enter):
+        enter("read")
+        graph_path = scenario_graph_path(scenario_path)
+        mapf_scenario = read_scenario_file(scenario_path)
+        enter("convert")
+        tors_scenario = convert_scenario(
+            mapf_scenario, cached_location(graph_path), settings
+        )
+        enter("write")
+        write_scenario(tors_scenario, output_path)
+        if catalog is not None:
+            location_path = location_output_path(
+                graph_path, instances_root, output_root
+            )
+            record_scenario(
+                catalog, output_path, tors_scenario, location_path, source=scenario_path
+            )
+
+    for entry in layout_entries(layout, instances_root, output_root):
+        if entry.input in skip:
+            continue
+        input_path = instances_root / entry.input
+        convert = (
+            convert_location if entry.kind == "location" else convert_scenario_file
+        )
+        start = time.perf_counter()
+        try:
+            convert(
+                input_path,
+                output_root / entry.output,
+                partial(stage, entry.input),
+            )
+            entry.ok = True
+        except Exception as e:
+            logger.exception(f"Could not convert {input_path}")
+            entry.error = f"{type(e).__name__}: {e}"
+        entry.seconds = round(time.perf_counter() - start, 4)
+        yield entry
+
+
+def layout_costs(layouts: list[Layout], cost_model: CostModel) -> list[float]:
+    """
+    Returns the predicted seconds to convert each layout.
+    """
+    graph_nodes_cache: dict[Path, int] = {}
+    return [
+        predict_seconds(cost_model, layout.graphs, layout.scenarios, graph_nodes_cache)
+        for layout in layouts
+    ]
+
+
+def read_manifests(output_root: Path, n_shards: int | None = None) -> list[dict]:
+    """
+    Returns the shard manifests in the output directory, only those of runs in
+    n_shards shards if it is given.
+    """
+    pattern = "shard-*-of-*.json" if n_shards is None else f"shard-*-of-{n_shards}.json"
+    manifests = []
+    for path in sorted((output_root / MANIFEST_DIRECTORY).glob(pattern)):
+        with open(path, "r") as manifest_file:
+            manifests.append(json.load(manifest_file))
+    return manifests
+
+
+def latest_n_shards(output_root: Path) -> int | None:
+    """
+    Returns the number of shards of the last written manifest in the output
+    directory, or None if there are none.
+    """
+    paths = list((output_root / MANIFEST_DIRECTORY).glob("shard-*-of-*.json"))
+    if not paths:
+        return None
+    with open(max(paths, key=lambda path: path.stat().st_mtime), "r") as manifest_file:
+        return json.load(manifest_file)["n_shards"]
+
+
+def manifest_path(output_root: Path, index: int, n_shards: int) -> Path:
+    return output_root / MANIFEST_DIRECTORY / f"shard-{index}-of-{n_shards}.json"
+
+
+def quarantine_path(output_root: Path, index: int, n_shards: int) -> Path:
+    return (
+        output_root
+        / MANIFEST_DIRECTORY
+        / f"quarantine-shard-{index}-of-{n_shards}.json"
+    )
+
+
+def read_quarantine(output_root: Path) -> dict[str, dict]:
+    """
+    Returns the instances quarantined by earlier runs of any shard, by input.
+    """
+    records = {}
+    for path in sorted(
+        (output_root / MANIFEST_DIRECTORY).glob("quarantine-shard-*-of-*.json")
+    ):
+        with open(path, "r") as quarantine_file:
+            for record in json.load(quarantine_file):
+                records[record["input"]] = record
+    return records
+
+
+def convert_shard(
+    instances_root: Path,
+    output_root: Path,
+    settings: ConversionSettings,
+    index: int = 0,
+    n_shards: int = 1,
+    catalog: Path | None = None,
+    limits: Limits | None = None,
+    jobs: int = 1,
+    retry_quarantined: bool = False,
+    cost_model: CostModel | None = None,
+) -> dict:
+    """
+    Converts the layouts of one shard and writes its manifest and quarantine list.
+
+    With more than one job or with limits, layouts are converted in worker
+    processes, longest predicted conversion time first, and instances that exceed
+    the limits are killed and quarantined. Instances quarantined by an earlier run
+    fail without being converted, unless retry_quarantined is set.
+    """
+    limits = limits or Limits()
+    layouts = [
+        layout
+        for layout in discover_layouts(instances_root)
+        if shard_of(layout.key, n_shards) == index
+    ]
+    logger.info(f"Shard {index}/{n_shards}: converting {len(layouts)} layouts")
+    # Filled in as the instances are converted, in the order of the layouts
+    entries = {
+        entry.input: entry
+        for layout in layouts
+        for entry in layout_entries(layout, instances_root, output_root)
+    }
+    results: dict[str, ManifestEntry] = {}
+    quarantine = {
+        input_path: record
+        for input_path, record in read_quarantine(output_root).items()
+        if input_path in entries and not retry_quarantined
+    }
+    for input_path, record in quarantine.items():
+        results[input_path] = entries[input_path]
+        results[input_path].error = f"Quarantined in an earlier run: {record['reason']}"
+
+    def add_result(input_path: str, entry: ManifestEntry):
+        results[input_path] = entry
+
+    def add_quarantined(record: QuarantineRecord):
+        quarantine[record.input] = asdict(record)
+        entry = entries[record.input]
+        entry.error = f"Quarantined: {record.reason}"
+        entry.seconds = round(sum(record.stage_seconds.values()), 4)
+        results[record.input] = entry
+
+    def convert_job(layout: Layout, skip: frozenset[str], progress: Progress):
+        # Workers are forked when a job is (re)started, so this includes the
+        # instances quarantined so far
+        for entry in convert_layout(
+            layout,
+            instances_root,
+            output_root,
+            settings,
+            catalog,
+            skip,
+            frozenset(quarantine),
+            progress.stage,
+        ):
+            progress.result(entry.input, entry)
+
+    if jobs > 1 or limits != Limits():
+        costs = layout_costs(layouts, cost_model or CostModel.default())
+        order = longest_first(costs)
+        logger.info(
+            f"Shard {index}/{n_shards}: predicted makespan on {jobs} workers "
+            f"{makespan(costs, order, jobs):.2f}s longest first, "
+            f"{makespan(costs, list(range(len(layouts))), jobs):.2f}s in path order"
+        )
+        runner = GuardedRunner(convert_job, limits, jobs, add_result, add_quarantined)
+        runner.run([layouts[job] for job in order], skip=quarantine)
+    else:
+        for layout in layouts:
+            for entry in convert_layout(
+                layout,
+                instances_root,
+                output_root,
+                settings,
+                catalog,
+                frozenset(quarantine),
+                frozenset(quarantine),
+            ):
+                add_result(entry.input, entry)
+
+    manifest = {
+        "shard": index,
+        "n_shards": n_shards,
+        "settings": asdict(settings),
+        "layouts": [layout.key for layout in layouts],
+        "instances": [
+            asdict(results[input_path])
+            for input_path in entries
+            if input_path in results
+        ],
+    }
+    write_atomically(
+        manifest_path(output_root, index, n_shards),
+        lambda manifest_file: json.dump(manifest, manifest_file, indent=2),
+    )
+    write_atomically(
+        quarantine_path(output_root, index, n_shards),
+        lambda quarantine_file: json.dump(
+            list(quarantine.values()), quarantine_file, indent=2
+        ),
+    )
+    failed = sum(not entry.ok for entry in results.values())
+    logger.info(
+        f"Shard {index}/{n_shards}: converted {len(results) - failed} instances, "
+        f"{failed} failed, {len(quarantine)} quarantined"
+    )
+    return manifest
+
+
+def merge_manifests(
+    manifests: list[dict],
+    instances_root: Path,
+    output_root: Path,
+    n_shards: int | None = None,
+) -> tuple[dict, list[str]]:
+    """
+    Combines shard manifests and returns the merged manifest and the coverage
+    problems: missing or duplicate shards, instances that were not converted or
+    were converted more than once, failed conversions and missing outputs.
+
+    Manifests of a run in a different number of shards than n_shards, for example
+    left over from an earlier run, are ignored. Without n_shards, all manifests
+    have to agree on it.
+    """
+    problems = []
+    if n_shards is None:
+        counts = {manifest["n_shards"] for manifest in manifests}
+        if len(counts) > 1:
+            problems.append(
+                f"Manifests disagree on the number of shards: {sorted(counts)}"
+            )
+        n_shards = max(counts, default=0)
+    ignored = sum(manifest["n_shards"] != n_shards for manifest in manifests)
+    if ignored:
+        logger.warning(
+            f"Ignoring {ignored} manifests of runs in another number of shards "
+            f"than {n_shards}"
+        )
+    manifests = [manifest for manifest in manifests if manifest["n_shards"] == n_shards]
+    shards = Counter(manifest["shard"] for manifest in manifests)
+    missing_shards = sorted(set(range(n_shards)) - shards.keys())
+    if missing_shards:
+        problems.append(
+            f"Missing the manifests of shards {missing_shards} of {n_shards}"
+        )
+    for shard, count in sorted(shards.items()):
+        if count > 1:
+            problems.append(f"Shard {shard} of {n_shards} has {count} manifests")
+    settings = {
+        json.dumps(manifest["settings"], sort_keys=True) for manifest in manifests
+    }
+    if len(settings) > 1:
+        problems.append("Shards were converted with different settings")
+
+    converted: dict[str, dict] = {}
+    for manifest in manifests:
+        for entry in manifest["instances"]:
+            if entry["input"] in converted:
+                problems.append(f"{entry['input']} was converted by several shards")
+            converted[entry["input"]] = entry
+
+    expected = {
+        path.relative_to(instances_root).as_posix()
+        for layout in discover_layouts(instances_root)
+        for path in [*layout.graphs, *layout.scenarios]
+    }
+    for missing in sorted(expected - converted.keys()):
+        problems.append(f"{missing} was not converted")
+    for input_path, entry in sorted(converted.items()):
+        if not entry["ok"]:
+            problems.append(f"{input_path} failed: {entry['error']}")
+        elif not (output_root / entry["output"]).exists():
+            problems.append(
+                f"{input_path} was converted, but {entry['output']} is missing"
+            )
+
+    merged = {
+        "n_shards": n_shards,
+        "settings": manifests[0]["settings"] if manifests else None,
+        "layouts": sorted(key for manifest in manifests for key in manifest["layouts"]),
+        "instances": [converted[input_path] for input_path in sorted(converted)],
+        "complete": not problems,
+    }
+    return merged, problems
+
+
+def add_settings_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "--length", help="The length of the track parts.", default=100, type=int
+    )
+    parser.add_argument(
+        "--train-length", help="The length of the trains.", default=100, type=int
+    )
+    parser.add_argument(
+        "--n-carriages", help="The number of carriages per train.", default=1, type=int
+    )
+    parser.add_argument(
+        "--time-between-trains", help="The time between trains.", default=100, type=int
+    )
+
+
+def main():
+    """
+    Converts all generated instances, or one shard of them, and merges the shard
+    manifests.
+
+    Example of converting in three shards and checking the result:
+
+        for i in 0 1 2; do
+            python workflow/scripts/batch_convert.py convert --shard $i/3 &
+        done
+        wait
+        python workflow/scripts/batch_convert.py merge
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Converts generated instances to TORS json files in shards."
+    )
+    parser.add_argument(
+        "--instances",
+        help="The directory the instance generator writes to.",
+        default=GENERATOR_INSTANCES,
+        type=Path,
+    )
+    parser.add_argument(
+        "--output",
+        help="The directory to write the TORS instances to.",
+        default=TORS_INSTANCES,
+        type=Path,
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser("convert", help="Converts a shard.")
+    convert_parser.add_argument(
+        "--shard",
+        help="The shard to convert, as i/N for shard i (from 0) of N.",
+        default=(0, 1),
+        type=parse_shard,
+    )
+    convert_parser.add_argument(
+        "--catalog",
+        help="Record the converted instances in this instance catalog.",
+        default=None,
+        type=Path,
+    )
+    convert_parser.add_argument(
+        "--jobs",
+        help="The number of worker processes.",
+        default=1,
+        type=int,
+    )
+    convert_parser.add_argument(
+        "--timeout",
+        help="Kill and quarantine instances that take longer than this many seconds.",
+        default=None,
+        type=float,
+    )
+    convert_parser.add_argument(
+        "--memory-limit",
+        help="Kill and quarantine instances when a worker uses more than this many "
+        "megabytes of resident memory.",
+        default=None,
+        type=float,
+    )
+    convert_parser.add_argument(
+        "--cost-model",
+        help="The cost model to order the layouts by, by default the one fitted "
+        "with conversion_cost.py, or else one fitted on the timings in the "
+        "manifests of the last run.",
+        default=None,
+        type=Path,
+    )
+    convert_parser.add_argument(
+        "--retry-quarantined",
+        help="Convert the instances quarantined by earlier runs again.",
+        action="store_true",
+    )
+    add_settings_arguments(convert_parser)
+
+    merge_parser = commands.add_parser(
+        "merge", help="Merges the shard manifests and checks the coverage."
+    )
+    merge_parser.add_argument(
+        "manifests",
+        help="The shard manifests, by default those of the last run in the output "
+        "directory.",
+        type=Path,
+        nargs="*",
+    )
+    merge_parser.add_argument(
+        "--shards",
+        help="Merge the manifests of a run in this many shards, by default the "
+        "number of shards of the last written manifest.",
+        default=None,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        index, n_shards = args.shard
+        settings = ConversionSettings(
+            track_length=args.length,
+            train_length=args.train_length,
+            n_carriages=args.n_carriages,
+            time_between_trains=args.time_between_trains,
+        )
+        cost_model_path = (
+            args.cost_model or args.output / MANIFEST_DIRECTORY / COST_MODEL
+        )
+        if cost_model_path.exists():
+            cost_model = CostModel.load(cost_model_path)
+        else:
+            cost_model = fit_cost_model(
+                read_manifests(args.output, latest_n_shards(args.output)),
+                args.instances,
+            )
+        manifest = convert_shard(
+            args.instances,
+            args.output,
+            settings,
+            index,
+            n_shards,
+            args.catalog,
+            Limits(args.timeout, args.memory_limit),
+            args.jobs,
+            args.retry_quarantined,
+            cost_model,
+        )
+        if not all(entry["ok"] for entry in manifest["instances"]):
+            sys.exit(1)
+        return
+
+    n_shards = args.shards
+    if args.manifests:
+        manifests = []
+        for path in args.manifests:
+            with open(path, "r") as manifest_file:
+                manifests.append(json.load(manifest_file))
+    else:
+        n_shards = n_shards or latest_n_shards(args.output)
+        manifests = read_manifests(args.output, n_shards)
+    merged, problems = merge_manifests(manifests, args.instances, args.output, n_shards)
+    write_atomically(
+        args.output / MANIFEST_DIRECTORY / "merged.json",
+        lambda manifest_file: json.dump(merged, manifest_file, indent=2),
+    )
+    for problem in problems:
+        logger.error(problem)
+    logger.info(
+        f"Merged {len(manifests)} manifests with {len(merged['instances'])} instances"
+    )
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import io
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from protobuf_to_tors_location import graph_to_location, write_location_json
+from protos.graph_pb2 import Graph, Node, NodeType
+
+logger = logging.getLogger(__name__)
+
+
+def make_grid_graph(rows: int, columns: int, n_gates: int = 3) -> Graph:
+    """
+    Creates a rows x columns grid graph, with a chain of gates connected to the
+    first node of the grid.
+
+    Grid nodes are named "n-<row>-<column>", gates "g-<number>".
+    """
+    graph = Graph()
+    for i in range(1, n_gates + 1):
+        neighbors = [f"g-{j}" for j in (i - 1, i + 1) if 1 <= j <= n_gates]
+        if i == n_gates:
+            neighbors.append("n-0-0")
+        graph.nodes.append(Node(id=f"g-{i}", neighbors=neighbors, type=NodeType.GATE))
+    for row in range(rows):
+        for column in range(columns):
+            neighbors = [
+                f"n-{r}-{c}"
+                for r, c in [
+                    (row - 1, column),
+                    (row + 1, column),
+                    (row, column - 1),
+                    (row, column + 1),
+                ]
+                if 0 <= r < rows and 0 <= c < columns
+            ]
+            graph.nodes.append(
+                Node(id=f"n-{row}-{column}", neighbors=neighbors, type=NodeType.BRANCH)
+            )
+    graph.nodes[n_gates].neighbors.append(f"g-{n_gates}")
+    return graph
+
+
+class _CountingWriter(io.TextIOBase):
+    def __init__(self):
+        self.written = 0
+
+    def write(self, text: str) -> int:
+        self.written += len(text)
+        return len(text)
+
+
+def convert_grid(size: int, length: int) -> dict:
+    """
+    Converts a size x size grid and returns the time and peak memory it took.
+
+    Meant to be run in a fresh process, so the peak memory is that of a single
+    conversion.
+    """
+    graph = make_grid_graph(size, size)
+    start = time.perf_counter()
+    location = graph_to_location(graph, length=length)
+    converted = time.perf_counter()
+    # Count the written characters without keeping them in memory
+    location_file = _CountingWriter()
+    write_location_json(location, location_file)
+    serialized = time.perf_counter()
+    return {
+        "size": size,
+        "nodes": len(graph.nodes),
+        "track_parts": len(location.trackParts),
+        "convert_seconds": round(converted - start, 3),
+        "serialize_seconds": round(serialized - converted, 3),
+        "json_megabytes": round(location_file.written / 2**20, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_megabytes": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 1
+        ),
+    }
+
+
+def main():
+    """
+    Benchmarks the conversion of square grid layouts of increasing size.
+
+    Each size is converted in a separate process. Exits with a non-zero status if
+    any conversion exceeds the memory budget.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(description="Benchmarks the conversion of grid layouts.")
+    parser.add_argument(
+        "--sizes",
+        help="The grid sizes (number of rows and columns) to benchmark.",
+        default=[50, 100, 200, 500],
+        type=int,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--length", help="The length of the track parts.", default=100, type=int
+    )
+    parser.add_argument(
+        "--memory-budget",
+        help="The maximum peak memory per conversion in megabytes.",
+        default=2048,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    # Suppress the per-conversion logging in the worker processes
+    logging.getLogger("protobuf_to_tors_location").setLevel(logging.WARNING)
+
+    over_budget = False
+    ctx = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        with ctx.Pool(1) as pool:
+            result = pool.apply(convert_grid, (size, args.length))
+        result["within_budget"] = result["peak_rss_megabytes"] <= args.memory_budget
+        over_budget |= not result["within_budget"]
+        print(json.dumps(result))
+
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Predicts how long instances take to convert, to schedule the largest layouts first.
+
+The prediction only uses the headers of the generated files: the node count on
+the second line of a .graph file and the agent count on the third line of a .scen
+file. The cost of a location is linear in its node count, and the cost of a
+scenario in its agent count and the node count of its location. The coefficients
+are fitted by least squares on the seconds recorded in the shard manifests of
+earlier runs.
+
+Converting the layouts longest first (longest processing time first scheduling)
+keeps the largest layouts from starting last and running alone at the end of a
+batch. With exact conversion times, the makespan is within 4/3 of the optimum.
+The predicted times are estimates, so that bound does not hold for them, and the
+schedule is only as good as the prediction.
+"""
+import heapq
+import json
+import logging
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+from instance_conversion import GENERATOR_INSTANCES, TORS_INSTANCES, scenario_graph_path
+
+logger = logging.getLogger(__name__)
+
+COST_MODEL = "cost_model.json"
+
+# Feature names per kind, the first being the constant term
+FEATURES = {
+    "location": ["constant", "nodes"],
+    "scenario": ["constant", "agents", "nodes"],
+}
+# Shortest predicted conversion time, so that costs stay positive
+MIN_SECONDS = 1e-4
+
+
+@dataclass
+class CostModel:
+    # Seconds per unit of each feature in FEATURES
+    location: list[float]
+    scenario: list[float]
+    # The number of timings the coefficients were fitted on, 0 for the defaults
+    samples: int = 0
+
+    @classmethod
+    def default(cls) -> "CostModel":
+        """
+        Returns a model that ranks instances by size before any timings are known.
+        """
+        return cls(location=[1e-3, 1e-4], scenario=[1e-3, 1e-5, 1e-5])
+
+    def predict(self, kind: str, features: np.ndarray) -> np.ndarray:
+        """
+        Returns the predicted seconds for rows of features of one kind.
+        """
+        coefficients = np.array(getattr(self, kind))
+        return np.maximum(features @ coefficients, MIN_SECONDS)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as model_file:
+            json.dump(asdict(self), model_file, indent=2)
+
+    @classmethod
+    def load(cls, path: Path) -> "CostModel":
+        with open(path, "r") as model_file:
+            return cls(**json.load(model_file))
+
+
+def read_header_count(path: Path, line_number: int) -> int:
+    """
+    Returns the count on a header line such as "nodes 12" or "agents 12".
+    """
+    with open(path, "r") as header_file:
+        for _ in range(line_number):
+            line = header_file.readline()
+    return int(line.split()[1])
+
+
+def graph_nodes(graph_path: Path) -> int:
+    return read_header_count(graph_path, 2)
+
+
+def scenario_agents(scenario_path: Path) -> int:
+    return read_header_count(scenario_path, 3)
+
+
+def instance_features(
+    kind: str, path: Path, graph_nodes_cache: dict[Path, int] | None = None
+) -> list[float]:
+    """
+    Returns the features of a .graph (kind "location") or .scen file.
+    """
+    graph_nodes_cache = {} if graph_nodes_cache is None else graph_nodes_cache
+    graph_path = path if kind == "location" else scenario_graph_path(path)
+    if graph_path not in graph_nodes_cache:
+        graph_nodes_cache[graph_path] = graph_nodes(graph_path)
+    nodes = graph_nodes_cache[graph_path]
+    if kind == "location":
+        return [1.0, nodes]
+    return [1.0, scenario_agents(path), nodes]
+
+
+def fit_cost_model(
+    manifests: list[dict], instances_root: Path, default: CostModel | None = None
+) -> CostModel:
+    """
+    Fits the coefficients on the seconds of the successful conversions in the
+    manifests. A kind with fewer timings than features keeps the default
+    coefficients.
+    """
+    model = default or CostModel.default()
+    graph_nodes_cache: dict[Path, int] = {}
+    for kind, names in FEATURES.items():
+        features, seconds = [], []
+        for manifest in manifests:
+            for entry in manifest["instances"]:
+                if entry["kind"] != kind or not entry["ok"]:
+                    continue
+                if entry.get("seconds") is None:
+                    continue
+                path = instances_root / entry["input"]
+                try:
+                    features.append(instance_features(kind, path, graph_nodes_cache))
+                except (OSError, ValueError, IndexError):
+                    # The instance was removed or changed since it was converted
+                    continue
+                seconds.append(entry["seconds"])
+        if len(seconds) < len(names):
+            logger.info(
+                f"Only {len(seconds)} {kind} timings, keeping the default coefficients"
+            )
+            continue
+        coefficients, *_ = np.linalg.lstsq(
+            np.array(features), np.array(seconds), rcond=None
+        )
+        setattr(model, kind, [float(coefficient) for coefficient in coefficients])
+        model.samples += len(seconds)
+    return model
+
+
+def predict_seconds(
+    model: CostModel,
+    graphs: list[Path],
+    scenarios: list[Path],
+    graph_nodes_cache: dict[Path, int] | None = None,
+) -> float:
+    """
+    Returns the predicted seconds to convert the given .graph and .scen files.
+    Files with a header that cannot be read are counted with the constant term
+    only.
+    """
+    graph_nodes_cache = {} if graph_nodes_cache is None else graph_nodes_cache
+    seconds = 0.0
+    for kind, paths in [("location", graphs), ("scenario", scenarios)]:
+        features = np.zeros((len(paths), len(FEATURES[kind])))
+        features[:, 0] = 1.0
+        for row, path in enumerate(paths):
+            try:
+                features[row] = instance_features(kind, path, graph_nodes_cache)
+            except (OSError, ValueError, IndexError):
+                logger.debug(f"Could not read the header of {path}")
+        seconds += float(model.predict(kind, features).sum())
+    return seconds
+
+
+def longest_first(costs: list[float]) -> list[int]:
+    """
+    Returns the indices of the jobs ordered by decreasing cost, ties by index.
+    """
+    return sorted(range(len(costs)), key=lambda job: (-costs[job], job))
+
+
+def makespan(costs: list[float], order: list[int], workers: int) -> float:
+    """
+    Returns the makespan of starting the jobs in order on the first free worker.
+    """
+    finish_times = [0.0] * max(workers, 1)
+    for job in order:
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + costs[job])
+    return max(finish_times)
+
+
+def main():
+    # batch_convert imports this module
+    from batch_convert import MANIFEST_DIRECTORY, latest_n_shards, read_manifests
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Fits the conversion cost model on the timings in the shard "
+        "manifests."
+    )
+    parser.add_argument(
+        "--instances",
+        help="The directory the instance generator writes to.",
+        default=GENERATOR_INSTANCES,
+        type=Path,
+    )
+    parser.add_argument(
+        "--output",
+        help="The directory the TORS instances and manifests are written to.",
+        default=TORS_INSTANCES,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    manifests = read_manifests(args.output, latest_n_shards(args.output))
+    model = fit_cost_model(manifests, args.instances)
+    model.save(args.output / MANIFEST_DIRECTORY / COST_MODEL)
+    for kind, names in FEATURES.items():
+        terms = ", ".join(
+            f"{name} {coefficient:.3g}"
+            for name, coefficient in zip(names, getattr(model, kind))
+        )
+        logger.info(f"{kind} seconds: {terms}")
+    logger.info(f"Fitted on {model.samples} timings from {len(manifests)} manifests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Runs conversion jobs in worker processes with per-instance time and memory limits.
+
+A job converts a number of instances (for example, the location and scenarios of
+a layout) and reports its progress to the parent process: the stage each instance
+is in and a result when an instance is done. The parent kills a worker when the
+instance it is working on runs longer than the timeout or the worker's resident
+memory exceeds the limit, records the instance in the quarantine list with the
+time it spent in each stage, and restarts the job without the instances that are
+already done or quarantined. One bad instance therefore only costs its own
+timeout.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection, wait
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the running workers
+POLL_INTERVAL = 0.1
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+@dataclass(frozen=True)
+class Limits:
+    # Wall-clock seconds per instance
+    timeout: float | None = None
+    # Resident memory of a worker in megabytes
+    memory_limit: float | None = None
+
+
+@dataclass
+class QuarantineRecord:
+    input: str
+    reason: str
+    # The stage the instance was in when it was stopped
+    stage: str | None
+    # Seconds spent in each stage, including the one it was stopped in
+    stage_seconds: dict[str, float]
+    peak_rss_megabytes: float
+
+
+class Progress:
+    """
+    Sends the progress of a job from the worker process to the parent.
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+
+    def stage(self, instance: str, stage: str):
+        self.connection.send(("stage", instance, stage))
+
+    def result(self, instance: str, result: Any):
+        self.connection.send(("result", instance, result))
+
+
+# A job function takes the job, the instances to skip, and the progress reporter,
+# and reports a result for every instance it converts
+JobFunction = Callable[[Any, frozenset[str], Progress], None]
+
+
+def _run_worker(job_function: JobFunction, job, skip, connection: Connection):
+    # The parent handles interrupts and stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    job_function(job, skip, Progress(connection))
+    connection.close()
+
+
+def resident_megabytes(pid: int) -> float:
+    """
+    Returns the resident memory of a process in megabytes, 0 if it has exited.
+    """
+    try:
+        with open(f"/proc/{pid}/statm", "r") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (FileNotFoundError, ProcessLookupError):
+        return 0.0
+
+
+@dataclass
+class _Worker:
+    job: Any
+    process: multiprocessing.Process
+    connection: Connection
+    # Instances that are done or quarantined, over all restarts of the job
+    handled: set[str]
+    instance: str | None = None
+    stage: str | None = None
+    instance_started: float = 0.0
+    stage_started: float = 0.0
+    stage_seconds: dict[str, float] = field(default_factory=dict)
+    peak_rss: float = 0.0
+
+
+class GuardedRunner:
+    """
+    Runs jobs in up to `jobs` worker processes, enforcing the limits per instance.
+
+    on_result is called in the parent with (instance, result) for every converted
+    instance, and on_quarantine with a QuarantineRecord for every stopped one.
+    """
+
+    def __init__(
+        self,
+        job_function: JobFunction,
+        limits: Limits,
+        jobs: int,
+        on_result: Callable[[str, Any], None],
+        on_quarantine: Callable[[QuarantineRecord], None],
+    ):
+        self.job_function = job_function
+        self.limits = limits
+        self.jobs = jobs
+        self.on_result = on_result
+        self.on_quarantine = on_quarantine
+        # Fork, so workers start quickly and share the parent's imports
+        self._context = multiprocessing.get_context("fork")
+
+    def _start(self, job, handled: set[str]) -> _Worker:
+        parent_connection, child_connection = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.job_function, job, frozenset(handled), child_connection),
+            daemon=True,
+        )
+        process.start()
+        child_connection.close()
+        return _Worker(job, process, parent_connection, handled)
+
+    def _receive(self, worker: _Worker):
+        """
+        Handles the messages a worker has sent.
+        """
+        while worker.connection.poll():
+            try:
+                message = worker.connection.recv()
+            except (EOFError, OSError):
+                return
+            now = time.monotonic()
+            kind, instance, value = message
+            if kind == "stage":
+                if instance != worker.instance:
+                    worker.instance = instance
+                    worker.instance_started = now
+                    worker.stage_seconds = {}
+                else:
+                    self._end_stage(worker, now)
+                worker.stage = value
+                worker.stage_started = now
+            else:
+                worker.handled.add(instance)
+                worker.instance = None
+                worker.stage = None
+                self.on_result(instance, value)
+
+    def _end_stage(self, worker: _Worker, now: float):
+        if worker.stage is not None:
+            worker.stage_seconds[worker.stage] = round(
+                worker.stage_seconds.get(worker.stage, 0.0)
+                + now
+                - worker.stage_started,
+                3,
+            )
+
+    def _violation(self, worker: _Worker) -> str | None:
+        rss = resident_megabytes(worker.process.pid)
+        worker.peak_rss = max(worker.peak_rss, rss)
+        if self.limits.memory_limit is not None and rss > self.limits.memory_limit:
+            return f"memory limit: {rss:.0f} MB resident"
+        if (
+            self.limits.timeout is not None
+            and worker.instance is not None
+            and time.monotonic() - worker.instance_started > self.limits.timeout
+        ):
+            return f"timeout after {self.limits.timeout:g}s"
+        return None
+
+    def _stop(self, worker: _Worker, reason: str) -> bool:
+        """
+        Kills a worker and quarantines its current instance. Returns True if the
+        job should be restarted without it.
+        """
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+        worker.connection.close()
+        if worker.instance is None:
+            logger.error(
+                f"A worker stopped between instances, its job is dropped: {reason}"
+            )
+            return False
+        self._end_stage(worker, time.monotonic())
+        record = QuarantineRecord(
+            worker.instance,
+            reason,
+            worker.stage,
+            worker.stage_seconds,
+            round(worker.peak_rss, 1),
+        )
+        logger.warning(
+            f"Quarantined {record.input} in stage {record.stage}: {record.reason}"
+        )
+        worker.handled.add(worker.instance)
+        self.on_quarantine(record)
+        return True
+
+    def run(self, jobs: Iterable[Any], skip: Iterable[str] = ()):
+        """
+        Runs all jobs, skipping the given instances.
+        """
+        pending = deque((job, set(skip)) for job in jobs)
+        running: list[_Worker] = []
+        try:
+            while pending or running:
+                while pending and len(running) < self.jobs:
+                    running.append(self._start(*pending.popleft()))
+                wait([worker.connection for worker in running], timeout=POLL_INTERVAL)
+                for worker in list(running):
+                    self._receive(worker)
+                    if worker.process.is_alive():
+                        reason = self._violation(worker)
+                        if reason is None:
+                            continue
+                    else:
+                        worker.process.join()
+                        # Read the messages sent right before exiting
+                        self._receive(worker)
+                        if worker.process.exitcode == 0:
+                            running.remove(worker)
+                            worker.connection.close()
+                            continue
+                        reason = f"worker exited with code {worker.process.exitcode}"
+                    running.remove(worker)
+                    if self._stop(worker, reason):
+                        pending.appendleft((worker.job, worker.handled))
+        finally:
+            for worker in running:
+                worker.process.kill()
+                worker.process.join()
@@ -0,0 +1,406 @@
+import hashlib
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from argparse import ArgumentParser
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+from google.protobuf.message import DecodeError
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from instance_conversion import ConversionSettings, LocationCache, convert_scenario
+from protobuf_to_tors_location import graph_to_location
+from protos.graph_pb2 import Graph
+from protos.Location_pb2 import Location
+from protos.scenario_mapf_pb2 import Scenario as MAPFScenario
+from protos.Scenario_pb2 import Scenario
+
+logger = logging.getLogger(__name__)
+
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+
+
+def graph_fingerprint(graph: Graph) -> str:
+    """
+    Returns a hash of the graph that is the same for equal graphs.
+    """
+    return hashlib.sha256(graph.SerializeToString(deterministic=True)).hexdigest()
+
+
+class UnknownLocation(KeyError):
+    pass
+
+
+# Errors of invalid requests, which fail only the request
+REQUEST_ERRORS = (DecodeError, KeyError, ValueError)
+
+
+@dataclass
+class _Request:
+    kind: str
+    payload: bytes
+    settings: ConversionSettings
+    fingerprint: str | None = None
+    result: Future = field(default_factory=Future)
+
+
+class ConversionBatcher:
+    """
+    Converts requests on a single worker thread, in batches.
+
+    All requests that arrive while a batch is being converted form the next batch.
+    Within a batch, location requests for the same graph are converted once, and
+    scenario requests are grouped by location, so concurrent requests for the same
+    layout share the work and the worker keeps its locations cached.
+    """
+
+    def __init__(self, cache_size: int = 256):
+        self.locations = LocationCache(cache_size)
+        self.batch_sizes: deque[int] = deque(maxlen=10_000)
+        self._requests: queue.SimpleQueue[_Request] = queue.SimpleQueue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, request: _Request) -> Future:
+        self._requests.put(request)
+        return request.result
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            while True:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            self.batch_sizes.append(len(batch))
+            try:
+                self._convert_batch(batch)
+            except Exception as e:
+                # Keep the worker running, and fail the requests that would wait
+                logger.exception("Could not convert a batch")
+                for request in batch:
+                    if not request.result.done():
+                        request.result.set_exception(e)
+
+    def _convert_batch(self, batch: list[_Request]):
+        # Locations first, so scenarios in the same batch can use them
+        location_requests = defaultdict(list)
+        scenario_requests = defaultdict(list)
+        for request in batch:
+            try:
+                if request.kind == "location":
+                    graph = Graph()
+                    graph.ParseFromString(request.payload)
+                    key = (graph_fingerprint(graph), request.settings.track_length)
+                    location_requests[key].append((request, graph))
+                else:
+                    key = (request.fingerprint, request.settings.track_length)
+                    scenario_requests[key].append(request)
+            except REQUEST_ERRORS as e:
+                request.result.set_exception(e)
+
+        for (fingerprint, track_length), requests in location_requests.items():
+            graph = requests[0][1]
+            try:
+                cached = self.locations.get_or_convert(
+                    (fingerprint, track_length),
+                    partial(graph_to_location, graph, length=track_length),
+                )
+            except REQUEST_ERRORS as e:
+                for request, _ in requests:
+                    request.result.set_exception(e)
+                continue
+            for request, _ in requests:
+                request.result.set_result((fingerprint, cached.location))
+
+        for key, requests in scenario_requests.items():
+            cached = self.locations.get(key)
+            for request in requests:
+                if cached is None:
+                    request.result.set_exception(UnknownLocation(key[0]))
+                    continue
+                try:
+                    mapf_scenario = MAPFScenario()
+                    mapf_scenario.ParseFromString(request.payload)
+                    request.result.set_result(
+                        convert_scenario(mapf_scenario, cached, request.settings)
+                    )
+                except REQUEST_ERRORS as e:
+                    request.result.set_exception(e)
+
+
+class LatencyRecorder:
+    def __init__(self, maxlen: int = 10_000):
+        self._latencies: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=maxlen)
+        )
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._latencies[endpoint].append(seconds)
+
+    def summary(self) -> dict:
+        """
+        Returns the number of requests and the latency percentiles in milliseconds
+        of the most recent requests per endpoint.
+        """
+        with self._lock:
+            latencies = {
+                endpoint: np.array(values) * 1000
+                for endpoint, values in self._latencies.items()
+            }
+        return {
+            endpoint: {
+                "count": len(values),
+                **{
+                    f"p{q}": round(float(np.percentile(values, q)), 3)
+                    for q in (50, 90, 99)
+                },
+                "max": round(float(values.max()), 3),
+            }
+            for endpoint, values in latencies.items()
+            if len(values) > 0
+        }
+
+
+def _settings_from_query(query: dict[str, list[str]]) -> ConversionSettings:
+    def get(name: str, default):
+        values = query.get(name)
+        return int(values[0]) if values else default
+
+    defaults = ConversionSettings()
+    return ConversionSettings(
+        track_length=get("length", defaults.track_length),
+        train_length=get("train_length", defaults.train_length),
+        n_carriages=get("n_carriages", defaults.n_carriages),
+        time_between_trains=get("time_between_trains", defaults.time_between_trains),
+        total_time=get("total_time", defaults.total_time),
+    )
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /location: body is a serialized graph_pb2.Graph, the response a
+        serialized Location. The X-Graph-Fingerprint response header identifies
+        the location in scenario requests.
+    POST /scenario?graph=<fingerprint>: body is a serialized scenario_mapf_pb2.Scenario,
+        the response a serialized Scenario. Responds 404 if the location of the
+        graph is not cached (anymore); convert the graph again in that case.
+    GET /stats: request latency percentiles and cache statistics as json.
+
+    The conversion settings are given as query parameters: length (of the track
+    parts), train_length, n_carriages, time_between_trains and total_time.
+    """
+
+    server: "ConversionServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args):
+        logger.debug(format, *args)
+
+    def _respond(
+        self,
+        status: HTTPStatus,
+        body: bytes,
+        content_type: str,
+        headers: dict[str, str] | None = None,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: HTTPStatus, message: str):
+        self._respond(status, message.encode(), "text/plain")
+
+    def do_GET(self):
+        if urllib.parse.urlparse(self.path).path != "/stats":
+            self._error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+            return
+        batcher = self.server.batcher
+        batch_sizes = np.array(batcher.batch_sizes)
+        stats = {
+            "latency_ms": self.server.latencies.summary(),
+            "cache": {
+                "size": len(batcher.locations),
+                "hits": batcher.locations.hits,
+                "misses": batcher.locations.misses,
+            },
+            "mean_batch_size": (
+                round(float(batch_sizes.mean()), 2) if len(batch_sizes) else None
+            ),
+        }
+        self._respond(HTTPStatus.OK, json.dumps(stats).encode(), "application/json")
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urllib.parse.urlparse(self.path)
+        endpoint = url.path.strip("/")
+        payload = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if endpoint not in ("location", "scenario"):
+            self._error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+            return
+        try:
+            self._convert(endpoint, urllib.parse.parse_qs(url.query), payload)
+        finally:
+            self.server.latencies.record(endpoint, time.perf_counter() - start)
+
+    def _convert(self, endpoint: str, query: dict[str, list[str]], payload: bytes):
+        try:
+            settings = _settings_from_query(query)
+        except ValueError as e:
+            self._error(HTTPStatus.BAD_REQUEST, f"Invalid parameter: {e}")
+            return
+        fingerprint = query.get("graph", [None])[0]
+        if endpoint == "scenario" and fingerprint is None:
+            self._error(HTTPStatus.BAD_REQUEST, "Missing graph fingerprint")
+            return
+
+        request = _Request(endpoint, payload, settings, fingerprint)
+        try:
+            result = self.server.batcher.submit(request).result()
+        except UnknownLocation:
+            self._error(HTTPStatus.NOT_FOUND, f"Unknown graph {fingerprint}")
+            return
+        except (DecodeError, ValueError) as e:
+            self._error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        except Exception as e:
+            logger.exception("Conversion failed")
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+
+        if endpoint == "location":
+            fingerprint, location = result
+            self._respond(
+                HTTPStatus.OK,
+                location.SerializeToString(),
+                PROTOBUF_CONTENT_TYPE,
+                {"X-Graph-Fingerprint": fingerprint},
+            )
+        else:
+            self._respond(
+                HTTPStatus.OK, result.SerializeToString(), PROTOBUF_CONTENT_TYPE
+            )
+
+
+class ConversionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], cache_size: int = 256):
+        super().__init__(address, ConversionRequestHandler)
+        self.batcher = ConversionBatcher(cache_size)
+        self.latencies = LatencyRecorder()
+
+
+class ConversionClient:
+    """
+    Client for the conversion service.
+
+    Scenarios are converted by passing the graph they belong to; the graph is
+    only sent to the service again if its location is no longer cached there.
+    """
+
+    def __init__(self, url: str = "http://127.0.0.1:8765"):
+        self.url = url.rstrip("/")
+
+    def _post(self, endpoint: str, payload: bytes, params: dict):
+        params = {name: value for name, value in params.items() if value is not None}
+        request = urllib.request.Request(
+            f"{self.url}/{endpoint}?{urllib.parse.urlencode(params)}",
+            data=payload,
+            headers={"Content-Type": PROTOBUF_CONTENT_TYPE},
+        )
+        with urllib.request.urlopen(request) as response:
+            return response.read(), response.headers
+
+    def location(self, graph: Graph, length: int = 100) -> Location:
+        body, _ = self._post("location", graph.SerializeToString(), {"length": length})
+        location = Location()
+        location.ParseFromString(body)
+        return location
+
+    def scenario(
+        self,
+        mapf_scenario: MAPFScenario,
+        graph: Graph,
+        length: int = 100,
+        train_length: int = 100,
+        n_carriages: int = 1,
+        time_between_trains: int = 100,
+        total_time: int | None = None,
+    ) -> Scenario:
+        params = {
+            "graph": graph_fingerprint(graph),
+            "length": length,
+            "train_length": train_length,
+            "n_carriages": n_carriages,
+            "time_between_trains": time_between_trains,
+            "total_time": total_time,
+        }
+        try:
+            body, _ = self._post("scenario", mapf_scenario.SerializeToString(), params)
+        except urllib.error.HTTPError as e:
+            if e.code != HTTPStatus.NOT_FOUND:
+                raise
+            # The location is not cached (anymore); convert it first
+            self.location(graph, length)
+            body, _ = self._post("scenario", mapf_scenario.SerializeToString(), params)
+        scenario = Scenario()
+        scenario.ParseFromString(body)
+        return scenario
+
+
+def main():
+    """
+    Serves location and scenario conversions on localhost.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Serves conversions of MAPF graphs and scenarios to TORS "
+        "locations and scenarios over HTTP."
+    )
+    parser.add_argument("--host", help="The address to bind to.", default="127.0.0.1")
+    parser.add_argument("--port", help="The port to listen on.", default=8765, type=int)
+    parser.add_argument(
+        "--cache-size", help="Number of locations to keep.", default=256, type=int
+    )
+    args = parser.parse_args()
+
+    # Suppress the per-conversion logging of the location conversion
+    logging.getLogger("protobuf_to_tors_location").setLevel(logging.WARNING)
+
+    server = ConversionServer((args.host, args.port), args.cache_size)
+    logger.info(f"Serving conversions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
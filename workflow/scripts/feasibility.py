@@ -0,0 +1,216 @@
+"""
+Cheap checks that a converted scenario can be solved on its location at all.
+
+Catches instances that would otherwise only fail after a long simulation in
+cTORS: more train length than parking space, gate trains without a bumper to
+enter from, more trains standing on a track than fit on it, and
+arrival/departure times that cannot work out. All checks are array operations
+over the track parts and trains, done in one pass.
+"""
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from protos.Location_pb2 import Location, TrackPartType
+from protos.Scenario_pb2 import Scenario
+
+
+@dataclass
+class FeasibilityReport:
+    problems: list[str] = field(default_factory=list)
+    # Numbers the checks are based on, for tagging instances
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def feasible(self) -> bool:
+        return len(self.problems) == 0
+
+    def to_json(self) -> str:
+        return json.dumps({"feasible": self.feasible, **asdict(self)}, indent=2)
+
+
+def check_feasibility(location: Location, scenario: Scenario) -> FeasibilityReport:
+    """
+    Checks the scenario against its location and returns the problems found.
+    """
+    report = FeasibilityReport()
+
+    # Track part arrays
+    track_ids = np.array([track.id for track in location.trackParts], dtype=np.int64)
+    track_types = np.array(
+        [track.type for track in location.trackParts], dtype=np.int64
+    )
+    track_lengths = np.array([track.length for track in location.trackParts])
+    parking = np.array(
+        [track.parkingAllowed for track in location.trackParts], dtype=bool
+    )
+    parking &= track_types == TrackPartType.RailRoad
+    id_order = np.argsort(track_ids)
+    sorted_ids = track_ids[id_order]
+
+    def track_index(ids: np.ndarray) -> np.ndarray:
+        """Index of each id in the location, -1 for unknown ids."""
+        if len(sorted_ids) == 0:
+            return np.full(len(ids), -1)
+        positions = np.clip(np.searchsorted(sorted_ids, ids), 0, len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == ids, id_order[positions], -1)
+
+    # Connections as (track index, neighbour id) keys
+    n_neighbors = [len(track.aSide) + len(track.bSide) for track in location.trackParts]
+    neighbor_ids = np.array(
+        [
+            neighbor
+            for track in location.trackParts
+            for neighbor in (*track.aSide, *track.bSide)
+        ],
+        dtype=np.int64,
+    )
+    key_base = int(track_ids.max(initial=0)) + 1
+    connection_keys = np.sort(
+        np.repeat(np.arange(len(track_ids)), n_neighbors) * key_base + neighbor_ids
+    )
+
+    # Train arrays, in the order in, inStanding, out, outStanding
+    unit_lengths = {
+        unit_type.displayName: unit_type.length for unit_type in scenario.trainUnitTypes
+    }
+    groups = ["in", "inStanding", "out", "outStanding"]
+    trains = [(group, train) for group in groups for train in getattr(scenario, group)]
+    group = np.array([groups.index(name) for name, _ in trains], dtype=np.int64)
+    times = np.array([train.time for _, train in trains], dtype=np.int64)
+    parking_tracks = track_index(
+        np.array([train.parkingTrackPart for _, train in trains], dtype=np.int64)
+    )
+    side_tracks = track_index(
+        np.array([train.sideTrackPart for _, train in trains], dtype=np.int64)
+    )
+    unknown_types = sorted(
+        {
+            member.typeDisplayName
+            for _, train in trains
+            for member in train.members
+            if member.typeDisplayName not in unit_lengths
+        }
+    )
+    train_lengths = np.array(
+        [
+            sum(unit_lengths.get(member.typeDisplayName, 0) for member in train.members)
+            for _, train in trains
+        ]
+    )
+    incoming = group <= 1
+    at_gate = (group == 0) | (group == 2)
+    standing = ~at_gate
+
+    capacity = float(track_lengths[parking].sum())
+    longest_parking_track = float(track_lengths[parking].max(initial=0))
+    report.stats.update(
+        track_parts=len(track_ids),
+        parking_capacity=capacity,
+        longest_parking_track=longest_parking_track,
+        incoming_trains=int(incoming.sum()),
+        outgoing_trains=int((~incoming).sum()),
+        total_incoming_length=float(train_lengths[incoming].sum()),
+    )
+
+    # References
+    if unknown_types:
+        report.problems.append(f"Unknown train unit types: {unknown_types}")
+    unknown_tracks = (parking_tracks < 0) | (side_tracks < 0)
+    if unknown_tracks.any():
+        report.problems.append(
+            f"{int(unknown_tracks.sum())} trains refer to unknown track parts"
+        )
+    known = ~unknown_tracks
+
+    # Capacity: the most train length that is in the yard at the same time must
+    # fit on the parking tracks. Trains arrive before others depart at equal times.
+    order = np.lexsort((~incoming, times))
+    in_yard = np.cumsum(np.where(incoming, train_lengths, -train_lengths)[order])
+    peak_length = float(in_yard.max(initial=0))
+    report.stats["peak_length_in_yard"] = peak_length
+    if peak_length > capacity:
+        report.problems.append(
+            f"Up to {peak_length:g} train length is in the yard at once, but there "
+            f"is only {capacity:g} parking capacity"
+        )
+    too_long = train_lengths > longest_parking_track
+    if too_long.any():
+        report.problems.append(
+            f"{int(too_long.sum())} trains are longer than the longest parking track "
+            f"({longest_parking_track:g})"
+        )
+
+    # Gates: trains entering or leaving through a gate must stand on the gate next
+    # to its bumper
+    gate_trains = at_gate & known
+    side_is_bumper = np.zeros(len(trains), dtype=bool)
+    side_is_bumper[gate_trains] = (
+        track_types[side_tracks[gate_trains]] == TrackPartType.Bumper
+    )
+    if (gate_trains & ~side_is_bumper).any():
+        report.problems.append(
+            f"{int((gate_trains & ~side_is_bumper).sum())} gate trains do not have a "
+            "bumper as side track part"
+        )
+    if at_gate.any() and not (track_types == TrackPartType.Bumper).any():
+        report.problems.append("The location has gate trains but no bumpers")
+    train_keys = parking_tracks[known] * key_base + track_ids[side_tracks[known]]
+    not_adjacent = ~np.isin(train_keys, connection_keys)
+    if not_adjacent.any():
+        report.problems.append(
+            f"{int(not_adjacent.sum())} trains have a side track part that is not "
+            "connected to their parking track part"
+        )
+
+    # Standing trains: the trains standing on a track at the start or at the end
+    # must fit on it together
+    for group_index, name in [(1, "instanding"), (3, "outstanding")]:
+        standing_trains = (group == group_index) & known
+        unique_tracks, track_of_train = np.unique(
+            parking_tracks[standing_trains], return_inverse=True
+        )
+        standing_length = np.bincount(
+            track_of_train,
+            weights=train_lengths[standing_trains],
+            minlength=len(unique_tracks),
+        )
+        overfull = unique_tracks[standing_length > track_lengths[unique_tracks]]
+        if len(overfull) > 0:
+            names = [location.trackParts[int(i)].name for i in overfull]
+            report.problems.append(f"The {name} trains do not fit on tracks {names}")
+    on_bumper = standing & known
+    on_bumper[on_bumper] = (
+        track_types[parking_tracks[on_bumper]] == TrackPartType.Bumper
+    )
+    if on_bumper.any():
+        report.problems.append(
+            f"{int(on_bumper.sum())} standing trains are parked on a bumper"
+        )
+
+    # Time windows
+    outside = (times < scenario.startTime) | (times > scenario.endTime)
+    if outside.any():
+        report.problems.append(
+            f"{int(outside.sum())} trains arrive or depart outside "
+            f"[{scenario.startTime}, {scenario.endTime}]"
+        )
+    # Gate trains through the same track need different times
+    gate_moves = np.stack([parking_tracks[at_gate], times[at_gate]], axis=1)
+    if len(gate_moves) > len(np.unique(gate_moves, axis=0)):
+        report.problems.append("Several gate trains use the same gate at the same time")
+    # At no time can more trains have left than have arrived
+    in_yard_count = np.cumsum(np.where(incoming, 1, -1)[order])
+    if in_yard_count.min(initial=0) < 0:
+        report.problems.append("Trains depart before enough trains have arrived")
+
+    return report
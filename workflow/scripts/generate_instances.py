@@ -0,0 +1,128 @@
+"""
+Generates the instances of part of the experiment grid in settings.ini.
+
+The instance generator reads settings.ini from its working directory and writes
+each experiment (a section of settings.ini) to quasi_real_instances/exp/<section>.
+To generate experiments in independent jobs, each job runs the generator in a
+scratch directory that links to the generator's files but has a settings.ini with
+only its own experiments, and then moves the generated experiment directories
+into the shared tree. Jobs therefore write disjoint subtrees, and an experiment
+directory only appears once it is complete.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+GENERATOR = Path("Shuntyard-Instance-Generator")
+SETTINGS = "settings.ini"
+# Relative to the generator directory
+OUTPUT = Path("quasi_real_instances/exp")
+SCRATCH_PREFIX = ".generate-"
+
+
+def read_settings(settings_path: Path) -> ConfigParser:
+    settings = ConfigParser(interpolation=None)
+    # Keep the case of the keys
+    settings.optionxform = str
+    with open(settings_path, "r") as settings_file:
+        settings.read_file(settings_file)
+    return settings
+
+
+def experiments(settings_path: Path) -> list[str]:
+    """
+    Returns the experiments in a settings.ini file, in file order.
+    """
+    return read_settings(settings_path).sections()
+
+
+def write_settings(settings_path: Path, experiments: list[str], output_path: Path):
+    """
+    Writes a copy of a settings.ini file with only the given experiments, and the
+    defaults they share.
+    """
+    settings = read_settings(settings_path)
+    for section in settings.sections():
+        if section not in experiments:
+            settings.remove_section(section)
+    with open(output_path, "w") as settings_file:
+        settings.write(settings_file)
+
+
+def generate(generator: Path, experiments_to_generate: list[str]):
+    """
+    Runs the generator for the given experiments, replacing their directories in
+    the generator's output.
+    """
+    unknown = set(experiments_to_generate) - set(experiments(generator / SETTINGS))
+    if unknown:
+        raise ValueError(f"Experiments not in {SETTINGS}: {sorted(unknown)}")
+    output = generator / OUTPUT
+    output.mkdir(parents=True, exist_ok=True)
+
+    # Inside the generator directory, so that the results can be moved by renaming
+    with tempfile.TemporaryDirectory(prefix=SCRATCH_PREFIX, dir=generator) as scratch:
+        scratch = Path(scratch)
+        for entry in generator.iterdir():
+            if entry.name in (SETTINGS, OUTPUT.parts[0]) or entry.name.startswith(
+                SCRATCH_PREFIX
+            ):
+                continue
+            (scratch / entry.name).symlink_to(entry.resolve())
+        write_settings(
+            generator / SETTINGS, experiments_to_generate, scratch / SETTINGS
+        )
+
+        logger.info(f"Generating {', '.join(experiments_to_generate)}")
+        subprocess.run([sys.executable, "main.py"], cwd=scratch, check=True)
+
+        for experiment in experiments_to_generate:
+            generated = scratch / OUTPUT / experiment
+            if not generated.is_dir():
+                raise RuntimeError(f"The generator did not write {generated}")
+            target = output / experiment
+            if target.exists():
+                shutil.rmtree(target)
+            os.replace(generated, target)
+
+
+def main():
+    """
+    Script to generate some of the experiments in settings.ini.
+
+    Example of generating experiments 1a and 2a:
+
+        python workflow/scripts/generate_instances.py 1a 2a
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Generates the instances of some of the experiments in "
+        "settings.ini."
+    )
+    parser.add_argument(
+        "experiments",
+        help="The experiments (sections of settings.ini) to generate, by default all.",
+        nargs="*",
+    )
+    parser.add_argument(
+        "--generator",
+        help="The instance generator directory.",
+        default=GENERATOR,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    generate(args.generator, args.experiments or experiments(args.generator / SETTINGS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Mapping between the nodes of a MAPF graph and the track parts of its TORS location.
+
+The location conversion does not keep the nodes one to one: extra gates are
+removed, nodes of degree > 3 are split into the parts "<name>.<i>", end tracks
+"end-<name>" and bumpers "bumper-<name>" are added, and compression merges chains
+of track parts. The mapping is built once per conversion, when the names still
+tell where every track part comes from, and is written next to the location as
+<location>.ids.npz. Plans and results can then be translated in bulk with array
+lookups instead of parsing track names again.
+
+The mapping is a table of (track part, MAPF node, origin) pairs, sorted by track
+part and indexed from both sides in compressed sparse row form.
+"""
+import sys
+from dataclasses import dataclass, fields
+from enum import IntEnum
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from location_arrays import memmap_npz
+from location_compression import TrackPartMapping
+from protos.graph_pb2 import Graph
+from protos.Location_pb2 import Location
+
+
+class Origin(IntEnum):
+    # The track part is the MAPF node
+    NODE = 0
+    # The track part is one of the parts a node of degree > 3 is split into
+    SPLIT = 1
+    # The track part is the end track added after the node
+    END = 2
+    # The track part is the bumper added after the node
+    BUMPER = 3
+
+
+def id_mapping_path(location_path: Path) -> Path:
+    """
+    Returns the path of the id mapping of a location.
+    """
+    return location_path.with_name(location_path.name + ".ids.npz")
+
+
+def _resolve(name: str, mapf_nodes: set[str]) -> tuple[str, Origin]:
+    """
+    Returns the MAPF node a track part name is derived from, and how.
+    """
+    if name in mapf_nodes:
+        return name, Origin.NODE
+    for prefix, origin in [("bumper-", Origin.BUMPER), ("end-", Origin.END)]:
+        if name.startswith(prefix):
+            # The bumper of an end track or split part belongs to the same node
+            node, _ = _resolve(name.removeprefix(prefix), mapf_nodes)
+            return node, origin
+    node, dot, split = name.rpartition(".")
+    if dot and split.isdigit() and node in mapf_nodes:
+        return node, Origin.SPLIT
+    raise ValueError(f"Track part {name} does not derive from a node of the graph")
+
+
+def _lookup(keys: np.ndarray, order: np.ndarray, values) -> np.ndarray:
+    """
+    Returns the indices of values in keys, given the order that sorts keys, and
+    -1 for values that are not in keys.
+    """
+    values = np.asarray(values)
+    if keys.dtype.kind in "iu":
+        values = values.astype(keys.dtype)
+    if len(keys) == 0:
+        return np.full(values.shape, -1, dtype=np.int64)
+    positions = np.searchsorted(keys, values, sorter=order)
+    indices = order[np.minimum(positions, len(keys) - 1)]
+    return np.where(keys[indices] == values, indices, -1)
+
+
+@dataclass
+class IdMapping:
+    # Per MAPF node, in graph order
+    mapf_names: np.ndarray
+    # Per track part, in location order
+    tors_ids: np.ndarray
+    tors_names: np.ndarray
+    # Per pair, sorted by track part and then along the track
+    tors: np.ndarray
+    mapf: np.ndarray
+    origin: np.ndarray
+    # The pairs of track part i are tors_indptr[i]:tors_indptr[i + 1]
+    tors_indptr: np.ndarray
+    # The pairs of MAPF node j are mapf_order[mapf_indptr[j]:mapf_indptr[j + 1]],
+    # the track parts that are the node first
+    mapf_order: np.ndarray
+    mapf_indptr: np.ndarray
+
+    @classmethod
+    def build(
+        cls,
+        mapf_graph: Graph,
+        location: Location,
+        track_mapping: TrackPartMapping | None = None,
+    ) -> "IdMapping":
+        """
+        Builds the mapping of a location converted from mapf_graph, through the
+        track mapping if the location is compressed.
+        """
+        mapf_names = [node.id for node in mapf_graph.nodes]
+        mapf_index = {name: i for i, name in enumerate(mapf_names)}
+        mapf_nodes = set(mapf_names)
+        tors, mapf, origin = [], [], []
+        counts = np.zeros(len(location.trackParts) + 1, dtype=np.int64)
+        for i, track_part in enumerate(location.trackParts):
+            if track_mapping is None:
+                original_names = [track_part.name]
+            else:
+                original_names = track_mapping.original_names[track_part.id]
+            for original_name in original_names:
+                node, node_origin = _resolve(original_name, mapf_nodes)
+                tors.append(i)
+                mapf.append(mapf_index[node])
+                origin.append(node_origin)
+            counts[i + 1] = len(original_names)
+
+        tors = np.array(tors, dtype=np.int64)
+        mapf = np.array(mapf, dtype=np.int64)
+        origin = np.array(origin, dtype=np.int8)
+        mapf_order = np.lexsort((tors, origin, mapf))
+        return cls(
+            mapf_names=np.array(mapf_names, dtype=str),
+            tors_ids=np.array(
+                [track_part.id for track_part in location.trackParts], dtype=np.int64
+            ),
+            tors_names=np.array(
+                [track_part.name for track_part in location.trackParts], dtype=str
+            ),
+            tors=tors,
+            mapf=mapf,
+            origin=origin,
+            tors_indptr=np.cumsum(counts),
+            mapf_order=mapf_order,
+            mapf_indptr=np.searchsorted(
+                mapf[mapf_order], np.arange(len(mapf_names) + 1)
+            ),
+        )
+
+    def save(self, path: Path):
+        """
+        Saves the mapping as an uncompressed .npz file.
+        """
+        np.savez(
+            path, **{field.name: getattr(self, field.name) for field in fields(self)}
+        )
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "IdMapping":
+        """
+        Loads a saved mapping, memory-mapped read-only unless mmap is False.
+        """
+        if mmap:
+            return cls(**memmap_npz(path))
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    @cached_property
+    def _tors_id_order(self) -> np.ndarray:
+        return np.argsort(self.tors_ids, kind="stable")
+
+    @cached_property
+    def _mapf_name_order(self) -> np.ndarray:
+        return np.argsort(self.mapf_names, kind="stable")
+
+    def tors_index(self, tors_ids) -> np.ndarray:
+        """
+        Returns the positions of track part ids in the location, -1 for unknown ids.
+        """
+        return _lookup(self.tors_ids, self._tors_id_order, tors_ids)
+
+    def mapf_index(self, mapf_names) -> np.ndarray:
+        """
+        Returns the indices of MAPF node names, -1 for unknown names.
+        """
+        return _lookup(self.mapf_names, self._mapf_name_order, mapf_names)
+
+    def to_mapf(self, tors_ids) -> np.ndarray:
+        """
+        Returns the index of the MAPF node of every track part id, -1 for unknown
+        ids. A compressed track part maps to the first node it replaces.
+        """
+        positions = self.tors_index(tors_ids)
+        first = self.mapf[np.minimum(self.tors_indptr[positions], len(self.mapf) - 1)]
+        return np.where(positions >= 0, first, -1)
+
+    def to_tors(self, mapf_nodes) -> np.ndarray:
+        """
+        Returns the id of the track part of every MAPF node, given by index or by
+        name, and -1 for unknown nodes and removed gates. A split node maps to its
+        first part.
+        """
+        mapf_nodes = np.asarray(mapf_nodes)
+        if mapf_nodes.dtype.kind in "USO":
+            mapf_nodes = self.mapf_index(mapf_nodes)
+        known = (mapf_nodes >= 0) & (mapf_nodes < len(self.mapf_names))
+        nodes = np.where(known, mapf_nodes, 0)
+        starts = self.mapf_indptr[nodes]
+        known &= self.mapf_indptr[nodes + 1] > starts
+        pairs = self.mapf_order[np.minimum(starts, len(self.mapf_order) - 1)]
+        return np.where(known, self.tors_ids[self.tors[pairs]], -1)
+
+    def names_of(self, mapf_nodes) -> np.ndarray:
+        """
+        Returns the names of MAPF node indices, "" for -1.
+        """
+        mapf_nodes = np.asarray(mapf_nodes)
+        return np.where(mapf_nodes >= 0, self.mapf_names[np.maximum(mapf_nodes, 0)], "")
+
+    def mapf_nodes_of(self, tors_id: int) -> list[tuple[str, Origin]]:
+        """
+        Returns the MAPF nodes of a track part and how it derives from them, in
+        order along the track.
+        """
+        (position,) = self.tors_index([tors_id])
+        if position < 0:
+            raise KeyError(tors_id)
+        pairs = range(self.tors_indptr[position], self.tors_indptr[position + 1])
+        return [
+            (str(self.mapf_names[self.mapf[pair]]), Origin(self.origin[pair]))
+            for pair in pairs
+        ]
+
+    def tors_parts_of(self, mapf_name: str) -> list[tuple[int, Origin]]:
+        """
+        Returns the track parts of a MAPF node and how they derive from it, the
+        track parts that are the node first.
+        """
+        (node,) = self.mapf_index([mapf_name])
+        if node < 0:
+            raise KeyError(mapf_name)
+        pairs = self.mapf_order[self.mapf_indptr[node] : self.mapf_indptr[node + 1]]
+        return [
+            (int(self.tors_ids[self.tors[pair]]), Origin(self.origin[pair]))
+            for pair in pairs
+        ]
@@ -0,0 +1,315 @@
+"""
+SQLite catalog of converted instances.
+
+The converters record statistics of every location and scenario they write, so
+that instances can be selected with a query instead of by globbing the instance
+tree and opening every json file. The catalog is updated in place: converting an
+instance again replaces its row. The index command adds rows for the generated
+instances that have not been converted yet, so the workflow can take its targets
+from the catalog.
+
+Example of selecting the scenarios with at least 20 incoming trains on layouts
+with more than 2 gates:
+
+    python workflow/scripts/instance_catalog.py query --kind scenario \\
+        --location "gates > 2" "incoming >= 20"
+"""
+import logging
+import sqlite3
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+from track_names import TrackNames
+
+logger = logging.getLogger(__name__)
+
+CATALOG = Path("tors_instances/catalog.sqlite")
+
+# Statistics columns, all integers and NULL until the instance is converted
+LOCATION_COLUMNS = ["track_parts", "switches", "bumpers", "gates", "splits"]
+SCENARIO_COLUMNS = [
+    "incoming",
+    "outgoing",
+    "standing",
+    "types",
+    "first_arrival",
+    "last_arrival",
+    "first_departure",
+    "last_departure",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS instances (
+    -- The converted json file
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('location', 'scenario')),
+    -- The generated file it is converted from
+    source TEXT,
+    -- The location json of a scenario
+    location TEXT,
+    {", ".join(f"{column} INTEGER" for column in LOCATION_COLUMNS + SCENARIO_COLUMNS)},
+    converted_at REAL
+);
+CREATE INDEX IF NOT EXISTS instances_kind ON instances (kind);
+"""
+
+
+def connect(catalog_path: Path) -> sqlite3.Connection:
+    """
+    Opens the catalog, creating it if needed.
+
+    Uses write-ahead logging and waits for locks, so several converters can update
+    the catalog at the same time.
+    """
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(catalog_path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def location_stats(location) -> dict:
+    from protos.Location_pb2 import TrackPartType
+
+    types = np.array([track_part.type for track_part in location.trackParts])
+    names = TrackNames.parse(track_part.name for track_part in location.trackParts)
+    return {
+        "track_parts": len(types),
+        "switches": int((types == TrackPartType.Switch).sum()),
+        "bumpers": int((types == TrackPartType.Bumper).sum()),
+        "gates": len(np.unique(names.gate[names.is_gate])),
+        "splits": int((names.split >= 0).sum()),
+    }
+
+
+def scenario_stats(scenario) -> dict:
+    arrivals = [train.time for train in getattr(scenario, "in")]
+    departures = [train.time for train in scenario.out]
+    return {
+        "incoming": len(arrivals) + len(scenario.inStanding),
+        "outgoing": len(departures) + len(scenario.outStanding),
+        "standing": len(scenario.inStanding) + len(scenario.outStanding),
+        "types": len({unit_type.displayName for unit_type in scenario.trainUnitTypes}),
+        "first_arrival": min(arrivals, default=None),
+        "last_arrival": max(arrivals, default=None),
+        "first_departure": min(departures, default=None),
+        "last_departure": max(departures, default=None),
+    }
+
+
+def _upsert(
+    connection: sqlite3.Connection,
+    path: Path,
+    kind: str,
+    source: Path | None,
+    location: Path | None,
+    stats: dict,
+):
+    values = {
+        "path": str(path),
+        "kind": kind,
+        "source": None if source is None else str(source),
+        "location": None if location is None else str(location),
+        **stats,
+        "converted_at": time.time() if stats else None,
+    }
+    columns = ", ".join(values)
+    placeholders = ", ".join(f":{column}" for column in values)
+    # Keep what is already known when a value is not given
+    updates = ", ".join(
+        f"{column} = COALESCE(excluded.{column}, instances.{column})"
+        for column in values
+        if column != "path"
+    )
+    connection.execute(
+        f"INSERT INTO instances ({columns}) VALUES ({placeholders}) "
+        f"ON CONFLICT (path) DO UPDATE SET {updates}",
+        values,
+    )
+
+
+def record_location(
+    catalog_path: Path, path: Path, location, source: Path | None = None
+):
+    connection = connect(catalog_path)
+    try:
+        with connection:
+            _upsert(
+                connection, path, "location", source, None, location_stats(location)
+            )
+    finally:
+        connection.close()
+
+
+def record_scenario(
+    catalog_path: Path,
+    path: Path,
+    scenario,
+    location_path: Path | None = None,
+    source: Path | None = None,
+):
+    connection = connect(catalog_path)
+    try:
+        with connection:
+            _upsert(
+                connection,
+                path,
+                "scenario",
+                source,
+                location_path,
+                scenario_stats(scenario),
+            )
+    finally:
+        connection.close()
+
+
+def index_sources(catalog_path: Path, instances_root: Path, output_root: Path) -> int:
+    """
+    Adds the generated instances under instances_root to the catalog, with the
+    paths they are converted to. Returns the number of instances.
+    """
+    from instance_conversion import (
+        location_output_path,
+        scenario_graph_path,
+        scenario_output_path,
+    )
+
+    rows = []
+    for path in sorted(instances_root.rglob("*")):
+        if path.suffix == ".graph":
+            output = location_output_path(path, instances_root, output_root)
+            rows.append((output, "location", path, None))
+        elif path.suffix == ".scen":
+            output = scenario_output_path(path, instances_root, output_root)
+            location = location_output_path(
+                scenario_graph_path(path), instances_root, output_root
+            )
+            rows.append((output, "scenario", path, location))
+
+    connection = connect(catalog_path)
+    try:
+        with connection:
+            for output, kind, source, location in rows:
+                _upsert(connection, output, kind, source, location, {})
+    finally:
+        connection.close()
+    return len(rows)
+
+
+def query(
+    catalog_path: Path,
+    where: str = "",
+    kind: str | None = None,
+    location_where: str = "",
+) -> list[str]:
+    """
+    Returns the paths of the instances that match an SQL condition on the columns
+    of the instances table, ordered by path. location_where is a condition on the
+    columns of the locations: it selects locations, and scenarios by the location
+    they are on.
+
+    Raises a ValueError if nothing matches a condition and none of the instances
+    it applies to have statistics yet, as these are only recorded on conversion.
+    """
+    conditions = [f"({where})"] if where else []
+    parameters = []
+    if kind is not None:
+        conditions.append("kind = ?")
+        parameters.append(kind)
+    if location_where:
+        conditions.append(
+            "(CASE kind WHEN 'location' THEN path ELSE location END) IN ("
+            f"SELECT path FROM instances WHERE kind = 'location' AND ({location_where}))"
+        )
+    sql = "SELECT path FROM instances"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    connection = connect(catalog_path)
+    try:
+        paths = [
+            row[0] for row in connection.execute(sql + " ORDER BY path", parameters)
+        ]
+        if not paths:
+            for condition, condition_kind in [
+                (where, kind),
+                (location_where, "location"),
+            ]:
+                if condition and not _has_statistics(connection, condition_kind):
+                    raise ValueError(
+                        f"No {condition_kind or 'instance'} in {catalog_path} has "
+                        f"statistics to match {condition!r} against, convert the "
+                        "instances with the catalog first"
+                    )
+        return paths
+    finally:
+        connection.close()
+
+
+def _has_statistics(connection: sqlite3.Connection, kind: str | None) -> bool:
+    sql = "SELECT 1 FROM instances WHERE converted_at IS NOT NULL"
+    parameters = []
+    if kind is not None:
+        sql += " AND kind = ?"
+        parameters.append(kind)
+    return connection.execute(sql + " LIMIT 1", parameters).fetchone() is not None
+
+
+def main():
+    from instance_conversion import GENERATOR_INSTANCES, TORS_INSTANCES
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(description="Builds and queries the instance catalog.")
+    parser.add_argument(
+        "--catalog", help="The catalog database.", default=CATALOG, type=Path
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = commands.add_parser(
+        "index", help="Adds the generated instances to the catalog."
+    )
+    index_parser.add_argument(
+        "--instances",
+        help="The directory the instance generator writes to.",
+        default=GENERATOR_INSTANCES,
+        type=Path,
+    )
+    index_parser.add_argument(
+        "--output",
+        help="The directory the TORS instances are written to.",
+        default=TORS_INSTANCES,
+        type=Path,
+    )
+
+    query_parser = commands.add_parser(
+        "query", help="Prints the paths of the instances that match a condition."
+    )
+    query_parser.add_argument(
+        "where",
+        help="An SQL condition on the columns of the instances table.",
+        nargs="?",
+        default="",
+    )
+    query_parser.add_argument(
+        "--kind", help="Only instances of this kind.", choices=["location", "scenario"]
+    )
+    query_parser.add_argument(
+        "--location",
+        help="An SQL condition on the columns of the locations, that selects "
+        "locations and the scenarios on them.",
+        default="",
+    )
+    args = parser.parse_args()
+
+    if args.command == "index":
+        n_instances = index_sources(args.catalog, args.instances, args.output)
+        logger.info(f"Indexed {n_instances} instances in {args.catalog}")
+    else:
+        for path in query(args.catalog, args.where, args.kind, args.location):
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
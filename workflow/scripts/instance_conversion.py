@@ -0,0 +1,215 @@
+"""
+Converts generated instances (.graph and .scen files) directly to TORS json files.
+
+Shared by the long-running conversion tools, which keep converted locations in
+memory so that scenarios can be converted without converting or parsing their
+location again.
+"""
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TextIO
+
+from google.protobuf.json_format import MessageToJson
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from mapf_to_protobuf_graph import read_graph
+from mapf_to_protobuf_scenario import read_scenario
+from protobuf_to_tors_location import graph_to_location, write_location_json
+from protobuf_to_tors_scenario import (
+    LocationIndex,
+    build_tors_scenario,
+    create_train_unit_types,
+    prepare_scenario,
+    resolve_total_time,
+)
+from protos.graph_pb2 import Graph
+from protos.Location_pb2 import Location
+from protos.scenario_mapf_pb2 import Scenario as MAPFScenario
+from protos.Scenario_pb2 import Scenario
+
+# The same paths as used in the Snakefile
+GENERATOR_INSTANCES = Path("Shuntyard-Instance-Generator/quasi_real_instances/exp")
+TORS_INSTANCES = Path("tors_instances")
+
+
+@dataclass(frozen=True)
+class ConversionSettings:
+    # The length of the track parts
+    track_length: int = 100
+    # The length of the trains (per carriage)
+    train_length: int = 100
+    n_carriages: int = 1
+    time_between_trains: int = 100
+    # Estimated from the number of trains if not set
+    total_time: int | None = None
+
+
+@dataclass
+class CachedLocation:
+    location: Location
+    index: LocationIndex
+
+
+class LocationCache:
+    """
+    Least recently used cache of converted locations and their index.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._locations: OrderedDict[Hashable, CachedLocation] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._locations
+
+    def get(self, key: Hashable) -> CachedLocation | None:
+        cached = self._locations.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._locations.move_to_end(key)
+        return cached
+
+    def put(self, key: Hashable, location: Location) -> CachedLocation:
+        cached = CachedLocation(location, LocationIndex.from_location(location))
+        self._locations[key] = cached
+        self._locations.move_to_end(key)
+        while len(self._locations) > self.maxsize:
+            self._locations.popitem(last=False)
+        return cached
+
+    def get_or_convert(
+        self, key: Hashable, convert: Callable[[], Location]
+    ) -> CachedLocation:
+        cached = self.get(key)
+        if cached is None:
+            cached = self.put(key, convert())
+        return cached
+
+
+def location_output_path(
+    graph_path: Path, instances_root: Path, output_root: Path
+) -> Path:
+    """
+    Returns the location json path for a .graph file.
+
+    {instances_root}/{exp}/{layout}/{graph_name}.graph is converted to
+    {output_root}/{exp}/{graph_name}_location.json.
+    """
+    experiment = graph_path.relative_to(instances_root).parts[0]
+    return output_root / experiment / f"{graph_path.stem}_location.json"
+
+
+def scenario_output_path(
+    scenario_path: Path, instances_root: Path, output_root: Path
+) -> Path:
+    """
+    Returns the scenario json path for a .scen file.
+
+    {instances_root}/{exp}/{layout}/{scenario_name}.scen is converted to
+    {output_root}/{exp}/{layout}/{scenario_name}_scenario.json.
+    """
+    relative = scenario_path.relative_to(instances_root)
+    return output_root / relative.parent / f"{scenario_path.stem}_scenario.json"
+
+
+def scenario_graph_path(scenario_path: Path) -> Path:
+    """
+    Returns the path of the .graph file a .scen file refers to.
+
+    The .scen file must be in the same directory as the .graph file.
+    """
+    with open(scenario_path, "r") as scenario_file:
+        scenario_file.readline()
+        graph_filename = scenario_file.readline().strip()
+    return scenario_path.parent / graph_filename
+
+
+def write_atomically(path: Path, write: Callable[[TextIO], None]):
+    """
+    Writes a file through a temporary file in the same directory, so readers never
+    see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as temporary_file:
+            write(temporary_file)
+        # mkstemp creates files that only the owner can read
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def read_graph_file(graph_path: Path) -> Graph:
+    with open(graph_path, "r") as graph_file:
+        return read_graph(graph_file)
+
+
+def convert_graph_file(graph_path: Path, settings: ConversionSettings) -> Location:
+    """
+    Reads a .graph file and converts it to a TORS location.
+    """
+    return graph_to_location(read_graph_file(graph_path), length=settings.track_length)
+
+
+def read_scenario_file(scenario_path: Path) -> MAPFScenario:
+    with open(scenario_path, "r") as scenario_file:
+        return read_scenario(scenario_file)
+
+
+def convert_scenario(
+    mapf_scenario: MAPFScenario,
+    cached_location: CachedLocation,
+    settings: ConversionSettings,
+) -> Scenario:
+    """
+    Converts a MAPF scenario to a TORS scenario on an already indexed location.
+    """
+    total_time = resolve_total_time(
+        len(mapf_scenario.incoming_agents),
+        settings.time_between_trains,
+        settings.total_time,
+    )
+    prepared = prepare_scenario(mapf_scenario, cached_location.index)
+    return build_tors_scenario(
+        prepared,
+        create_train_unit_types(
+            mapf_scenario, settings.n_carriages, settings.train_length
+        ),
+        settings.time_between_trains,
+        total_time,
+    )
+
+
+def write_location(location: Location, path: Path):
+    write_atomically(
+        path, lambda location_file: write_location_json(location, location_file)
+    )
+
+
+def write_scenario(scenario: Scenario, path: Path):
+    write_atomically(
+        path,
+        lambda scenario_file: scenario_file.write(
+            MessageToJson(scenario, including_default_value_fields=True)
+        ),
+    )
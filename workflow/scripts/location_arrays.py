@@ -0,0 +1,187 @@
+"""
+Array form of a TORS location.
+
+Track parts are numbered by their index in location.trackParts, and the aSide and
+bSide connections are stored in compressed sparse row (CSR) form: the neighbours
+of track part i on its a side are a_indices[a_indptr[i]:a_indptr[i + 1]]. This
+makes graph computations over a location array operations instead of loops over
+protobuf messages.
+
+The arrays can be saved as an uncompressed .npz file, whose arrays are
+memory-mapped when loaded, so that datasets of many locations can be built
+without parsing json or looping over track parts in Python.
+"""
+import struct
+import sys
+import zipfile
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+import numpy as np
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from protos.Location_pb2 import Location
+
+
+def _csr(neighbor_ids: list[list[int]], index_of: dict[int, int]):
+    """
+    Builds a CSR structure from neighbour ids per track part, skipping ids that
+    are not in the location.
+    """
+    counts = np.zeros(len(neighbor_ids) + 1, dtype=np.int64)
+    indices = []
+    for i, ids in enumerate(neighbor_ids):
+        known = [index_of[neighbor] for neighbor in ids if neighbor in index_of]
+        counts[i + 1] = len(known)
+        indices.extend(known)
+    return np.cumsum(counts), np.array(indices, dtype=np.int64)
+
+
+def memmap_npz(path: Path) -> dict[str, np.ndarray]:
+    """
+    Memory-maps the arrays of an uncompressed .npz file read-only.
+
+    np.load ignores mmap_mode for .npz files, but the arrays of an uncompressed
+    .npz file are plain .npy files stored in a zip file, so each can be mapped at
+    its offset in the file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as npz_file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be memory-mapped")
+            # The local file header is 30 bytes, followed by the name and extra field
+            npz_file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", npz_file.read(4))
+            npz_file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(npz_file)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(npz_file)
+            else:
+                header = np.lib.format.read_array_header_2_0(npz_file)
+            shape, fortran_order, dtype = header
+            name = info.filename.removesuffix(".npy")
+            if np.prod(shape) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=npz_file.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+@dataclass
+class LocationArrays:
+    # Per track part
+    ids: np.ndarray
+    types: np.ndarray
+    lengths: np.ndarray
+    # Neighbours on the a side and the b side, as track part indices
+    a_indptr: np.ndarray
+    a_indices: np.ndarray
+    b_indptr: np.ndarray
+    b_indices: np.ndarray
+    # Per track part
+    names: np.ndarray
+    parking_allowed: np.ndarray
+    electrified: np.ndarray
+    saw_movement_allowed: np.ndarray
+
+    @classmethod
+    def from_location(cls, location: Location) -> "LocationArrays":
+        track_parts = location.trackParts
+        index_of = {track_part.id: i for i, track_part in enumerate(track_parts)}
+        a_indptr, a_indices = _csr(
+            [track_part.aSide for track_part in track_parts], index_of
+        )
+        b_indptr, b_indices = _csr(
+            [track_part.bSide for track_part in track_parts], index_of
+        )
+        return cls(
+            ids=np.array(
+                [track_part.id for track_part in track_parts], dtype=np.uint64
+            ),
+            types=np.array(
+                [track_part.type for track_part in track_parts], dtype=np.int8
+            ),
+            lengths=np.array([track_part.length for track_part in track_parts]),
+            a_indptr=a_indptr,
+            a_indices=a_indices,
+            b_indptr=b_indptr,
+            b_indices=b_indices,
+            names=np.array([track_part.name for track_part in track_parts], dtype=str),
+            parking_allowed=np.array(
+                [track_part.parkingAllowed for track_part in track_parts], dtype=bool
+            ),
+            electrified=np.array(
+                [track_part.isElectrified for track_part in track_parts], dtype=bool
+            ),
+            saw_movement_allowed=np.array(
+                [track_part.sawMovementAllowed for track_part in track_parts],
+                dtype=bool,
+            ),
+        )
+
+    def save(self, path: Path):
+        """
+        Saves the arrays as an uncompressed .npz file.
+        """
+        np.savez(
+            path, **{field.name: getattr(self, field.name) for field in fields(self)}
+        )
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "LocationArrays":
+        """
+        Loads saved arrays, memory-mapped read-only unless mmap is False.
+        """
+        if mmap:
+            return cls(**memmap_npz(path))
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def index_of(self, track_ids) -> np.ndarray:
+        """
+        Returns the indices of track part ids, -1 for unknown ids.
+        """
+        track_ids = np.asarray(track_ids, dtype=np.uint64)
+        if len(self) == 0:
+            return np.full(track_ids.shape, -1, dtype=np.int64)
+        order = np.argsort(self.ids, kind="stable")
+        positions = np.searchsorted(self.ids, track_ids, sorter=order)
+        indices = order[np.minimum(positions, len(self) - 1)]
+        return np.where(self.ids[indices] == track_ids, indices, -1)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def a_edges(self) -> np.ndarray:
+        """(m, 2) array of (track part, neighbour on its a side)."""
+        sources = np.repeat(np.arange(len(self)), np.diff(self.a_indptr))
+        return np.stack([sources, self.a_indices], axis=1)
+
+    def b_edges(self) -> np.ndarray:
+        """(m, 2) array of (track part, neighbour on its b side)."""
+        sources = np.repeat(np.arange(len(self)), np.diff(self.b_indptr))
+        return np.stack([sources, self.b_indices], axis=1)
+
+    def undirected_csr(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (indptr, indices) of the neighbours on either side, each neighbour
+        once.
+        """
+        edges = np.concatenate([self.a_edges(), self.b_edges()])
+        edges = np.concatenate([edges, edges[:, ::-1]])
+        edges = np.unique(edges, axis=0)
+        indptr = np.searchsorted(edges[:, 0], np.arange(len(self) + 1))
+        return indptr, edges[:, 1]
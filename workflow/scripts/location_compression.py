@@ -0,0 +1,335 @@
+"""
+Compresses chains of track parts into single, longer track parts.
+
+Converted locations contain long chains of railroad track parts with one
+neighbour on each side, such as the parts "b-X-p-1" ... "b-X-p-N" of a branch.
+Every part adds states and branching to the search in cTORS, but a chain can be
+replaced by one track part with the total length of the chain. The compressed
+location keeps a mapping from each of its track parts to the original track parts
+it replaces, which is written next to the location as
+<location>.compression.json. Scenarios converted on a compressed location place
+trains through this mapping, so a train on "b-X-p-3" stands on the part that
+replaces "b-X-p-3".
+
+Gates are never merged, since trains enter and leave through them by name.
+"""
+import json
+import logging
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+
+from google.protobuf.json_format import Parse
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from protos.Location_pb2 import Location, TrackPart, TrackPartType
+from track_names import TrackNames
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TrackPartMapping:
+    """
+    The original track parts of every track part of a compressed location, in
+    order along the track.
+    """
+
+    original_ids: dict[int, list[int]]
+    original_names: dict[int, list[str]]
+
+    @property
+    def by_original_name(self) -> dict[str, int]:
+        return {
+            name: track_id
+            for track_id, names in self.original_names.items()
+            for name in names
+        }
+
+    @property
+    def by_original_id(self) -> dict[int, int]:
+        return {
+            original_id: track_id
+            for track_id, original_ids in self.original_ids.items()
+            for original_id in original_ids
+        }
+
+    def save(self, path: Path):
+        with open(path, "w") as mapping_file:
+            json.dump(
+                {
+                    "trackParts": [
+                        {
+                            "id": track_id,
+                            "originalIds": self.original_ids[track_id],
+                            "originalNames": self.original_names[track_id],
+                        }
+                        for track_id in self.original_ids
+                    ]
+                },
+                mapping_file,
+                indent=2,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "TrackPartMapping":
+        with open(path, "r") as mapping_file:
+            track_parts = json.load(mapping_file)["trackParts"]
+        return cls(
+            {track_part["id"]: track_part["originalIds"] for track_part in track_parts},
+            {
+                track_part["id"]: track_part["originalNames"]
+                for track_part in track_parts
+            },
+        )
+
+
+def mapping_path(location_path: Path) -> Path:
+    """
+    Returns the path of the mapping of a compressed location.
+    """
+    return location_path.with_name(location_path.name + ".compression.json")
+
+
+def read_track_mapping(location_path: Path) -> TrackPartMapping | None:
+    """
+    Returns the mapping of a location if it is compressed, and None otherwise.
+    """
+    path = mapping_path(location_path)
+    if not path.exists():
+        return None
+    return TrackPartMapping.load(path)
+
+
+def _flags(track_part: TrackPart) -> tuple[bool, bool, bool]:
+    return (
+        track_part.parkingAllowed,
+        track_part.sawMovementAllowed,
+        track_part.isElectrified,
+    )
+
+
+def find_chains(location: Location) -> list[list[int]]:
+    """
+    Returns the maximal chains of mergeable track parts, as lists of track part ids
+    in order along the track, with more than one part each.
+
+    A track part is mergeable if it is a railroad with one neighbour on each side
+    and is not a gate. Neighbouring mergeable parts are merged if they have the
+    same flags. Both ends of a chain connect to different track parts, so the
+    merged part does not connect to the same track part twice.
+    """
+    by_id = {track_part.id: track_part for track_part in location.trackParts}
+    names = TrackNames.parse(track_part.name for track_part in location.trackParts)
+    mergeable = {
+        track_part.id
+        for track_part, is_gate in zip(location.trackParts, names.is_gate)
+        if track_part.type == TrackPartType.RailRoad
+        and len(track_part.aSide) == 1
+        and len(track_part.bSide) == 1
+        and track_part.aSide[0] != track_part.bSide[0]
+        and not is_gate
+    }
+
+    def chain_neighbors(track_id: int) -> list[int]:
+        track_part = by_id[track_id]
+        return [
+            neighbor
+            for neighbor in [*track_part.aSide, *track_part.bSide]
+            if neighbor in mergeable and _flags(by_id[neighbor]) == _flags(track_part)
+        ]
+
+    chains = []
+    visited = set()
+    for track_part in location.trackParts:
+        if track_part.id not in mergeable or track_part.id in visited:
+            continue
+        component = [track_part.id]
+        visited.add(track_part.id)
+        for track_id in component:
+            for neighbor in chain_neighbors(track_id):
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    component.append(neighbor)
+        ends = [
+            track_id for track_id in component if len(chain_neighbors(track_id)) < 2
+        ]
+        if not ends:
+            # A closed ring has no ends to connect the merged part to
+            continue
+        chain = [ends[0]]
+        while len(chain) < len(component):
+            chain.append(
+                next(
+                    neighbor
+                    for neighbor in chain_neighbors(chain[-1])
+                    if len(chain) < 2 or neighbor != chain[-2]
+                )
+            )
+
+        if len(chain) < 2:
+            continue
+
+        # Keep a bumper on the b side of the merged part, and otherwise the a side
+        # of the first part of the chain
+        first_bumper, last_bumper = (
+            by_id[_outer_neighbor(by_id[end], chain)].type == TrackPartType.Bumper
+            for end in (chain[0], chain[-1])
+        )
+        if first_bumper != last_bumper:
+            if first_bumper:
+                chain.reverse()
+        elif by_id[chain[0]].aSide[0] == chain[1]:
+            chain.reverse()
+        if _outer_neighbor(by_id[chain[0]], chain) == _outer_neighbor(
+            by_id[chain[-1]], chain
+        ):
+            chain.pop()
+        if len(chain) > 1:
+            chains.append(chain)
+    return chains
+
+
+def _outer_neighbor(track_part: TrackPart, chain: list[int]) -> int:
+    """
+    Returns the neighbour of the end of a chain that is not in the chain.
+    """
+    members = set(chain)
+    return next(
+        neighbor
+        for neighbor in [*track_part.aSide, *track_part.bSide]
+        if neighbor not in members
+    )
+
+
+def compress_chains(location: Location) -> tuple[Location, TrackPartMapping]:
+    """
+    Returns a location in which every chain of find_chains is one track part, and
+    the mapping back to the original track parts.
+
+    The merged part has the name of the first part of the chain, the sum of the
+    lengths, and the flags of the chain. Track parts keep their order and are
+    numbered from 1 again.
+    """
+    by_id = {track_part.id: track_part for track_part in location.trackParts}
+    chain_of = {
+        track_id: chain for chain in find_chains(location) for track_id in chain
+    }
+
+    # The new id of every original track part
+    new_ids: dict[int, int] = {}
+    groups: list[list[int]] = []
+    for track_part in location.trackParts:
+        if track_part.id in new_ids:
+            continue
+        group = chain_of.get(track_part.id, [track_part.id])
+        groups.append(group)
+        for track_id in group:
+            new_ids[track_id] = len(groups)
+
+    compressed = Location()
+    for new_id, group in enumerate(groups, 1):
+        first, last = by_id[group[0]], by_id[group[-1]]
+        track_part = compressed.trackParts.add()
+        track_part.CopyFrom(first)
+        track_part.id = new_id
+        if len(group) > 1:
+            track_part.length = sum(by_id[track_id].length for track_id in group)
+            track_part.aSide[:] = [_outer_neighbor(first, group)]
+            track_part.bSide[:] = [_outer_neighbor(last, group)]
+        track_part.aSide[:] = [new_ids[track_id] for track_id in track_part.aSide]
+        track_part.bSide[:] = [new_ids[track_id] for track_id in track_part.bSide]
+
+    mapping = TrackPartMapping(
+        {new_id: list(group) for new_id, group in enumerate(groups, 1)},
+        {
+            new_id: [by_id[track_id].name for track_id in group]
+            for new_id, group in enumerate(groups, 1)
+        },
+    )
+    return compressed, mapping
+
+
+def read_location(location_path: Path) -> Location:
+    with open(location_path, "r") as location_file:
+        location = Location()
+        Parse(location_file.read(), location)
+    return location
+
+
+def main():
+    """
+    Script to report how much compression reduces the track parts of a set of
+    converted locations.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Reports the reduction in track parts by compressing the chains "
+        "of converted locations."
+    )
+    parser.add_argument(
+        "locations",
+        help="Location json files, or directories to search for *_location.json files.",
+        type=Path,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--output", help="Also write the report as json to this file.", type=Path
+    )
+    args = parser.parse_args()
+
+    location_paths = []
+    for path in args.locations:
+        if path.is_dir():
+            location_paths.extend(sorted(path.rglob("*_location.json")))
+        else:
+            location_paths.append(path)
+
+    rows = []
+    for location_path in location_paths:
+        location = read_location(location_path)
+        if mapping_path(location_path).exists():
+            logger.warning(f"{location_path} is already compressed")
+        compressed, _ = compress_chains(location)
+        rows.append(
+            {
+                "location": str(location_path),
+                "track_parts": len(location.trackParts),
+                "compressed_track_parts": len(compressed.trackParts),
+            }
+        )
+        print(
+            f"{location_path}: {len(location.trackParts)} -> "
+            f"{len(compressed.trackParts)} track parts"
+        )
+
+    before = sum(row["track_parts"] for row in rows)
+    after = sum(row["compressed_track_parts"] for row in rows)
+    reduction = 1 - after / before if before else 0.0
+    print(
+        f"Total over {len(rows)} locations: {before} -> {after} track parts "
+        f"({reduction:.1%} fewer)"
+    )
+    if args.output is not None:
+        with open(args.output, "w") as report_file:
+            json.dump(
+                {
+                    "locations": rows,
+                    "track_parts": before,
+                    "compressed_track_parts": after,
+                    "reduction": reduction,
+                },
+                report_file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import argparse
 import logging
 import sys
 from pathlib import Path
+from typing import TextIO
 
 if Path(__file__).parent.parent.parent not in sys.path:
     sys.path.append(str(Path(__file__).parent.parent.parent))
@@ -14,6 +15,35 @@ from protos.graph_pb2 import Graph, Node, NodeType
 logger = logging.getLogger(__name__)
 
 
+def read_graph(graph_file: TextIO) -> Graph:
+    """
+    Reads a graph in the custom .graph format from an open file.
+    """
+    assert graph_file.readline().strip() == "type graph"
+    num_nodes = int(graph_file.readline().strip().split()[1])
+    assert graph_file.readline().strip() == "map"
+
+    graph = Graph()
+    for _ in range(num_nodes):
+        match graph_file.readline().split():
+            case node, *neighbors:
+                node = node.strip()
+                neighbors = [neighbor.strip() for neighbor in neighbors]
+                node_type = (
+                    NodeType.GATE if node.startswith("g-") else NodeType.BRANCH
+                )
+                node = Node(id=node, neighbors=neighbors, type=node_type)
+                graph.nodes.append(node)
+            case line:
+                raise Exception(
+                    "Invalid graph file. The map section should "
+                    "be in the format: node neighbor1 neighbor2 ..."
+                    f" neighborN. Found {line}."
+                )
+
+    return graph
+
+
 def main():
     """
     Script to convert the custom .graph files to protobuf format.
@@ -33,29 +63,9 @@ def main():
     graph_output = Path(args.graph_output)
 
     with open(graph_path, "r") as graph_file:
-        assert graph_file.readline().strip() == "type graph"
-        num_nodes = int(graph_file.readline().strip().split()[1])
-        assert graph_file.readline().strip() == "map"
-
-        graph = Graph()
-        for _ in range(num_nodes):
-            match graph_file.readline().split():
-                case node, *neighbors:
-                    node = node.strip()
-                    neighbors = [neighbor.strip() for neighbor in neighbors]
-                    node_type = (
-                        NodeType.GATE if node.startswith("g-") else NodeType.BRANCH
-                    )
-                    node = Node(id=node, neighbors=neighbors, type=node_type)
-                    graph.nodes.append(node)
-                case line:
-                    raise Exception(
-                        "Invalid graph file. The map section should "
-                        "be in the format: node neighbor1 neighbor2 ..."
-                        f" neighborN. Found {line}."
-                    )
-
-        graph_output.write_bytes(graph.SerializeToString())
+        graph = read_graph(graph_file)
+
+    graph_output.write_bytes(graph.SerializeToString())
 
 
 if __name__ == "__main__":
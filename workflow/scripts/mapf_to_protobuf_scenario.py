@@ -2,6 +2,7 @@ import argparse
 import logging
 import sys
 from pathlib import Path
+from typing import TextIO
 
 if Path(__file__).parent.parent.parent not in sys.path:
     sys.path.append(str(Path(__file__).parent.parent.parent))
@@ -9,12 +10,54 @@ if Path(__file__).parent.parent.parent not in sys.path:
 else:
     sys.path.append("protos")
 
-from protos.scenario_mapf_pb2 import Scenario
 from protos.agent_pb2 import Agent
+from protos.scenario_mapf_pb2 import Scenario
 
 logger = logging.getLogger(__name__)
 
 
+def read_scenario(scenario_file: TextIO) -> Scenario:
+    """
+    Reads a scenario in the custom .scen format from an open file.
+    """
+    assert scenario_file.readline().strip() == "version 1 graph"
+    graph_filename = scenario_file.readline().strip()
+    num_agents = int(scenario_file.readline().strip().split()[1])
+
+    agent_type_mapping = {}
+    while (line := scenario_file.readline()).strip() != "agents starts":
+        if not line:
+            raise ValueError(
+                "Invalid scenario file. The file ended before the "
+                "'agents starts' section."
+            )
+        agent_type, *agent_ids = line.split()
+        for agent_id in agent_ids:
+            agent_type_mapping[agent_id] = agent_type
+
+    scenario = Scenario()
+    scenario.graph = graph_filename
+    for _ in range(num_agents):
+        agent_id, start = scenario_file.readline().strip().split()
+        agent = Agent()
+        agent.name = agent_id
+        agent.type = agent_type_mapping[agent_id]
+        agent.start_or_end_track = start
+        scenario.incoming_agents.append(agent)
+
+    assert scenario_file.readline().strip() == "goals"
+
+    for agent in range(num_agents):
+        agent_type, goal = scenario_file.readline().strip().split()
+        agent = Agent()
+        agent.name = "***"
+        agent.type = agent_type
+        agent.start_or_end_track = goal
+        scenario.outgoing_agents.append(agent)
+
+    return scenario
+
+
 def main():
     """
     Script to convert the custom .scen files to protobuf format.
@@ -34,37 +77,9 @@ def main():
     scenario_output = Path(args.scenario_output)
 
     with open(scenario_path, "r") as scenario_file:
-        assert scenario_file.readline().strip() == "version 1 graph"
-        graph_filename = scenario_file.readline().strip()
-        num_agents = int(scenario_file.readline().strip().split()[1])
-
-        agent_type_mapping = {}
-        while (type_assignment := scenario_file.readline().strip()) != "agents starts":
-            agent_type, *agent_ids = type_assignment.split()
-            for agent_id in agent_ids:
-                agent_type_mapping[agent_id] = agent_type
-
-        scenario = Scenario()
-        scenario.graph = graph_filename
-        for _ in range(num_agents):
-            agent_id, start = scenario_file.readline().strip().split()
-            agent = Agent()
-            agent.name = agent_id
-            agent.type = agent_type_mapping[agent_id]
-            agent.start_or_end_track = start
-            scenario.incoming_agents.append(agent)
-        
-        assert scenario_file.readline().strip() == "goals"
-
-        for agent in range(num_agents):
-            agent_type, goal = scenario_file.readline().strip().split()
-            agent = Agent()
-            agent.name = "***"
-            agent.type = agent_type
-            agent.start_or_end_track = goal
-            scenario.outgoing_agents.append(agent)
-
-        scenario_output.write_bytes(scenario.SerializeToString())
+        scenario = read_scenario(scenario_file)
+
+    scenario_output.write_bytes(scenario.SerializeToString())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import json
+import logging
+import sys
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from pathlib import Path
+
+from google.protobuf.json_format import MessageToJson, Parse
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from protobuf_to_tors_scenario import merge_train_unit_types
+from protos.Scenario_pb2 import Scenario
+from protos.TrainUnitTypes_pb2 import TrainUnitTypes
+
+logger = logging.getLogger(__name__)
+
+
+def _to_json(message) -> str:
+    return MessageToJson(message, including_default_value_fields=True)
+
+
+def _load_seconds(content: str, message_type, repeat: int) -> float:
+    """
+    Returns the fastest of repeat parses of the json content.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Parse(content, message_type())
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_layout(scenario_paths: list[Path], repeat: int = 5) -> dict:
+    """
+    Measures the size and parse time of the scenarios of one layout as they are,
+    with their train unit types de-duplicated, and with the types moved to one
+    shared file.
+    """
+    totals = defaultdict(int)
+    shared_types = []
+    for scenario_path in scenario_paths:
+        original = scenario_path.read_text()
+        scenario = Scenario()
+        Parse(original, scenario)
+
+        deduplicated_types = {
+            train_unit_type.displayName: train_unit_type
+            for train_unit_type in scenario.trainUnitTypes
+        }
+        shared_types = merge_train_unit_types(shared_types, deduplicated_types.values())
+        del scenario.trainUnitTypes[:]
+        without_types = _to_json(scenario)
+        scenario.trainUnitTypes.extend(deduplicated_types.values())
+        deduplicated = _to_json(scenario)
+
+        for name, content in [
+            ("original", original),
+            ("deduplicated", deduplicated),
+            ("shared", without_types),
+        ]:
+            totals[f"{name}_bytes"] += len(content.encode())
+            totals[f"{name}_load_seconds"] += _load_seconds(content, Scenario, repeat)
+
+    # The shared file is stored and loaded once per layout
+    shared = _to_json(TrainUnitTypes(types=shared_types))
+    totals["shared_bytes"] += len(shared.encode())
+    totals["shared_load_seconds"] += _load_seconds(shared, TrainUnitTypes, repeat)
+    return {"scenarios": len(scenario_paths), **totals}
+
+
+def main():
+    """
+    Measures how much de-duplicating train unit types, or moving them to a shared
+    file per layout, reduces the size and load time of converted scenarios.
+
+    Example:
+
+        python workflow/scripts/measure_train_unit_types.py tors_instances
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Measures the effect of de-duplicated and shared train unit "
+        "types on scenario size and load time."
+    )
+    parser.add_argument(
+        "scenarios",
+        help="Scenario json files, or directories to search for *_scenario.json "
+        "files. Scenarios in the same directory are treated as one layout.",
+        type=Path,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--repeat", help="The number of times to parse each file.", default=5, type=int
+    )
+    args = parser.parse_args()
+
+    layouts = defaultdict(list)
+    for path in args.scenarios:
+        scenario_paths = (
+            sorted(path.rglob("*_scenario.json")) if path.is_dir() else [path]
+        )
+        for scenario_path in scenario_paths:
+            layouts[scenario_path.parent].append(scenario_path)
+
+    totals = defaultdict(int)
+    for layout, scenario_paths in sorted(layouts.items()):
+        try:
+            result = measure_layout(scenario_paths, args.repeat)
+        except ValueError as e:
+            logger.warning(f"Skipping {layout}: {e}")
+            continue
+        print(json.dumps({"layout": str(layout), **result}))
+        for key, value in result.items():
+            totals[key] += value
+
+    for name in ["deduplicated", "shared"]:
+        if totals["original_bytes"] > 0:
+            totals[f"{name}_size_reduction"] = round(
+                1 - totals[f"{name}_bytes"] / totals["original_bytes"], 3
+            )
+            totals[f"{name}_load_time_reduction"] = round(
+                1 - totals[f"{name}_load_seconds"] / totals["original_load_seconds"], 3
+            )
+    print(json.dumps({"layout": "total", **totals}))
+
+
+if __name__ == "__main__":
+    main()
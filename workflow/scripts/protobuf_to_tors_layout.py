@@ -0,0 +1,165 @@
+"""
+Converts a layout and all of its scenarios in one pass.
+
+The location is converted and indexed once in memory, and the scenarios are then
+read, converted and written one at a time, so the cost per scenario is only the
+placement of its trains and the serialization.
+"""
+import logging
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from id_mapping import IdMapping, id_mapping_path
+from instance_catalog import record_location, record_scenario
+from instance_conversion import (
+    CachedLocation,
+    ConversionSettings,
+    convert_scenario,
+    write_location,
+    write_scenario,
+)
+from location_compression import compress_chains, mapping_path
+from protobuf_to_tors_location import graph_to_location
+from protobuf_to_tors_scenario import LocationIndex
+from protos.graph_pb2 import Graph
+from protos.scenario_mapf_pb2 import Scenario as MAPFScenario
+
+logger = logging.getLogger(__name__)
+
+
+def scenario_json_name(scenario_path: Path) -> str:
+    """
+    Returns the scenario json filename for a .scen.pb file, as used in the Snakefile.
+    """
+    return scenario_path.name.removesuffix(".scen.pb") + "_scenario.json"
+
+
+def convert_layout(
+    graph_path: Path,
+    scenario_paths: list[Path],
+    location_output_path: Path,
+    scenario_directory: Path,
+    settings: ConversionSettings,
+    catalog: Path | None = None,
+    compress: bool = False,
+):
+    """
+    Converts a .graph.pb file and its .scen.pb files, writing the location to
+    location_output_path and the scenarios to scenario_directory. With compress,
+    chains of railroads in the location are merged and the scenarios are placed
+    through the track mapping.
+    """
+    start = time.perf_counter()
+    with open(graph_path, "rb") as graph_file:
+        mapf_graph = Graph()
+        mapf_graph.ParseFromString(graph_file.read())
+    location = graph_to_location(mapf_graph, length=settings.track_length)
+    track_mapping = None
+    if compress:
+        location, track_mapping = compress_chains(location)
+    cached_location = CachedLocation(
+        location, LocationIndex.from_location(location, track_mapping)
+    )
+    write_location(location, location_output_path)
+    if track_mapping is not None:
+        track_mapping.save(mapping_path(location_output_path))
+    else:
+        mapping_path(location_output_path).unlink(missing_ok=True)
+    IdMapping.build(mapf_graph, location, track_mapping).save(
+        id_mapping_path(location_output_path)
+    )
+    if catalog is not None:
+        record_location(catalog, location_output_path, location)
+    location_seconds = time.perf_counter() - start
+
+    scenario_directory.mkdir(parents=True, exist_ok=True)
+    for scenario_path in scenario_paths:
+        scenario_start = time.perf_counter()
+        with open(scenario_path, "rb") as scenario_file:
+            mapf_scenario = MAPFScenario()
+            mapf_scenario.ParseFromString(scenario_file.read())
+        tors_scenario = convert_scenario(mapf_scenario, cached_location, settings)
+        output_path = scenario_directory / scenario_json_name(scenario_path)
+        write_scenario(tors_scenario, output_path)
+        if catalog is not None:
+            record_scenario(catalog, output_path, tors_scenario, location_output_path)
+        logger.debug(
+            "Converted %s in %.3fs", scenario_path, time.perf_counter() - scenario_start
+        )
+
+    logger.info(
+        f"Converted {graph_path} in {location_seconds:.3f}s and "
+        f"{len(scenario_paths)} scenarios in "
+        f"{time.perf_counter() - start - location_seconds:.3f}s"
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Converts a .graph.pb file and all its .scen.pb files to TORS "
+        "json files in one pass."
+    )
+    parser.add_argument("graph", help="The .graph.pb file to convert.", type=Path)
+    parser.add_argument(
+        "location_output", help="The location file to write to.", type=Path
+    )
+    parser.add_argument(
+        "scenario_directory", help="The directory to write the scenarios to.", type=Path
+    )
+    parser.add_argument(
+        "scenarios", help="The .scen.pb files to convert.", type=Path, nargs="*"
+    )
+    parser.add_argument(
+        "--length", help="The length of the track parts.", default=100, type=int
+    )
+    parser.add_argument(
+        "--train-length", help="The length of the trains.", default=100, type=int
+    )
+    parser.add_argument(
+        "--n-carriages", help="The number of carriages per train.", default=1, type=int
+    )
+    parser.add_argument(
+        "--time-between-trains", help="The time between trains.", default=100, type=int
+    )
+    parser.add_argument(
+        "--compress",
+        help="Merge chains of railroad track parts into single track parts.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--catalog",
+        help="Record the statistics of the instances in this instance catalog.",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    settings = ConversionSettings(
+        track_length=args.length,
+        train_length=args.train_length,
+        n_carriages=args.n_carriages,
+        time_between_trains=args.time_between_trains,
+    )
+    convert_layout(
+        args.graph,
+        args.scenarios,
+        args.location_output,
+        args.scenario_directory,
+        settings,
+        args.catalog,
+        args.compress,
+    )
+
+
+if __name__ == "__main__":
+    main()
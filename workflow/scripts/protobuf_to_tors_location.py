@@ -1,10 +1,14 @@
+import json
 import logging
+import sys
 from argparse import ArgumentParser
 from pathlib import Path
+from typing import TextIO
 
 import networkx as nx
-from google.protobuf.json_format import MessageToJson
-import sys
+import numpy as np
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.json_format import MessageToDict
 
 if Path(__file__).parent.parent.parent not in sys.path:
     sys.path.append(str(Path(__file__).parent.parent.parent))
@@ -13,11 +17,15 @@ else:
     sys.path.append("protos")
 
 
+from id_mapping import IdMapping, id_mapping_path
+from instance_catalog import record_location
+from location_arrays import LocationArrays
+from location_compression import compress_chains, mapping_path
 from protos.graph_pb2 import Graph
 from protos.Location_pb2 import Location, TrackPart, TrackPartType
+from routing_tables import compute_routing_tables
+from track_names import TrackNames
 
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -29,7 +37,7 @@ def reduce_degree(graph: nx.Graph):
     neighbors of the offending node that has a degree greater than 3.
     """
     offenders = [n for n, d in graph.degree() if d > 3]
-    logger.debug(f"Degree of nodes: {graph.degree()}")
+    logger.debug("Degree of nodes: %s", graph.degree())
     logger.info(f"Found {len(offenders)} nodes with degree > 3.")
 
     # Split up nodes with degree > 3
@@ -59,12 +67,11 @@ def remove_extra_gate_nodes(graph: nx.Graph):
     If there are more than two gate nodes, the extra gate nodes are removed
     from the graph. Gate nodes' names start with "g-".
     """
-    gate_nodes = [node for node in graph.nodes if node.startswith("g-")]
-    logger.debug(f"Gate nodes: {gate_nodes}")
+    names = TrackNames.parse(graph.nodes)
+    # Gate nodes sorted by their number
+    gate_nodes = [names.names[i] for i in names.gates_in_order()]
+    logger.debug("Sorted gate nodes: %s", gate_nodes)
     if len(gate_nodes) > 2:
-        # Sort the gate nodes by their name
-        gate_nodes.sort(key=lambda node: int(node.split("-")[-1]))
-        logger.debug(f"Sorted gate nodes: {gate_nodes}")
         # Remove all but the last two gate nodes (these are the ones connected to the
         # rest of the yard)
         for node in gate_nodes[:-2]:
@@ -95,7 +102,7 @@ def process_switch(track, tors_location):
 
 
 
-def create_track_parts(location_graph: nx.Graph, args):
+def create_track_parts(location_graph: nx.Graph, length: int):
     tors_id_start = 1
 
     return (
@@ -105,7 +112,7 @@ def create_track_parts(location_graph: nx.Graph, args):
             name=node,
             aSide=[],
             bSide=[],
-            length=args.length,
+            length=length,
             parkingAllowed=True,
             sawMovementAllowed=True,
             isElectrified=True,
@@ -114,23 +121,53 @@ def create_track_parts(location_graph: nx.Graph, args):
     )
 
 
-def main():
-    parser = ArgumentParser(
-        description="Converts .graph.pb files to TORS protobuf format."
-    )
-    parser.add_argument("graph", help="The .graph.pb file to convert.")
-    parser.add_argument("output", help="The output file to write to.", type=Path)
-    parser.add_argument(
-        "--length", help="The length of the track parts.", default=100, type=int
+def write_location_json(location: Location, location_file: TextIO):
+    """
+    Writes the location as json, one track part at a time.
+
+    The output is the same as that of MessageToJson, but the json representation
+    of the whole location is never held in memory, which dominates the memory use
+    of converting large layouts such as grids.
+    """
+    # Convert everything except the track parts in one go
+    header = Location()
+    for field, value in location.ListFields():
+        if field.name == "trackParts":
+            continue
+        if field.label == FieldDescriptor.LABEL_REPEATED:
+            getattr(header, field.name).extend(value)
+        elif field.message_type is not None:
+            getattr(header, field.name).CopyFrom(value)
+        else:
+            setattr(header, field.name, value)
+    header_json = json.dumps(
+        MessageToDict(header, including_default_value_fields=True),
+        indent=2,
+        ensure_ascii=False,
     )
-    args = parser.parse_args()
+    before, after = header_json.split('"trackParts": []', 1)
+
+    location_file.write(before)
+    location_file.write('"trackParts": [')
+    for i, track_part in enumerate(location.trackParts):
+        track_part_json = json.dumps(
+            MessageToDict(track_part, including_default_value_fields=True),
+            indent=2,
+            ensure_ascii=False,
+        )
+        location_file.write("," if i > 0 else "")
+        location_file.write("\n    " + track_part_json.replace("\n", "\n    "))
+    location_file.write("\n  ]" if len(location.trackParts) > 0 else "]")
+    location_file.write(after)
 
-    graph_path = args.graph
 
-    with open(graph_path, "rb") as graph_file:
-        mapf_graph = Graph()
-        mapf_graph.ParseFromString(graph_file.read())
+def graph_to_location(mapf_graph: Graph, length: int = 100) -> Location:
+    """
+    Converts a MAPF graph to a TORS location.
 
+    Does not read or write any files, so it can be used to generate locations on
+    the fly.
+    """
     tors_location = Location()
 
     adjacency_list = [" ".join([node.id, *node.neighbors]) for node in mapf_graph.nodes]
@@ -142,14 +179,14 @@ def main():
 
     location_graph = reduce_degree(location_graph)
 
-    track_parts = create_track_parts(location_graph, args)
+    track_parts = create_track_parts(location_graph, length)
     tors_location.trackParts.extend(track_parts)
 
-    names = [track.name for track in tors_location.trackParts]
+    tracks_by_name = {track.name: track for track in tors_location.trackParts}
     # Add the edges to the track parts
     for edge in location_graph.edges:
-        first_track = tors_location.trackParts[names.index(edge[0])]
-        second_track = tors_location.trackParts[names.index(edge[1])]
+        first_track = tracks_by_name[edge[0]]
+        second_track = tracks_by_name[edge[1]]
         if len(first_track.aSide) == 0:
             first_track.aSide.append(second_track.id)
         else:
@@ -167,35 +204,22 @@ def main():
     # Get the ends of the branches
     # Each branch track is named "b-<branch number>-p-<position in branch>"
     # The end of each branch number is the track with the highest position in the branch
-    # First get the number of branches
-    branch_numbers = set(
-        [
-            track.name.split("-")[1]
-            for track in tors_location.trackParts
-            if track.name.startswith("b-")
-        ]
-    )
-    logger.debug(f"Branch numbers: {branch_numbers}")
-    # Then get the end of each branch
-    branch_ends = [
-        max(
-            [
-                track
-                for track in tors_location.trackParts
-                if track.name.startswith(f"b-{branch_number}")
-            ],
-            key=lambda track: int(track.name.split("-")[-1]),
-        )
-        for branch_number in branch_numbers
-    ]
-    logger.debug(f"Branch ends: {branch_ends}")
-    end_of_lowest_branch = min(
-        branch_ends, key=lambda track: int(track.name.split("-")[-1])
-    )
+    names = TrackNames.parse(track.name for track in tors_location.trackParts)
+    branch_ends = names.branch_ends()
+    logger.debug("Branch ends: %s", [names.names[i] for i in branch_ends])
+    # Layouts without branches (e.g. grids) have no branch ends
+    end_of_lowest_branch = None
+    if len(branch_ends) > 0:
+        lowest = branch_ends[np.argmin(names.position[branch_ends])]
+        end_of_lowest_branch = tors_location.trackParts[int(lowest)]
 
     # Only add an exit bumper if the end of the lowest branch is connected to other
     # tracks (meaning it's a carrousel style yard)
-    if end_of_lowest_branch.aSide != [] and end_of_lowest_branch.bSide != []:
+    if (
+        end_of_lowest_branch is not None
+        and end_of_lowest_branch.aSide != []
+        and end_of_lowest_branch.bSide != []
+    ):
         # Turn the end of the lowest branch into a switch, add a railroad track to the
         # other side of the switch, and add a bumper track to the end of the railroad track
         end_of_lowest_branch.type = TrackPartType.Switch
@@ -206,7 +230,7 @@ def main():
             name=f"end-{end_of_lowest_branch.name}",
             aSide=[end_of_lowest_branch.id],
             bSide=[],
-            length=args.length,
+            length=length,
             parkingAllowed=True,
             sawMovementAllowed=True,
             isElectrified=True,
@@ -243,11 +267,83 @@ def main():
         # Add the bumper track to the location
         tors_location.trackParts.append(bumper_track)
 
+    return tors_location
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Converts .graph.pb files to TORS protobuf format."
+    )
+    parser.add_argument("graph", help="The .graph.pb file to convert.")
+    parser.add_argument("output", help="The output file to write to.", type=Path)
+    parser.add_argument(
+        "--length", help="The length of the track parts.", default=100, type=int
+    )
+    parser.add_argument(
+        "--compress",
+        help="Merge chains of railroad track parts into single track parts, and "
+        "write the mapping to the original track parts next to the output.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--routing-tables",
+        help="Also write all-pairs routing tables as .npy files to this directory.",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--tensors",
+        help="Also write the adjacency and track part arrays as a .npz file to this "
+        "path.",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--catalog",
+        help="Record the statistics of the location in this instance catalog.",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    graph_path = args.graph
+
+    with open(graph_path, "rb") as graph_file:
+        mapf_graph = Graph()
+        mapf_graph.ParseFromString(graph_file.read())
+
+    tors_location = graph_to_location(mapf_graph, length=args.length)
+    track_mapping = None
+    if args.compress:
+        n_track_parts = len(tors_location.trackParts)
+        tors_location, track_mapping = compress_chains(tors_location)
+        track_mapping.save(mapping_path(args.output))
+        logger.info(
+            f"Compressed {n_track_parts} track parts to {len(tors_location.trackParts)}"
+        )
+    else:
+        # Scenarios would otherwise be placed through the mapping of an earlier run
+        mapping_path(args.output).unlink(missing_ok=True)
+
     # write the location to a file as json
     with open(args.output, "w") as location_file:
-        location_file.write(
-            MessageToJson(tors_location, including_default_value_fields=True)
-        )
+        write_location_json(tors_location, location_file)
+    IdMapping.build(mapf_graph, tors_location, track_mapping).save(
+        id_mapping_path(args.output)
+    )
+
+    if args.tensors is not None or args.routing_tables is not None:
+        location_arrays = LocationArrays.from_location(tors_location)
+    if args.tensors is not None:
+        location_arrays.save(args.tensors)
+    if args.routing_tables is not None:
+        routing_tables = compute_routing_tables(location_arrays)
+        routing_tables.save(args.routing_tables)
+
+    if args.catalog is not None:
+        record_location(args.catalog, args.output, tors_location)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,14 @@
+import fcntl
 import logging
 import sys
 from argparse import ArgumentParser
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
 
-from google.protobuf.json_format import MessageToJson, Parse, MessageToDict, ParseDict
+import numpy as np
+from google.protobuf.json_format import MessageToJson, Parse
 
 if Path(__file__).parent.parent.parent not in sys.path:
     sys.path.append(str(Path(__file__).parent.parent.parent))
@@ -11,34 +16,19 @@ if Path(__file__).parent.parent.parent not in sys.path:
 else:
     sys.path.append("protos")
 
-from protos.scenario_mapf_pb2 import Scenario as MAPFScenario
+from feasibility import check_feasibility
+from instance_catalog import record_scenario
+from location_compression import TrackPartMapping, read_location, read_track_mapping
 from protos.agent_pb2 import Agent
-from protos.Location_pb2 import Location, TrackPartType, TrackPart
-from protos.TrainUnitTypes_pb2 import TrainUnitType, TrainUnitTypes
+from protos.Location_pb2 import Location, TrackPart, TrackPartType
+from protos.scenario_mapf_pb2 import Scenario as MAPFScenario
 from protos.Scenario_pb2 import Scenario, Train, TrainUnit
+from protos.TrainUnitTypes_pb2 import TrainUnitType, TrainUnitTypes
+from track_names import TrackNames
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def has_bumper_connected(gate_track_part: TrackPart, location: Location) -> bool:
-    """
-    Returns True if the given gate track part has a bumper connected to it.
-    """
-    # Get all track parts connected to the gate track part
-    connected_track_part_ids = list(gate_track_part.aSide) + list(gate_track_part.bSide)
-    connected_track_parts = [
-        track_part
-        for track_part in location.trackParts
-        if track_part.id in connected_track_part_ids
-    ]
-    # Check if any of the connected track parts are bumpers
-    for connected_track_part in connected_track_parts:
-        if connected_track_part.type == TrackPartType.Bumper:
-            return True
-    return False
-
-
 def get_connected_track_of_type(
     track_part: TrackPart, location: Location, track_type: TrackPartType
 ) -> list[TrackPart]:
@@ -80,32 +70,116 @@ def find_track_part_by_name(track_part_name: str, location: Location) -> TrackPa
     raise ValueError(f"Could not find track part with name {track_part_name}")
 
 
-def add_train(
-    tors_scenario_dict: dict,
-    agent: Agent,
-    location: Location,
-    time: int,
-    incoming: str,
-) -> Train:
+@dataclass
+class LocationIndex:
     """
-    Adds a train to the given TORS scenario dictionary.
+    Lookups into a location that are shared by every train placed on it.
+
+    Building the index is linear in the number of track parts. Placing a train
+    afterwards only needs dictionary lookups, so a location can be indexed once
+    and reused for any number of scenarios and parameter combinations.
     """
-    logger.debug(f"Adding train for agent {agent.name}.")
-    train_unit = TrainUnit(
-        id=str(agent.name),
-        typeDisplayName=agent.type,
-    )
-    train = Train(
-        id=agent.name,
-        members=[train_unit],
-    )
 
-    # If either of the start or goal track parts are a gate, then we need to
-    # find the bumper and its corresponding railway TrackPart
-    if "g-" in agent.start_or_end_track:
+    location: Location
+    by_id: dict[int, TrackPart]
+    by_name: dict[str, TrackPart]
+    # Position of each track part in the location, used to keep the
+    # neighbour order of get_connected_track_of_type
+    position: dict[int, int]
+
+    @classmethod
+    def from_location(
+        cls, location: Location, track_mapping: TrackPartMapping | None = None
+    ) -> "LocationIndex":
+        """
+        Indexes a location. For a compressed location, pass its track mapping to
+        also find track parts by the names of the original track parts.
+        """
+        by_id = {}
+        by_name = {}
+        position = {}
+        for i, track_part in enumerate(location.trackParts):
+            by_id[track_part.id] = track_part
+            # find_track_part_by_name returns the first match, so keep it
+            by_name.setdefault(track_part.name, track_part)
+            position[track_part.id] = i
+        if track_mapping is not None:
+            for name, track_id in track_mapping.by_original_name.items():
+                by_name.setdefault(name, by_id[track_id])
+        return cls(location, by_id, by_name, position)
+
+    def find_by_name(self, track_part_name: str) -> TrackPart:
+        """
+        Returns the track part with the given name.
+
+        Raises a ValueError if no track part with the given name is found.
+        """
+        try:
+            return self.by_name[track_part_name]
+        except KeyError:
+            raise ValueError(f"Could not find track part with name {track_part_name}")
+
+    def connected_of_type(
+        self, track_part: TrackPart, track_type: TrackPartType
+    ) -> list[TrackPart]:
+        """
+        Same as get_connected_track_of_type, without scanning the location.
+        """
+        connected_ids = set(track_part.aSide) | set(track_part.bSide)
+        connected_track_parts = sorted(
+            (
+                self.by_id[track_id]
+                for track_id in connected_ids
+                if track_id in self.by_id
+                and self.by_id[track_id].type == track_type
+            ),
+            key=lambda connected: self.position[connected.id],
+        )
+        if len(connected_track_parts) < 1:
+            logger.warning(
+                f"Could not find any track parts of type {track_type} connected to "
+                f"track part {track_part.name}"
+            )
+        return connected_track_parts
+
+    def side_track_part(self, track_part: TrackPart) -> TrackPart:
+        """
+        The side track part of a train standing on the given track part: its first
+        neighbouring railroad, or else its first neighbour that is not a bumper,
+        such as the switch in front of a compressed branch.
+        """
+        neighbors = sorted(
+            (
+                self.by_id[track_id]
+                for track_id in set(track_part.aSide) | set(track_part.bSide)
+                if track_id in self.by_id
+            ),
+            key=lambda neighbor: self.position[neighbor.id],
+        )
+        railroads = [n for n in neighbors if n.type == TrackPartType.RailRoad]
+        if railroads:
+            return railroads[0]
+        others = [n for n in neighbors if n.type != TrackPartType.Bumper]
+        if others:
+            return others[0]
+        raise ValueError(
+            f"Track part {track_part.name} has no neighbour to use as side track part"
+        )
+
+    @cached_property
+    def gate_placement(self) -> tuple[int, int]:
+        """
+        The (parking, side) track part ids used for every train at a gate.
+
+        This is the gate track part with a bumper connected to it, together with
+        that bumper.
+        """
         # Get all gate TrackParts (all track parts with the names "g-1", "g-2", etc.")
+        names = TrackNames.parse(
+            track_part.name for track_part in self.location.trackParts
+        )
         gate_track_parts = [
-            track_part for track_part in location.trackParts if "g-" in track_part.name
+            self.location.trackParts[int(i)] for i in np.flatnonzero(names.is_gate)
         ]
         if len(gate_track_parts) < 1:
             raise ValueError(
@@ -115,7 +189,11 @@ def add_train(
         connected_to_bumper = [
             track_part
             for track_part in gate_track_parts
-            if has_bumper_connected(track_part, location)
+            if any(
+                self.by_id[track_id].type == TrackPartType.Bumper
+                for track_id in [*track_part.aSide, *track_part.bSide]
+                if track_id in self.by_id
+            )
         ]
         if len(connected_to_bumper) != 1:
             raise ValueError(
@@ -123,37 +201,77 @@ def add_train(
                 f"but got {len(connected_to_bumper)}"
             )
         gate_track_part = connected_to_bumper[0]
-        bumper_track_parts = get_connected_track_of_type(
-            gate_track_part, location, TrackPartType.Bumper
+        bumper_track_parts = self.connected_of_type(
+            gate_track_part, TrackPartType.Bumper
         )
         if len(bumper_track_parts) != 1:
             raise ValueError(
                 "Expected 1 bumper track part connected to start, "
                 f"but got {len(bumper_track_parts)}"
             )
-    train.time = time
-    key_to_place_train_in_for_gate = "in" if incoming else "out"
-    key_to_place_train_in_for_non_gate = "inStanding" if incoming else "outStanding"
-
-    if "g-" in agent.start_or_end_track:
-        train.parkingTrackPart = gate_track_part.id
-        train.sideTrackPart = bumper_track_parts[0].id
-        tors_scenario_dict[key_to_place_train_in_for_gate].append(
-            MessageToDict(train, including_default_value_fields=True)
-        )
-    else:
-        # Get the starting track part corresponding to the agent's start
-        parking_track_part = find_track_part_by_name(agent.start_or_end_track, location)
-        neighboring_track_parts = get_connected_track_of_type(
-            parking_track_part, location, TrackPartType.RailRoad
-        )
-        train.parkingTrackPart = parking_track_part.id
-        train.sideTrackPart = neighboring_track_parts[0].id
-        tors_scenario_dict[key_to_place_train_in_for_non_gate].append(
-            MessageToDict(train, including_default_value_fields=True)
-        )
+        return gate_track_part.id, bumper_track_parts[0].id
+
+
+@dataclass
+class TrainPlacement:
+    """Where the train of a single agent is placed, independent of its time."""
+
+    agent: Agent
+    parking_track_part: int
+    side_track_part: int
+    at_gate: bool
+
+
+def place_train(
+    agent: Agent, location_index: LocationIndex, at_gate: bool | None = None
+) -> TrainPlacement:
+    """
+    Finds the parking and side track parts for the train of the given agent.
+
+    Agents starting or ending at a gate are placed on the gate track part with a
+    bumper, with the bumper as side track part. All other agents are placed on
+    the track part with the same name (or the compressed track part that replaces
+    it), with its first neighbouring railroad as side track part, or the switch in
+    front of it if it has none. Whether the agent is at a gate is parsed from its
+    track name unless given.
+    """
+    if at_gate is None:
+        at_gate = bool(TrackNames.parse([agent.start_or_end_track]).is_gate[0])
+    # If either of the start or goal track parts are a gate, then we need to
+    # find the bumper and its corresponding railway TrackPart
+    if at_gate:
+        parking_track_part, side_track_part = location_index.gate_placement
+        return TrainPlacement(agent, parking_track_part, side_track_part, True)
+
+    # Get the starting track part corresponding to the agent's start
+    parking_track_part = location_index.find_by_name(agent.start_or_end_track)
+    side_track_part = location_index.side_track_part(parking_track_part)
+    return TrainPlacement(agent, parking_track_part.id, side_track_part.id, False)
 
-    return tors_scenario_dict
+
+def create_train(placement: TrainPlacement, time: int) -> Train:
+    """
+    Creates the train for a placed agent, arriving or departing at the given time.
+    """
+    agent = placement.agent
+    train_unit = TrainUnit(
+        id=str(agent.name),
+        typeDisplayName=agent.type,
+    )
+    return Train(
+        id=agent.name,
+        time=time,
+        members=[train_unit],
+        parkingTrackPart=placement.parking_track_part,
+        sideTrackPart=placement.side_track_part,
+    )
+
+
+def agent_track_names(agents: Iterable[Agent]) -> TrackNames:
+    """
+    Parses the start or end tracks of the given agents.
+    """
+    return TrackNames.parse(agent.start_or_end_track for agent in agents)
 
 
 def calculate_arrival_times(
@@ -190,30 +308,33 @@ def calculate_arrival_times(
         A list of arrival times for each agent in the given MAPF scenario.
     """
     logger.debug("Calculating arrival times.")
-    arrival_times = {}
-    gate_agents = [
-        agent
-        for agent in mapf_scenario.incoming_agents
-        if "g-" in agent.start_or_end_track
-    ]
-    gate_agents.sort(key=lambda agent: int(agent.start_or_end_track.split("-")[1]))
-    for i, agent in enumerate(gate_agents):
-        arrival_times[agent.name] = (i + 1) * time_between_trains
-    non_gate_agents = [
-        agent
-        for agent in mapf_scenario.incoming_agents
-        if "g-" not in agent.start_or_end_track
+    arrival_times = [
+        rank * time_between_trains for rank in calculate_arrival_ranks(mapf_scenario)
     ]
-    for i, agent in enumerate(non_gate_agents):
-        arrival_times[agent.name] = 0
-
     logger.debug(f"Arrival times: {arrival_times}")
 
-    arrival_times_list = []
-    for agent in mapf_scenario.incoming_agents:
-        arrival_times_list.append(arrival_times[agent.name])
+    return arrival_times
 
-    return arrival_times_list
+
+def calculate_arrival_ranks(
+    mapf_scenario: MAPFScenario, names: TrackNames | None = None
+) -> list[int]:
+    """
+    Calculates the arrival time of each agent in units of the time between trains.
+
+    See calculate_arrival_times, which multiplies these ranks by the time between
+    trains. The ranks do not depend on any conversion parameters, so they can be
+    computed once per scenario. Pass the parsed start tracks of the incoming
+    agents as names to avoid parsing them again.
+    """
+    if names is None:
+        names = agent_track_names(mapf_scenario.incoming_agents)
+    arrival_ranks = np.zeros(len(names), dtype=np.int64)
+    gate_agents = np.flatnonzero(names.is_gate)
+    gate_agents = gate_agents[np.argsort(names.gate[gate_agents], kind="stable")]
+    arrival_ranks[gate_agents] = np.arange(1, len(gate_agents) + 1)
+
+    return arrival_ranks.tolist()
 
 
 def calculate_departure_times(
@@ -252,37 +373,281 @@ def calculate_departure_times(
       to the index of the agent in the MAPF scenario.
     """
     logger.debug(f"Calculating departure times. Total time: {total_time}")
-    sort_order = sorted(
-        range(len(mapf_scenario.outgoing_agents)),
-        key=lambda k: (
-            mapf_scenario.outgoing_agents[k].start_or_end_track.split("-")[1]
-        ),
-    )
-    logger.debug(f"Sort order: {sort_order}")
-    departure_times = []
-    for i, agent in enumerate(mapf_scenario.outgoing_agents):
-        if "g-" in agent.start_or_end_track:
-            logger.debug(f"Agent {agent.name} is a gate agent.")
-            departure_times.append(total_time - (i + 1) * time_between_trains)
-        else:
-            logger.debug(f"Agent {agent.name} is not a gate agent.")
-            departure_times.append(total_time)
-    
+    departure_times = [
+        total_time - rank * time_between_trains
+        for rank in calculate_departure_ranks(mapf_scenario)
+    ]
     logger.debug(f"Departure times: {departure_times}")
 
-    departure_times_list = []
-    for i in sort_order:
-        departure_times_list.append(departure_times[i])
+    return departure_times
+
+
+def calculate_departure_ranks(
+    mapf_scenario: MAPFScenario, names: TrackNames | None = None
+) -> list[int]:
+    """
+    Calculates how many times the time between trains each agent departs before
+    the end of the scenario.
+
+    See calculate_departure_times, which subtracts these ranks multiplied by the
+    time between trains from the total time. Pass the parsed goal tracks of the
+    outgoing agents as names to avoid parsing them again.
+    """
+    if names is None:
+        names = agent_track_names(mapf_scenario.outgoing_agents)
+    departure_ranks = np.where(names.is_gate, np.arange(1, len(names) + 1), 0)
+    # The agents are ordered by the gate or branch number in their goal track,
+    # compared as strings ("10" comes before "2")
+    numbers = np.where(names.is_gate, names.gate, names.branch)
+    sort_keys = np.array(
+        [
+            str(number) if number >= 0 else name.split("-")[1]
+            for number, name in zip(numbers, names.names)
+        ],
+        dtype=str,
+    )
+    sort_order = np.argsort(sort_keys, kind="stable")
+    logger.debug("Sort order: %s", sort_order)
+
+    return departure_ranks[sort_order].tolist()
+
+
+@dataclass
+class PreparedScenario:
+    """
+    Everything about a MAPF scenario that does not depend on the conversion
+    parameters (train length, number of carriages, time between trains, total time).
+    """
+
+    incoming: list[TrainPlacement]
+    outgoing: list[TrainPlacement]
+    arrival_ranks: list[int]
+    departure_ranks: list[int]
+
+
+def prepare_scenario(
+    mapf_scenario: MAPFScenario, location_index: LocationIndex
+) -> PreparedScenario:
+    """
+    Places all trains of the MAPF scenario on the indexed location and computes
+    their arrival and departure order.
+    """
+    incoming_names = agent_track_names(mapf_scenario.incoming_agents)
+    outgoing_names = agent_track_names(mapf_scenario.outgoing_agents)
+    return PreparedScenario(
+        incoming=[
+            place_train(agent, location_index, bool(at_gate))
+            for agent, at_gate in zip(
+                mapf_scenario.incoming_agents, incoming_names.is_gate
+            )
+        ],
+        outgoing=[
+            place_train(agent, location_index, bool(at_gate))
+            for agent, at_gate in zip(
+                mapf_scenario.outgoing_agents, outgoing_names.is_gate
+            )
+        ],
+        arrival_ranks=calculate_arrival_ranks(mapf_scenario, incoming_names),
+        departure_ranks=calculate_departure_ranks(mapf_scenario, outgoing_names),
+    )
+
 
-    return departure_times_list
+def rough_total_time(n_incoming_trains: int, time_between_trains: int) -> int:
+    """
+    Returns a rough estimate of the time needed to complete a scenario.
+    """
+    # Need to multiply by 2 because we need to account for the inbound and outbound
+    return (time_between_trains * n_incoming_trains * 2) + 500
+
+
+def resolve_total_time(
+    n_incoming_trains: int, time_between_trains: int, total_time: int | None
+) -> int:
+    """
+    Returns the total time of the scenario.
+
+    If the total time is not set, it is estimated. If it is set, raises a ValueError
+    if it is probably not possible to fit all the trains in the given time.
+    """
+    estimate = rough_total_time(n_incoming_trains, time_between_trains)
+    if total_time is None:
+        return estimate
+    if total_time < estimate:
+        raise ValueError(
+            f"Total time is set to {total_time}, but the scenario probably needs at "
+            f"least {estimate} time units to complete."
+        )
+    return total_time
+
+
+def create_train_unit_types(
+    mapf_scenario: MAPFScenario, n_carriages: int, length: int
+) -> list[TrainUnitType]:
+    """
+    Creates a train unit type for each agent type of the MAPF scenario, in the
+    order in which the types first appear.
+    """
+    agent_types = dict.fromkeys(
+        agent.type
+        for agent in [*mapf_scenario.incoming_agents, *mapf_scenario.outgoing_agents]
+    )
+    return [
+        TrainUnitType(
+            displayName=agent_type,
+            carriages=n_carriages,
+            length=n_carriages * length,
+            combineDuration=180,
+            splitDuration=120,
+            backNormTime=120,
+            backAdditionTime=16,
+            travelSpeed=0,
+            startUpTime=0,
+            typePrefix=str(agent_type),
+            needsLoco=False,
+            needsElectricity=False,
+        )
+        for agent_type in agent_types
+    ]
+
+
+def merge_train_unit_types(
+    shared_types: Iterable[TrainUnitType], new_types: Iterable[TrainUnitType]
+) -> list[TrainUnitType]:
+    """
+    Adds the new types to the shared types, by display name.
+
+    Raises a ValueError if a new type has the same display name as a shared type
+    but a different definition.
+    """
+    merged = {
+        train_unit_type.displayName: train_unit_type for train_unit_type in shared_types
+    }
+    for train_unit_type in new_types:
+        shared_type = merged.setdefault(train_unit_type.displayName, train_unit_type)
+        if shared_type != train_unit_type:
+            raise ValueError(
+                f"Train unit type {train_unit_type.displayName} is already defined "
+                "differently in the shared train unit types"
+            )
+    return list(merged.values())
+
+
+def write_shared_train_unit_types(tors_scenario: Scenario, train_unit_types_path: Path):
+    """
+    Moves the train unit types of the scenario to a shared TrainUnitTypes json file,
+    which is created if it does not exist yet.
+
+    The file is locked while it is updated, so scenarios of the same layout can be
+    converted in parallel.
+    """
+    with open(train_unit_types_path, "a+") as types_file:
+        fcntl.flock(types_file, fcntl.LOCK_EX)
+        types_file.seek(0)
+        shared = TrainUnitTypes()
+        if content := types_file.read():
+            Parse(content, shared)
+        merged = merge_train_unit_types(shared.types, tors_scenario.trainUnitTypes)
+        types_file.seek(0)
+        types_file.truncate()
+        types_file.write(
+            MessageToJson(
+                TrainUnitTypes(types=merged), including_default_value_fields=True
+            )
+        )
+    del tors_scenario.trainUnitTypes[:]
+
+
+def attach_train_unit_types(tors_scenario: Scenario, train_unit_types_path: Path):
+    """
+    Adds the types from a shared TrainUnitTypes json file that the trains of the
+    scenario use, for consumers that need self-contained scenarios.
+    """
+    with open(train_unit_types_path, "r") as types_file:
+        shared = TrainUnitTypes()
+        Parse(types_file.read(), shared)
+    used = {
+        member.typeDisplayName
+        for group in ["in", "out", "inStanding", "outStanding"]
+        for train in getattr(tors_scenario, group)
+        for member in train.members
+    }
+    tors_scenario.trainUnitTypes.extend(
+        train_unit_type
+        for train_unit_type in shared.types
+        if train_unit_type.displayName in used
+    )
+
+
+def build_tors_scenario(
+    prepared: PreparedScenario,
+    train_unit_types: list[TrainUnitType],
+    time_between_trains: int,
+    total_time: int,
+) -> Scenario:
+    """
+    Creates the TORS scenario for a prepared MAPF scenario.
+    """
+    tors_scenario = Scenario()
+    tors_scenario.trainUnitTypes.extend(train_unit_types)
+    tors_scenario.endTime = total_time
+    # The protobuf definition uses the field name "in" which is a reserved
+    # keyword in python
+    incoming_gate = getattr(tors_scenario, "in")
+    for placement, rank in zip(prepared.incoming, prepared.arrival_ranks):
+        trains = incoming_gate if placement.at_gate else tors_scenario.inStanding
+        trains.append(create_train(placement, rank * time_between_trains))
+    for placement, rank in zip(prepared.outgoing, prepared.departure_ranks):
+        trains = tors_scenario.out if placement.at_gate else tors_scenario.outStanding
+        trains.append(
+            create_train(placement, total_time - rank * time_between_trains)
+        )
+
+    return tors_scenario
+
+
+def mapf_scenario_to_tors(
+    mapf_scenario: MAPFScenario,
+    location: Location,
+    length: int = 100,
+    n_carriages: int = 1,
+    time_between_trains: int = 100,
+    total_time: int | None = None,
+    track_mapping: TrackPartMapping | None = None,
+) -> Scenario:
+    """
+    Converts a MAPF scenario to a TORS scenario on the given location.
+
+    Does not read or write any files, so it can be used to generate scenarios on
+    the fly. Use prepare_scenario and build_tors_scenario directly to convert the
+    same scenario for several parameter combinations. Pass the track mapping of a
+    compressed location to place the trains through it.
+    """
+    # Check if the total time is set, if not, calculate it, if it is, check if it is
+    # possible to fit all the trains in the scenario in the given time
+    total_time = resolve_total_time(
+        len(mapf_scenario.incoming_agents), time_between_trains, total_time
+    )
+    prepared = prepare_scenario(
+        mapf_scenario, LocationIndex.from_location(location, track_mapping)
+    )
+    return build_tors_scenario(
+        prepared,
+        create_train_unit_types(mapf_scenario, n_carriages, length),
+        time_between_trains,
+        total_time,
+    )
 
 
 def main():
+    logging.basicConfig(level=logging.INFO)
+
     parser = ArgumentParser(
         description="Converts .scen.pb files to TORS protobuf/json format."
     )
     parser.add_argument("scenario", help="The .scen.pb file to convert.")
-    parser.add_argument("location", help="The corresponding location .json file.")
+    parser.add_argument(
+        "location", help="The corresponding location .json file.", type=Path
+    )
     parser.add_argument("output", help="The output file to write to.", type=Path)
     parser.add_argument(
         "--length", help="The length of the trains.", default=100, type=int
@@ -296,6 +661,27 @@ def main():
     parser.add_argument(
         "--total-time", help="The total time of the scenario.", default=None, type=int
     )
+    parser.add_argument(
+        "--feasibility",
+        help="Check that the scenario can be solved at all before writing it: 'tag' "
+        "writes the result next to the output, 'reject' does not write infeasible "
+        "scenarios and exits with an error.",
+        choices=["off", "tag", "reject"],
+        default="off",
+    )
+    parser.add_argument(
+        "--train-unit-types",
+        help="Write the train unit types to this shared TrainUnitTypes json file "
+        "instead of the scenario.",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--catalog",
+        help="Record the statistics of the scenario in this instance catalog.",
+        default=None,
+        type=Path,
+    )
     args = parser.parse_args()
 
     scenario_path: Path = args.scenario
@@ -308,86 +694,41 @@ def main():
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Check if the total time is set, if not, calculate it, if it is, check if it is
-    # possible to fit all the trains in the scenario in the given time
-    with open(scenario_path, "rb") as graph_file:
-        mapf_scenario = MAPFScenario()
-        mapf_scenario.ParseFromString(graph_file.read())
-    # Need to multiply by 2 because we need to account for the inbound and outbound
-    rough_total_time = (
-        time_between_trains * len(mapf_scenario.incoming_agents) * 2
-    ) + 500
-    if total_time is None:
-        total_time = rough_total_time
-    elif total_time < rough_total_time:
-        raise ValueError(
-            f"Total time is set to {total_time}, but the scenario probably needs at "
-            "least {rough_total_time} time units to complete."
-        )
-
-    with open(scenario_path, "rb") as graph_file:
+    with open(scenario_path, "rb") as scenario_file:
         mapf_scenario = MAPFScenario()
-        mapf_scenario.ParseFromString(graph_file.read())
-
-    with open(location_path, "r") as location_file:
-        location = Location()
-        Parse(location_file.read(), location)
-
-    # Create all the train unit types
-    tors_train_unit_types = TrainUnitTypes()
-    tors_train_unit_types.types.extend(
-        [
-            TrainUnitType(
-                displayName=agent.type,
-                carriages=n_carriages,
-                length=n_carriages * length,
-                combineDuration=180,
-                splitDuration=120,
-                backNormTime=120,
-                backAdditionTime=16,
-                travelSpeed=0,
-                startUpTime=0,
-                typePrefix=str(agent.type),
-                needsLoco=False,
-                needsElectricity=False,
-            )
-            for agent in mapf_scenario.incoming_agents
-        ]
+        mapf_scenario.ParseFromString(scenario_file.read())
+
+    location = read_location(location_path)
+    # A compressed location has its track mapping next to it
+    track_mapping = read_track_mapping(location_path)
+
+    tors_scenario = mapf_scenario_to_tors(
+        mapf_scenario,
+        location,
+        length=length,
+        n_carriages=n_carriages,
+        time_between_trains=time_between_trains,
+        total_time=total_time,
+        track_mapping=track_mapping,
     )
 
-    tors_scenario = Scenario()
-    for unit_type in tors_train_unit_types.types:
-        tors_scenario.trainUnitTypes.append(unit_type)
-    tors_scenario.endTime = total_time
-    # Convert scenario to dictionary so we can add the incoming trains
-    # because the protobuf definition uses the field name "in" which is a reserved
-    # keyword in python
-    tors_scenario_dict = MessageToDict(
-        tors_scenario, including_default_value_fields=True
-    )
+    if args.feasibility != "off":
+        report = check_feasibility(location, tors_scenario)
+        for problem in report.problems:
+            logger.warning(f"{scenario_path}: {problem}")
+        if args.feasibility == "reject" and not report.feasible:
+            logger.error(f"Not writing infeasible scenario {output_path}")
+            sys.exit(1)
+        if args.feasibility == "tag":
+            output_path.with_name(output_path.name + ".feasibility.json").write_text(
+                report.to_json()
+            )
 
-    arrival_times = calculate_arrival_times(mapf_scenario, time_between_trains)
-    departure_times = calculate_departure_times(
-        mapf_scenario, time_between_trains, total_time
-    )
+    if args.catalog is not None:
+        record_scenario(args.catalog, output_path, tors_scenario, location_path)
 
-    for agent, arrival_time in zip(mapf_scenario.incoming_agents, arrival_times):
-        tors_scenario_dict = add_train(
-            tors_scenario_dict,
-            agent,
-            location,
-            arrival_time,
-            incoming=True,
-        )
-    for agent, departure_time in zip(mapf_scenario.outgoing_agents, departure_times):
-        tors_scenario_dict = add_train(
-            tors_scenario_dict,
-            agent,
-            location,
-            departure_time,
-            incoming=False,
-        )
-    tors_scenario = ParseDict(tors_scenario_dict, Scenario())
+    if args.train_unit_types is not None:
+        write_shared_train_unit_types(tors_scenario, args.train_unit_types)
 
     # write the location to a file as json
     with open(output_path, "w") as output_file:
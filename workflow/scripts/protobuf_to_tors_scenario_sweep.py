@@ -0,0 +1,144 @@
+import itertools
+import logging
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+from google.protobuf.json_format import MessageToJson
+
+if Path(__file__).parent.parent.parent not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    sys.path.append(str(Path(__file__).parent.parent.parent / "protos"))
+else:
+    sys.path.append("protos")
+
+from location_compression import read_location, read_track_mapping
+from protobuf_to_tors_scenario import (
+    LocationIndex,
+    build_tors_scenario,
+    create_train_unit_types,
+    prepare_scenario,
+    resolve_total_time,
+)
+from protos.scenario_mapf_pb2 import Scenario as MAPFScenario
+
+logger = logging.getLogger(__name__)
+
+
+def variant_filename(
+    scenario_path: Path,
+    length: int,
+    n_carriages: int,
+    time_between_trains: int,
+    total_time: int | None,
+) -> str:
+    """
+    Returns the output filename of a single variant of the sweep.
+
+    Example: "x.0r_2a_0_len100_car1_tbt100_ttauto_scenario.json" for
+    "x.0r_2a_0.scen.pb" with an estimated total time.
+    """
+    stem = scenario_path.name.removesuffix(".pb").removesuffix(".scen")
+    total = "auto" if total_time is None else total_time
+    return (
+        f"{stem}_len{length}_car{n_carriages}_tbt{time_between_trains}"
+        f"_tt{total}_scenario.json"
+    )
+
+
+def main():
+    """
+    Converts a .scen.pb file for every combination of the given parameters.
+
+    The MAPF scenario and the location are parsed once, and the train placements
+    and the arrival/departure order are computed once. Only the train unit types
+    and the times are recomputed per variant.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Converts a .scen.pb file to TORS json format for every "
+        "combination of the given parameters."
+    )
+    parser.add_argument("scenario", help="The .scen.pb file to convert.", type=Path)
+    parser.add_argument(
+        "location", help="The corresponding location .json file.", type=Path
+    )
+    parser.add_argument(
+        "output_directory", help="The directory to write the variants to.", type=Path
+    )
+    parser.add_argument(
+        "--length",
+        help="The lengths of the trains.",
+        default=[100],
+        type=int,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--n-carriages",
+        help="The numbers of carriages per train.",
+        default=[1],
+        type=int,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--time-between-trains",
+        help="The times between trains.",
+        default=[100],
+        type=int,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--total-time",
+        help="The total times of the scenario. Estimated if not given.",
+        default=[None],
+        type=int,
+        nargs="+",
+    )
+    args = parser.parse_args()
+
+    scenario_path: Path = args.scenario
+    output_directory: Path = args.output_directory
+    output_directory.mkdir(parents=True, exist_ok=True)
+
+    with open(scenario_path, "rb") as scenario_file:
+        mapf_scenario = MAPFScenario()
+        mapf_scenario.ParseFromString(scenario_file.read())
+
+    location = read_location(args.location)
+    # A compressed location has its track mapping next to it
+    track_mapping = read_track_mapping(args.location)
+
+    prepared = prepare_scenario(
+        mapf_scenario, LocationIndex.from_location(location, track_mapping)
+    )
+    n_incoming_trains = len(mapf_scenario.incoming_agents)
+
+    for length, n_carriages in itertools.product(args.length, args.n_carriages):
+        train_unit_types = create_train_unit_types(mapf_scenario, n_carriages, length)
+        for time_between_trains, total_time in itertools.product(
+            args.time_between_trains, args.total_time
+        ):
+            output_path = output_directory / variant_filename(
+                scenario_path, length, n_carriages, time_between_trains, total_time
+            )
+            try:
+                resolved_total_time = resolve_total_time(
+                    n_incoming_trains, time_between_trains, total_time
+                )
+            except ValueError as e:
+                logger.warning(f"Skipping {output_path.name}: {e}")
+                continue
+
+            tors_scenario = build_tors_scenario(
+                prepared, train_unit_types, time_between_trains, resolved_total_time
+            )
+            with open(output_path, "w") as output_file:
+                output_file.write(
+                    MessageToJson(tors_scenario, including_default_value_fields=True)
+                )
+            logger.info(f"Wrote {output_path}")
+
+
+if __name__ == "__main__":
+    main()
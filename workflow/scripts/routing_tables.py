@@ -0,0 +1,214 @@
+"""
+All-pairs routing tables of a TORS location.
+
+Three tables are computed, indexed by the position of the track parts in
+location.trackParts (track_ids maps positions back to track part ids):
+
+- hops[i, j]: the number of track parts passed to get from i to j, ignoring
+  direction (uint16, UNREACHABLE_HOPS if j cannot be reached).
+- lengths[i, j]: the total length of the track parts entered on the shortest
+  path from i to j, ignoring direction (uint32, UNREACHABLE_LENGTH if j cannot be
+  reached). Track parts can have different lengths, for example after
+  compression, so this path can take more than hops[i, j] steps.
+- next_hop[s, j]: the next track part on a path with the fewest track parts from
+  state s to j for a train that cannot reverse (int32, -1 if j cannot be
+  reached). State 2 * i is a train on track part i moving towards its b side,
+  state 2 * i + 1 one moving towards its a side. A train that enters a track part
+  from its a side moves towards its b side and the other way around.
+
+All tables are computed with searches from all track parts at once: hops and
+next_hop with breadth-first searches, and lengths by shortening paths until none
+gets shorter. The tables are saved as .npy files that can be memory-mapped by
+consumers.
+"""
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from location_arrays import LocationArrays
+
+logger = logging.getLogger(__name__)
+
+UNREACHABLE_HOPS = np.iinfo(np.uint16).max
+UNREACHABLE_LENGTH = np.iinfo(np.uint32).max
+# hops has to be able to hold the longest path
+MAX_TRACK_PARTS = int(UNREACHABLE_HOPS)
+
+TABLE_FILES = ["track_ids", "hops", "lengths", "next_hop"]
+
+
+@dataclass
+class RoutingTables:
+    track_ids: np.ndarray
+    hops: np.ndarray
+    lengths: np.ndarray
+    next_hop: np.ndarray
+
+    def save(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in TABLE_FILES:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "RoutingTables":
+        """
+        Loads saved tables, memory-mapped read-only unless mmap is False.
+        """
+        mmap_mode = "r" if mmap else None
+        return cls(
+            **{
+                name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+                for name in TABLE_FILES
+            }
+        )
+
+
+def _expand(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray):
+    """
+    Returns the positions in nodes and the neighbours of all neighbour pairs.
+    """
+    counts = indptr[nodes + 1] - indptr[nodes]
+    starts = np.repeat(indptr[nodes] - np.cumsum(counts) + counts, counts)
+    return (
+        np.repeat(np.arange(len(nodes)), counts),
+        indices[starts + np.arange(counts.sum())],
+    )
+
+
+def _first_per_key(keys: np.ndarray, *tie_breakers: np.ndarray) -> np.ndarray:
+    """
+    Returns the indices of the first entry for every key, after sorting equal keys
+    by the tie breakers.
+    """
+    if len(keys) == 0:
+        return np.arange(0)
+    order = np.lexsort((*tie_breakers[::-1], keys))
+    sorted_keys = keys[order]
+    return order[np.append(True, sorted_keys[1:] != sorted_keys[:-1])]
+
+
+def all_pairs_distances(arrays: LocationArrays) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the hops and lengths tables.
+    """
+    n = len(arrays)
+    indptr, indices = arrays.undirected_csr()
+
+    hops = np.full((n, n), UNREACHABLE_HOPS, dtype=np.uint16)
+    sources = np.arange(n)
+    nodes = np.arange(n)
+    hops[sources, nodes] = 0
+
+    depth = 0
+    while len(nodes) > 0:
+        depth += 1
+        pairs, neighbors = _expand(indptr, indices, nodes)
+        sources = sources[pairs]
+        new = hops[sources, neighbors] == UNREACHABLE_HOPS
+        sources, nodes = sources[new], neighbors[new]
+        # Several track parts of the previous layer can lead to the same one
+        first = _first_per_key(sources * n + nodes)
+        sources, nodes = sources[first], nodes[first]
+        hops[sources, nodes] = depth
+    return hops, all_pairs_lengths(arrays)
+
+
+def all_pairs_lengths(arrays: LocationArrays) -> np.ndarray:
+    """
+    Returns the lengths table.
+
+    Every round extends the paths that got shorter in the previous round by one
+    track part, and keeps the extensions that are shorter than the known paths.
+    The lengths are not negative, so this stops once all paths are shortest.
+    """
+    n = len(arrays)
+    indptr, indices = arrays.undirected_csr()
+    track_lengths = np.rint(arrays.lengths).astype(np.int64)
+
+    lengths = np.full((n, n), UNREACHABLE_LENGTH, dtype=np.uint32)
+    sources = np.arange(n)
+    nodes = np.arange(n)
+    lengths[sources, nodes] = 0
+
+    while len(nodes) > 0:
+        pairs, neighbors = _expand(indptr, indices, nodes)
+        sources, nodes = sources[pairs], nodes[pairs]
+        path_lengths = (
+            lengths[sources, nodes].astype(np.int64) + track_lengths[neighbors]
+        )
+        shorter = path_lengths < lengths[sources, neighbors]
+        sources, nodes = sources[shorter], neighbors[shorter]
+        path_lengths = path_lengths[shorter]
+        # Keep the shortest extension to every track part
+        first = _first_per_key(sources * n + nodes, path_lengths)
+        sources, nodes = sources[first], nodes[first]
+        lengths[sources, nodes] = path_lengths[first]
+    return lengths
+
+
+def directed_state_edges(arrays: LocationArrays) -> np.ndarray:
+    """
+    Returns the (m, 2) edges between train states, see the module docstring.
+    """
+    n = len(arrays)
+    a_edges = arrays.a_edges()
+    b_edges = arrays.b_edges()
+    a_keys = a_edges[:, 0] * n + a_edges[:, 1]
+    b_keys = b_edges[:, 0] * n + b_edges[:, 1]
+
+    edges = []
+    # Leaving track part i via its b side (state 2i) or a side (state 2i + 1)
+    for side_edges, from_offset in [(b_edges, 0), (a_edges, 1)]:
+        tracks, neighbors = side_edges[:, 0], side_edges[:, 1]
+        back_keys = neighbors * n + tracks
+        from_states = 2 * tracks + from_offset
+        # Entering the neighbour from its a side means moving towards its b side
+        enters_a = np.isin(back_keys, a_keys)
+        edges.append(np.stack([from_states[enters_a], 2 * neighbors[enters_a]], 1))
+        enters_b = np.isin(back_keys, b_keys)
+        edges.append(np.stack([from_states[enters_b], 2 * neighbors[enters_b] + 1], 1))
+    return np.concatenate(edges).reshape(-1, 2)
+
+
+def next_hop_table(arrays: LocationArrays) -> np.ndarray:
+    """
+    Returns the next_hop table, by searching backwards from every target.
+    """
+    n = len(arrays)
+    edges = directed_state_edges(arrays)
+    # Predecessors of every state
+    edges = edges[np.lexsort((edges[:, 0], edges[:, 1]))]
+    indptr = np.searchsorted(edges[:, 1], np.arange(2 * n + 1))
+    predecessors = edges[:, 0]
+
+    next_hop = np.full((2 * n, n), -1, dtype=np.int32)
+    targets = np.repeat(np.arange(n), 2)
+    states = np.arange(2 * n)
+    next_hop[states, targets] = targets
+
+    while len(states) > 0:
+        pairs, previous = _expand(indptr, predecessors, states)
+        targets, via = targets[pairs], states[pairs] // 2
+        new = next_hop[previous, targets] < 0
+        targets, previous, via = targets[new], previous[new], via[new]
+        first = _first_per_key(targets * 2 * n + previous, via)
+        targets, states = targets[first], previous[first]
+        next_hop[states, targets] = via[first]
+    return next_hop
+
+
+def compute_routing_tables(arrays: LocationArrays) -> RoutingTables:
+    if len(arrays) > MAX_TRACK_PARTS:
+        raise ValueError(
+            f"Routing tables are limited to {MAX_TRACK_PARTS} track parts, the "
+            f"location has {len(arrays)}"
+        )
+    hops, lengths = all_pairs_distances(arrays)
+    next_hop = next_hop_table(arrays)
+    logger.debug(
+        "Computed routing tables of %d track parts (%d bytes)",
+        len(arrays),
+        hops.nbytes + lengths.nbytes + next_hop.nbytes,
+    )
+    return RoutingTables(arrays.ids.copy(), hops, lengths, next_hop)
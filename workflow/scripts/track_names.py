@@ -0,0 +1,125 @@
+"""
+Parses structured track names into integer fields.
+
+The MAPF graphs name their nodes "g-<gate number>" for gates and
+"b-<branch number>-p-<position in branch>" for branch tracks. The location
+conversion derives more names from these: "<name>.<i>" for the parts a node is
+split into by reduce_degree, "bumper-<name>" for bumpers and "end-<name>" for
+the exit track of carrousel yards. Names are parsed once into arrays, so that
+computations over them are array operations instead of repeated string splits.
+"""
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from enum import IntEnum
+
+import numpy as np
+
+
+class TrackKind(IntEnum):
+    OTHER = 0
+    GATE = 1
+    BRANCH = 2
+    BUMPER = 3
+    END = 4
+
+
+_TRACK_NAME = re.compile(
+    r"(?:(?P<prefix>bumper|end)-)?"
+    # The bumper of an end track is "bumper-end-<name>"
+    r"(?:end-)?"
+    r"(?:g-(?P<gate>\d+)|b-(?P<branch>\d+)-p-(?P<position>\d+))"
+    r"(?:\.(?P<split>\d+))?"
+)
+_PREFIX_KINDS = {"bumper": TrackKind.BUMPER, "end": TrackKind.END}
+
+
+@dataclass
+class TrackNames:
+    """
+    Integer fields of a sequence of track names.
+
+    Fields that do not apply to a name are -1. Bumpers and end tracks keep the
+    fields of the track they are attached to, so "bumper-b-1-p-3" has kind BUMPER,
+    branch 1 and position 3.
+    """
+
+    names: list[str]
+    kind: np.ndarray
+    gate: np.ndarray
+    branch: np.ndarray
+    position: np.ndarray
+    # The index i of a "<name>.<i>" part created by reduce_degree
+    split: np.ndarray
+
+    @classmethod
+    def parse(cls, names: Iterable[str]) -> "TrackNames":
+        names = list(names)
+        fields = np.full((len(names), 5), -1, dtype=np.int32)
+        for i, name in enumerate(names):
+            match = _TRACK_NAME.fullmatch(name)
+            if match is None:
+                fields[i, 0] = TrackKind.OTHER
+                continue
+            prefix, gate, branch, position, split = match.groups()
+            if prefix is not None:
+                fields[i, 0] = _PREFIX_KINDS[prefix]
+            else:
+                fields[i, 0] = TrackKind.GATE if gate is not None else TrackKind.BRANCH
+            if gate is not None:
+                fields[i, 1] = int(gate)
+            else:
+                fields[i, 2] = int(branch)
+                fields[i, 3] = int(position)
+            if split is not None:
+                fields[i, 4] = int(split)
+
+        return cls(
+            names=names,
+            kind=fields[:, 0].astype(np.int8),
+            gate=fields[:, 1].copy(),
+            branch=fields[:, 2].copy(),
+            position=fields[:, 3].copy(),
+            split=fields[:, 4].copy(),
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def is_gate(self) -> np.ndarray:
+        """Gates, including the parts of split gates."""
+        return self.kind == TrackKind.GATE
+
+    @property
+    def is_branch(self) -> np.ndarray:
+        """Branch tracks, including the parts of split branch tracks."""
+        return self.kind == TrackKind.BRANCH
+
+    def gates_in_order(self) -> np.ndarray:
+        """
+        Returns the indices of the (unsplit) gates, ordered by gate number.
+
+        Gates with the same number keep their original order.
+        """
+        gates = np.flatnonzero(self.is_gate & (self.split < 0))
+        return gates[np.argsort(self.gate[gates], kind="stable")]
+
+    def branch_ends(self) -> np.ndarray:
+        """
+        Returns the index of the track with the highest position of each branch,
+        ordered by branch number.
+
+        Parts of split branch tracks are ignored.
+        """
+        tracks = np.flatnonzero(self.is_branch & (self.split < 0))
+        if len(tracks) == 0:
+            return tracks
+        # Sort by branch, then position; the last track of each branch is its end.
+        # Reversing first makes the first track in the original order win ties.
+        tracks = tracks[::-1]
+        order = np.lexsort((self.position[tracks], self.branch[tracks]))
+        tracks = tracks[order]
+        branches = self.branch[tracks]
+        is_last = np.append(branches[1:] != branches[:-1], True)
+        return tracks[is_last]
@@ -0,0 +1,289 @@
+"""
+Draws TORS locations as schematic track diagrams.
+
+Track parts named after the generator's structure ("g-<n>" and
+"b-<branch>-p-<position>", see track_names) are placed on a grid directly from
+their names: gates in a row on the left, one row per branch. Track parts with
+other names are laid out in breadth-first layers below that. Both are linear in
+the size of the location, so yards with tens of thousands of track parts are
+drawn in seconds.
+"""
+import json
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from track_names import TrackKind, TrackNames
+
+logger = logging.getLogger(__name__)
+
+# Offsets of the parts of split track parts, bumpers and end tracks from the track
+# part they belong to
+SPLIT_OFFSET = np.array([0.25, 0.3])
+BUMPER_OFFSET = np.array([0.6, 0.0])
+END_OFFSET = np.array([0.5, 0.5])
+
+TYPE_COLORS = {
+    "RailRoad": "#4c72b0",
+    "Switch": "#dd8452",
+    "Bumper": "#c44e52",
+}
+DEFAULT_COLOR = "#8c8c8c"
+
+
+@dataclass
+class LocationDrawing:
+    names: list[str]
+    types: list[str]
+    # (n, 2) coordinates, y pointing down
+    positions: np.ndarray
+    # (m, 2) indices of connected track parts, each connection once
+    edges: np.ndarray
+
+
+def read_location_json(location_path: Path) -> tuple[list[str], list[str], np.ndarray]:
+    """
+    Reads the names, types and connections of the track parts of a location json.
+
+    Uses plain json instead of the protobuf parser, which is much slower for large
+    locations.
+    """
+    with open(location_path, "r") as location_file:
+        track_parts = json.load(location_file)["trackParts"]
+    names = [track_part["name"] for track_part in track_parts]
+    types = [track_part["type"] for track_part in track_parts]
+    index = {int(track_part["id"]): i for i, track_part in enumerate(track_parts)}
+    pairs = [
+        (i, index[int(neighbor)])
+        for i, track_part in enumerate(track_parts)
+        for neighbor in (*track_part["aSide"], *track_part["bSide"])
+        if int(neighbor) in index
+    ]
+    edges = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    return names, types, edges
+
+
+def _breadth_first_layers(n: int, edges: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """
+    Returns the breadth-first depth of the given nodes in the subgraph they induce,
+    starting a new search from the first unvisited node of every component.
+    """
+    in_subgraph = np.zeros(n, dtype=bool)
+    in_subgraph[nodes] = True
+    sub_edges = edges[in_subgraph[edges[:, 0]] & in_subgraph[edges[:, 1]]]
+    both = np.concatenate([sub_edges, sub_edges[:, ::-1]])
+    both = both[np.argsort(both[:, 0], kind="stable")]
+    indptr = np.searchsorted(both[:, 0], np.arange(n + 1))
+    neighbors = both[:, 1]
+
+    depth = np.full(n, -1, dtype=np.int64)
+    offset = 0
+    for start in nodes:
+        if depth[start] >= 0:
+            continue
+        depth[start] = offset
+        frontier = np.array([start])
+        while len(frontier) > 0:
+            starts, ends = indptr[frontier], indptr[frontier + 1]
+            lengths = ends - starts
+            gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            candidates = neighbors[gather + np.arange(lengths.sum())]
+            candidates = np.unique(candidates[depth[candidates] < 0])
+            depth[candidates] = depth[frontier[0]] + 1
+            frontier = candidates
+        # Place the next component after this one
+        offset = depth[nodes][depth[nodes] >= 0].max() + 2
+    return depth[nodes]
+
+
+def schematic_layout(names: list[str], edges: np.ndarray) -> np.ndarray:
+    """
+    Returns an (n, 2) array of coordinates for the track parts with the given names.
+    """
+    parsed = TrackNames.parse(names)
+    n = len(parsed)
+    positions = np.zeros((n, 2))
+
+    # Coordinates of the track part a name refers to (before any split, bumper or
+    # end prefix): branches in rows, gates in a row to the left of the branches.
+    structured = parsed.kind != TrackKind.OTHER
+    is_gate_name = parsed.gate >= 0
+    max_gate = parsed.gate.max(initial=0)
+    positions[:, 0] = np.where(
+        is_gate_name, parsed.gate - max_gate - 1, parsed.position
+    )
+    positions[:, 1] = np.where(is_gate_name, 0, parsed.branch)
+
+    is_split = parsed.split >= 0
+    positions[is_split] += SPLIT_OFFSET * (parsed.split[is_split, None] + 1)
+    positions[parsed.kind == TrackKind.BUMPER] += np.where(
+        is_gate_name[parsed.kind == TrackKind.BUMPER, None],
+        -BUMPER_OFFSET,
+        BUMPER_OFFSET,
+    )
+    positions[parsed.kind == TrackKind.END] += END_OFFSET
+
+    # Everything else in breadth-first layers below the structured track parts
+    unstructured = np.flatnonzero(~structured)
+    if len(unstructured) > 0:
+        depth = _breadth_first_layers(n, edges, unstructured)
+        order = np.lexsort((unstructured, depth))
+        layer_starts = np.searchsorted(depth[order], depth[order], side="left")
+        rank = np.empty(len(unstructured), dtype=np.int64)
+        rank[order] = np.arange(len(unstructured)) - layer_starts
+        below = positions[structured, 1].max(initial=-2) + 2
+        positions[unstructured, 0] = depth
+        positions[unstructured, 1] = below + rank
+
+    return positions
+
+
+def draw_location(location_path: Path) -> LocationDrawing:
+    names, types, edges = read_location_json(location_path)
+    return LocationDrawing(names, types, schematic_layout(names, edges), edges)
+
+
+def render_svg(
+    drawing: LocationDrawing,
+    output_path: Path,
+    scale: float = 40,
+    labels: bool | None = None,
+):
+    """
+    Writes the drawing as an SVG file.
+
+    Labels are drawn for locations with at most 500 track parts unless specified.
+    """
+    if labels is None:
+        labels = len(drawing.names) <= 500
+    margin = scale
+    origin = drawing.positions.min(axis=0) if len(drawing.names) else np.zeros(2)
+    points = (drawing.positions - origin) * scale + margin
+    width, height = points.max(axis=0, initial=0) + margin
+
+    lines = [
+        (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" '
+            f'height="{height:.0f}" viewBox="0 0 {width:.0f} {height:.0f}">'
+        ),
+        '<rect width="100%" height="100%" fill="white"/>',
+        '<g stroke="#333333" stroke-width="2">',
+    ]
+    segments = points[drawing.edges].reshape(-1, 4)
+    lines.extend(
+        f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}"/>'
+        for x1, y1, x2, y2 in segments
+    )
+    lines.append("</g>")
+    lines.append('<g stroke="none">')
+    lines.extend(
+        f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{scale / 8:.1f}" '
+        f'fill="{TYPE_COLORS.get(track_type, DEFAULT_COLOR)}">'
+        f"<title>{name} ({track_type})</title></circle>"
+        for (x, y), name, track_type in zip(points, drawing.names, drawing.types)
+    )
+    lines.append("</g>")
+    if labels:
+        lines.append(f'<g font-family="sans-serif" font-size="{scale / 4:.0f}">')
+        lines.extend(
+            f'<text x="{x:.1f}" y="{y - scale / 6:.1f}" text-anchor="middle">{name}</text>'
+            for (x, y), name in zip(points, drawing.names)
+        )
+        lines.append("</g>")
+    lines.append("</svg>")
+    output_path.write_text("\n".join(lines))
+
+
+def render_png(drawing: LocationDrawing, output_path: Path, dpi: int = 100):
+    """
+    Writes the drawing as a PNG file. Requires matplotlib.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    extent = np.ptp(drawing.positions, axis=0) if len(drawing.names) else np.ones(2)
+    figure, axes = plt.subplots(
+        figsize=(max(4, min(extent[0] / 2, 200)), max(3, min(extent[1] / 2, 200)))
+    )
+    axes.add_collection(
+        LineCollection(drawing.positions[drawing.edges], colors="#333333", zorder=1)
+    )
+    colors = [
+        TYPE_COLORS.get(track_type, DEFAULT_COLOR) for track_type in drawing.types
+    ]
+    axes.scatter(*drawing.positions.T, c=colors, s=12, zorder=2)
+    axes.invert_yaxis()
+    axes.set_aspect("equal")
+    axes.axis("off")
+    figure.savefig(output_path, dpi=dpi, bbox_inches="tight")
+    plt.close(figure)
+
+
+def render_location(location_path: Path, output_path: Path):
+    drawing = draw_location(location_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix == ".png":
+        render_png(drawing, output_path)
+    else:
+        render_svg(drawing, output_path)
+    logger.info(f"Drew {len(drawing.names)} track parts to {output_path}")
+
+
+def main():
+    """
+    Draws location json files, or all location json files in directories.
+
+    Example:
+
+        python workflow/scripts/visualize_location.py tors_instances/1b drawings
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(description="Draws TORS locations as schematic diagrams.")
+    parser.add_argument(
+        "locations",
+        help="Location json files, or directories to search for *_location.json files.",
+        type=Path,
+        nargs="+",
+    )
+    parser.add_argument(
+        "output_directory", help="The directory to write the drawings to.", type=Path
+    )
+    parser.add_argument(
+        "--format", help="The image format.", choices=["svg", "png"], default="svg"
+    )
+    parser.add_argument(
+        "--jobs", help="The number of processes to draw with.", default=1, type=int
+    )
+    args = parser.parse_args()
+
+    jobs = []
+    for path in args.locations:
+        if path.is_dir():
+            for location_path in sorted(path.rglob("*_location.json")):
+                relative = location_path.relative_to(path)
+                jobs.append((location_path, args.output_directory / relative))
+        else:
+            jobs.append((path, args.output_directory / path.name))
+    jobs = [
+        (location_path, output_path.with_suffix(f".{args.format}"))
+        for location_path, output_path in jobs
+    ]
+
+    if args.jobs > 1 and jobs:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            list(executor.map(render_location, *zip(*jobs)))
+    else:
+        for location_path, output_path in jobs:
+            render_location(location_path, output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+
+from instance_conversion import (
+    GENERATOR_INSTANCES,
+    TORS_INSTANCES,
+    ConversionSettings,
+    LocationCache,
+    convert_graph_file,
+    convert_scenario,
+    location_output_path,
+    read_scenario_file,
+    scenario_graph_path,
+    scenario_output_path,
+    write_location,
+    write_scenario,
+)
+
+logger = logging.getLogger(__name__)
+
+WATCHED_SUFFIXES = (".graph", ".scen")
+
+
+@dataclass
+class FileState:
+    mtime_ns: int
+    size: int
+
+
+class ConversionWatcher:
+    """
+    Watches the instance generator's output directory and converts new and changed
+    .graph and .scen files.
+
+    Changes are collected until the directory has been quiet for the debounce time
+    (or until max_delay has passed since the first pending change), and are then
+    converted graphs first. Converted locations are kept in memory, so converting
+    a scenario of a layout that was seen before only places its trains.
+
+    Every converted file is announced as a json line on the ready socket, and
+    optionally with a "<output>.ready" marker file.
+    """
+
+    def __init__(
+        self,
+        instances_root: Path,
+        output_root: Path,
+        settings: ConversionSettings,
+        ready_socket: Path | None = None,
+        marker_files: bool = False,
+        interval: float = 0.5,
+        debounce: float = 2.0,
+        max_delay: float = 30.0,
+        cache_size: int = 64,
+    ):
+        self.instances_root = instances_root
+        self.output_root = output_root
+        self.settings = settings
+        self.ready_socket = ready_socket
+        self.marker_files = marker_files
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.locations = LocationCache(cache_size)
+
+        self._known: dict[Path, FileState] = {}
+        # Files to convert, with the time they last changed
+        self._pending: dict[Path, float] = {}
+        self._first_pending: float | None = None
+        self._last_change: float | None = None
+        self._clients: set[asyncio.StreamWriter] = set()
+
+    def output_path(self, path: Path) -> Path:
+        if path.suffix == ".graph":
+            return location_output_path(path, self.instances_root, self.output_root)
+        return scenario_output_path(path, self.instances_root, self.output_root)
+
+    def scan(self) -> dict[Path, FileState]:
+        files = {}
+        for directory, _, filenames in os.walk(self.instances_root):
+            for filename in filenames:
+                if not filename.endswith(WATCHED_SUFFIXES):
+                    continue
+                path = Path(directory) / filename
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files[path] = FileState(stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def is_up_to_date(self, path: Path, state: FileState) -> bool:
+        try:
+            return self.output_path(path).stat().st_mtime_ns >= state.mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def poll(self, initial: bool = False):
+        """
+        Scans the directory and marks new and changed files as pending.
+
+        On the initial scan, only files without an up to date output are pending.
+        """
+        now = time.monotonic()
+        for path, state in self.scan().items():
+            if self._known.get(path) == state:
+                continue
+            self._known[path] = state
+            if initial and self.is_up_to_date(path, state):
+                continue
+            self._pending[path] = now
+            self._last_change = now
+            if self._first_pending is None:
+                self._first_pending = now
+
+    def take_ready_batch(self) -> list[Path]:
+        """
+        Returns the pending files if the current burst of changes is over.
+        """
+        if not self._pending:
+            return []
+        now = time.monotonic()
+        quiet = now - self._last_change >= self.debounce
+        overdue = now - self._first_pending >= self.max_delay
+        if not (quiet or overdue):
+            return []
+        batch = sorted(self._pending, key=lambda path: (path.suffix != ".graph", path))
+        self._pending.clear()
+        self._first_pending = None
+        return batch
+
+    def cached_location(self, graph_path: Path):
+        state = self._known.get(graph_path)
+        if state is None:
+            stat = graph_path.stat()
+            state = FileState(stat.st_mtime_ns, stat.st_size)
+        return self.locations.get_or_convert(
+            (graph_path, state.mtime_ns),
+            lambda: convert_graph_file(graph_path, self.settings),
+        )
+
+    def convert(self, path: Path) -> Path:
+        """
+        Converts a single .graph or .scen file and returns the output path.
+        """
+        output_path = self.output_path(path)
+        if path.suffix == ".graph":
+            write_location(self.cached_location(path).location, output_path)
+        else:
+            cached_location = self.cached_location(scenario_graph_path(path))
+            tors_scenario = convert_scenario(
+                read_scenario_file(path), cached_location, self.settings
+            )
+            write_scenario(tors_scenario, output_path)
+        if self.marker_files:
+            output_path.with_name(output_path.name + ".ready").touch()
+        return output_path
+
+    async def announce(self, message: dict):
+        line = (json.dumps(message) + "\n").encode()
+        for writer in list(self._clients):
+            try:
+                writer.write(line)
+                await writer.drain()
+            except ConnectionError:
+                self._clients.discard(writer)
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self._clients.add(writer)
+        try:
+            # Clients only listen; wait until they disconnect
+            await reader.read()
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def convert_batch(self, batch: list[Path]):
+        for path in batch:
+            if path.suffix == ".scen" and not scenario_graph_path(path).exists():
+                # The generator has not written the graph yet
+                self._pending[path] = time.monotonic()
+                continue
+            start = time.perf_counter()
+            try:
+                # Convert in a thread, so clients can connect in the meantime
+                output_path = await asyncio.to_thread(self.convert, path)
+            except Exception:
+                logger.exception(f"Could not convert {path}")
+                await self.announce({"event": "failed", "input": str(path)})
+                continue
+            elapsed = time.perf_counter() - start
+            logger.info(f"Converted {path} to {output_path} in {elapsed:.3f}s")
+            await self.announce(
+                {
+                    "event": "ready",
+                    "kind": "location" if path.suffix == ".graph" else "scenario",
+                    "input": str(path),
+                    "output": str(output_path),
+                }
+            )
+        if self._pending and self._first_pending is None:
+            self._first_pending = time.monotonic()
+
+    async def run(self):
+        server = None
+        if self.ready_socket is not None:
+            self.ready_socket.unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(
+                self._handle_client, path=str(self.ready_socket)
+            )
+            logger.info(f"Announcing converted instances on {self.ready_socket}")
+
+        logger.info(f"Watching {self.instances_root}")
+        self.poll(initial=True)
+        try:
+            while True:
+                if batch := self.take_ready_batch():
+                    await self.convert_batch(batch)
+                await asyncio.sleep(self.interval)
+                self.poll()
+        finally:
+            if server is not None:
+                server.close()
+                self.ready_socket.unlink(missing_ok=True)
+
+
+def main():
+    """
+    Watches the instance generator's output and converts instances as they arrive.
+
+    Example of waiting for instances from a shell:
+
+        socat - UNIX-CONNECT:/tmp/tors-ready.sock
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = ArgumentParser(
+        description="Watches a directory for .graph and .scen files and converts "
+        "them to TORS json files as they arrive."
+    )
+    parser.add_argument(
+        "--instances",
+        help="The directory the instance generator writes to.",
+        default=GENERATOR_INSTANCES,
+        type=Path,
+    )
+    parser.add_argument(
+        "--output",
+        help="The directory to write the TORS instances to.",
+        default=TORS_INSTANCES,
+        type=Path,
+    )
+    parser.add_argument(
+        "--ready-socket",
+        help="Unix socket on which a json line is sent for every converted file.",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--marker-files",
+        help="Also write a '<output>.ready' file next to every converted file.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--interval", help="Seconds between scans.", default=0.5, type=float
+    )
+    parser.add_argument(
+        "--debounce",
+        help="Seconds without changes before a burst of files is converted.",
+        default=2.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--max-delay",
+        help="Maximum seconds a changed file waits for the burst to end.",
+        default=30.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--cache-size", help="Number of locations to keep.", default=64, type=int
+    )
+    parser.add_argument(
+        "--length", help="The length of the track parts.", default=100, type=int
+    )
+    parser.add_argument(
+        "--train-length", help="The length of the trains.", default=100, type=int
+    )
+    parser.add_argument(
+        "--n-carriages", help="The number of carriages per train.", default=1, type=int
+    )
+    parser.add_argument(
+        "--time-between-trains", help="The time between trains.", default=100, type=int
+    )
+    args = parser.parse_args()
+
+    settings = ConversionSettings(
+        track_length=args.length,
+        train_length=args.train_length,
+        n_carriages=args.n_carriages,
+        time_between_trains=args.time_between_trains,
+    )
+    watcher = ConversionWatcher(
+        args.instances,
+        args.output,
+        settings,
+        ready_socket=args.ready_socket,
+        marker_files=args.marker_files,
+        interval=args.interval,
+        debounce=args.debounce,
+        max_delay=args.max_delay,
+        cache_size=args.cache_size,
+    )
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
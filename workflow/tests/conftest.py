@@ -0,0 +1,121 @@
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).parent.parent.parent
+SCRIPTS = REPO / "workflow" / "scripts"
+
+for path in [SCRIPTS, REPO, REPO / "protos"]:
+    if str(path) not in sys.path:
+        sys.path.append(str(path))
+
+# A shuffleboard yard with four gates, a switch of degree 4 and three branches
+SHUFFLEBOARD_GRAPH = """type graph
+nodes 11
+map
+g-1 g-2
+g-2 g-1 g-3
+g-3 g-2 g-4
+g-4 g-3 b-1-p-1 b-2-p-1 b-3-p-1
+b-1-p-1 g-4 b-1-p-2
+b-1-p-2 b-1-p-1 b-1-p-3
+b-1-p-3 b-1-p-2
+b-2-p-1 g-4 b-2-p-2
+b-2-p-2 b-2-p-1
+b-3-p-1 g-4 b-3-p-2
+b-3-p-2 b-3-p-1
+"""
+SHUFFLEBOARD_SCENARIO = """version 1 graph
+shuf.0r.graph
+agents 3
+types
+typeA a1 a2
+typeB a3
+agents starts
+a1 g-1
+a2 g-3
+a3 b-1-p-2
+goals
+typeA g-2
+typeB b-2-p-2
+typeA g-4
+"""
+# A carrousel yard, whose lowest branch gets an end track
+CARROUSEL_GRAPH = """type graph
+nodes 12
+map
+g-1 g-2
+g-2 g-1 g-3
+g-3 g-2 b-1-p-1
+b-1-p-1 g-3 b-1-p-2 b-2-p-1
+b-1-p-2 b-1-p-1 b-1-p-3
+b-1-p-3 b-1-p-2 b-1-p-4
+b-1-p-4 b-1-p-3 b-2-p-3 b-3-p-2
+b-2-p-1 b-1-p-1 b-2-p-2
+b-2-p-2 b-2-p-1 b-2-p-3
+b-2-p-3 b-2-p-2 b-1-p-4 b-3-p-1
+b-3-p-1 b-2-p-3 b-3-p-2
+b-3-p-2 b-3-p-1 b-1-p-4
+"""
+CARROUSEL_SCENARIO = """version 1 graph
+car.0r.graph
+agents 4
+types
+t1 a1 a2
+t2 a3 a4
+agents starts
+a1 g-1
+a2 b-1-p-2
+a3 g-2
+a4 b-2-p-2
+goals
+t1 g-2
+t2 b-2-p-2
+t1 b-1-p-3
+t2 g-1
+"""
+# Per layout name, the graph and the scenarios by name
+LAYOUTS = {
+    "shuf": (SHUFFLEBOARD_GRAPH, {"shuf.0r_3a_0": SHUFFLEBOARD_SCENARIO}),
+    "car": (CARROUSEL_GRAPH, {"car.0r_4a_0": CARROUSEL_SCENARIO}),
+}
+
+
+@pytest.fixture(params=sorted(LAYOUTS))
+def layout(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def mapf_graph(layout):
+    from mapf_to_protobuf_graph import read_graph
+
+    graph_text, _ = LAYOUTS[layout]
+    return read_graph(io.StringIO(graph_text))
+
+
+@pytest.fixture
+def mapf_scenario(layout):
+    from mapf_to_protobuf_scenario import read_scenario
+
+    _, scenarios = LAYOUTS[layout]
+    (scenario_text,) = scenarios.values()
+    return read_scenario(io.StringIO(scenario_text))
+
+
+@pytest.fixture
+def instances(tmp_path: Path) -> Path:
+    """
+    A generator output tree with every layout in the experiments 1a and 2a.
+    """
+    root = tmp_path / "instances"
+    for experiment in ["1a", "2a"]:
+        for name, (graph_text, scenarios) in LAYOUTS.items():
+            layout_directory = root / experiment / f"{name}.0r"
+            layout_directory.mkdir(parents=True)
+            (layout_directory / f"{name}.0r.graph").write_text(graph_text)
+            for scenario_name, scenario_text in scenarios.items():
+                (layout_directory / f"{scenario_name}.scen").write_text(scenario_text)
+    return root
@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+from batch_convert import (
+    convert_shard,
+    discover_layouts,
+    latest_n_shards,
+    manifest_path,
+    merge_manifests,
+    read_manifests,
+    shard_of,
+)
+from instance_conversion import ConversionSettings
+
+
+def convert(instances: Path, output: Path, n_shards: int) -> list[dict]:
+    return [
+        convert_shard(instances, output, ConversionSettings(), index, n_shards)
+        for index in range(n_shards)
+    ]
+
+
+def test_every_layout_is_on_one_shard(instances):
+    keys = [layout.key for layout in discover_layouts(instances)]
+
+    assert len(keys) == 4
+    for n_shards in [1, 2, 3]:
+        assert all(0 <= shard_of(key, n_shards) < n_shards for key in keys)
+    # The shard only depends on the key, not on the process
+    assert shard_of("1a/shuf.0r", 3) == 2
+
+
+def test_shards_cover_every_instance(instances, tmp_path: Path):
+    output = tmp_path / "tors_instances"
+    manifests = convert(instances, output, 3)
+
+    merged, problems = merge_manifests(manifests, instances, output)
+
+    assert problems == []
+    assert merged["complete"]
+    assert merged["n_shards"] == 3
+    # A location and a scenario per layout
+    assert len(merged["instances"]) == 8
+    assert all((output / entry["output"]).exists() for entry in merged["instances"])
+
+
+def test_manifests_of_earlier_runs_are_ignored(instances, tmp_path: Path):
+    output = tmp_path / "tors_instances"
+    convert(instances, output, 3)
+    convert(instances, output, 2)
+    # The manifests of the first run are older
+    for index in range(3):
+        os.utime(manifest_path(output, index, 3), (0, 0))
+
+    assert latest_n_shards(output) == 2
+    manifests = read_manifests(output, 2)
+    assert len(manifests) == 2
+    merged, problems = merge_manifests(read_manifests(output), instances, output, 2)
+    assert problems == []
+    assert merged["n_shards"] == 2
+    assert len(merged["instances"]) == 8
+
+    _, problems = merge_manifests(read_manifests(output), instances, output)
+    assert "Manifests disagree on the number of shards: [2, 3]" in problems
+
+
+def test_missing_shards_are_reported(instances, tmp_path: Path):
+    output = tmp_path / "tors_instances"
+    manifests = convert(instances, output, 3)
+
+    merged, problems = merge_manifests(manifests[1:2], instances, output, 3)
+
+    assert "Missing the manifests of shards [0, 2] of 3" in problems
+    assert not merged["complete"]
+    _, problems = merge_manifests(manifests + manifests[:1], instances, output, 3)
+    assert "Shard 0 of 3 has 2 manifests" in problems
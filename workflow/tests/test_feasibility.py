@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+from feasibility import check_feasibility
+from protobuf_to_tors_location import graph_to_location
+from protobuf_to_tors_scenario import mapf_scenario_to_tors
+from protos.Location_pb2 import TrackPartType
+
+# The shuffleboard scenario converts to a feasible one
+pytestmark = pytest.mark.parametrize("layout", ["shuf"])
+
+
+@pytest.fixture
+def location(mapf_graph):
+    return graph_to_location(mapf_graph)
+
+
+@pytest.fixture
+def scenario(mapf_scenario, location):
+    return mapf_scenario_to_tors(mapf_scenario, location)
+
+
+def problem_with(report, text: str) -> bool:
+    return any(text in problem for problem in report.problems)
+
+
+def test_converted_scenario_is_feasible(location, scenario):
+    report = check_feasibility(location, scenario)
+
+    assert report.feasible, report.problems
+    assert report.stats["incoming_trains"] == 3
+    assert report.stats["peak_length_in_yard"] == 300
+
+
+def test_trains_longer_than_the_tracks(location, scenario):
+    for unit_type in scenario.trainUnitTypes:
+        unit_type.length = 1000
+
+    report = check_feasibility(location, scenario)
+
+    assert not report.feasible
+    assert problem_with(report, "parking capacity")
+    assert problem_with(report, "longer than the longest parking track")
+
+
+def test_unknown_track_parts(location, scenario):
+    getattr(scenario, "in")[0].parkingTrackPart = 9999
+
+    assert problem_with(
+        check_feasibility(location, scenario), "refer to unknown track parts"
+    )
+
+
+def test_standing_train_on_a_bumper(location, scenario):
+    bumper = next(
+        track_part
+        for track_part in location.trackParts
+        if track_part.type == TrackPartType.Bumper
+    )
+    scenario.inStanding[0].parkingTrackPart = bumper.id
+
+    assert problem_with(check_feasibility(location, scenario), "parked on a bumper")
+
+
+def test_gate_trains_at_the_same_time(location, scenario):
+    incoming = getattr(scenario, "in")
+    incoming[1].time = incoming[0].time
+
+    assert problem_with(
+        check_feasibility(location, scenario), "use the same gate at the same time"
+    )
+
+
+def test_times_outside_the_scenario(location, scenario):
+    scenario.endTime = getattr(scenario, "in")[0].time
+
+    assert problem_with(check_feasibility(location, scenario), "outside")
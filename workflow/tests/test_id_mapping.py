@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+from id_mapping import IdMapping, Origin
+from location_compression import compress_chains
+from protobuf_to_tors_location import graph_to_location
+
+
+def track_names(location, parts: list[tuple[int, Origin]]) -> list[tuple[str, Origin]]:
+    names = {track_part.id: track_part.name for track_part in location.trackParts}
+    return [(names[tors_id], origin) for tors_id, origin in parts]
+
+
+def test_every_track_part_maps_back_to_its_node(mapf_graph):
+    location = graph_to_location(mapf_graph)
+    mapping = IdMapping.build(mapf_graph, location)
+    tors_ids = [track_part.id for track_part in location.trackParts]
+
+    mapf_nodes = mapping.to_mapf(tors_ids)
+
+    assert (mapf_nodes >= 0).all()
+    mapf_names = set(mapping.mapf_names)
+    for track_part, name in zip(location.trackParts, mapping.names_of(mapf_nodes)):
+        if track_part.name in mapf_names:
+            assert name == track_part.name
+    # Nodes that are a track part themselves map to it and back
+    nodes = [
+        i
+        for i, name in enumerate(mapping.mapf_names)
+        if name in {track_part.name for track_part in location.trackParts}
+    ]
+    assert list(mapping.to_mapf(mapping.to_tors(nodes))) == nodes
+    assert list(mapping.to_tors(["unknown"])) == [-1]
+
+
+def test_split_and_removed_nodes(layout, mapf_graph):
+    if layout != "shuf":
+        pytest.skip("only the shuffleboard yard has a split switch")
+    location = graph_to_location(mapf_graph)
+    mapping = IdMapping.build(mapf_graph, location)
+
+    assert mapping.tors_parts_of("g-1") == []
+    assert list(mapping.to_tors(["g-1"])) == [-1]
+    assert track_names(location, mapping.tors_parts_of("g-4")) == [
+        ("g-4.0", Origin.SPLIT),
+        ("g-4.1", Origin.SPLIT),
+        ("g-4.2", Origin.SPLIT),
+    ]
+    assert track_names(location, mapping.tors_parts_of("b-1-p-3")) == [
+        ("b-1-p-3", Origin.NODE),
+        ("bumper-b-1-p-3", Origin.BUMPER),
+    ]
+
+
+def test_compressed_track_parts_map_to_every_node(tmp_path: Path, mapf_graph):
+    location, track_mapping = compress_chains(graph_to_location(mapf_graph))
+    mapping = IdMapping.build(mapf_graph, location, track_mapping)
+    path = tmp_path / "location.json.ids.npz"
+    mapping.save(path)
+
+    loaded = IdMapping.load(path)
+
+    for field_name, array in vars(mapping).items():
+        if isinstance(array, np.ndarray):
+            np.testing.assert_array_equal(getattr(loaded, field_name), array)
+    # Every node maps to track parts that map back to it
+    for name in map(str, mapping.mapf_names):
+        for tors_id, _ in loaded.tors_parts_of(name):
+            assert name in [node for node, _ in loaded.mapf_nodes_of(tors_id)]
+    # b-1-p-2 and b-1-p-3 are in the same chain in both layouts
+    merged, other = loaded.to_tors(["b-1-p-2", "b-1-p-3"])
+    assert merged == other
+    nodes = [node for node, _ in loaded.mapf_nodes_of(int(merged))]
+    assert nodes.index("b-1-p-2") < nodes.index("b-1-p-3")
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+from batch_convert import convert_shard
+from instance_catalog import index_sources, query
+from instance_conversion import ConversionSettings
+
+
+@pytest.fixture
+def catalog(instances, tmp_path: Path) -> Path:
+    catalog = tmp_path / "catalog.sqlite"
+    index_sources(catalog, instances, tmp_path / "tors_instances")
+    return catalog
+
+
+def convert(instances: Path, catalog: Path):
+    output = catalog.parent / "tors_instances"
+    convert_shard(instances, output, ConversionSettings(), catalog=catalog)
+
+
+def relative(paths: list[str], catalog: Path) -> list[str]:
+    output = catalog.parent / "tors_instances"
+    return [Path(path).relative_to(output).as_posix() for path in paths]
+
+
+def test_location_condition_selects_scenarios_on_the_locations(instances, catalog):
+    convert(instances, catalog)
+
+    # Only the shuffleboard yard has a switch of degree 4, which is split
+    locations = query(catalog, kind="location", location_where="splits > 0")
+    scenarios = query(catalog, kind="scenario", location_where="splits > 0")
+
+    assert relative(locations, catalog) == [
+        "1a/shuf.0r_location.json",
+        "2a/shuf.0r_location.json",
+    ]
+    assert relative(scenarios, catalog) == [
+        "1a/shuf.0r/shuf.0r_3a_0_scenario.json",
+        "2a/shuf.0r/shuf.0r_3a_0_scenario.json",
+    ]
+    # The same condition on the scenario rows matches nothing
+    assert query(catalog, "splits > 0", kind="scenario") == []
+
+
+def test_scenario_and_location_conditions(instances, catalog):
+    convert(instances, catalog)
+
+    scenarios = query(catalog, "incoming >= 3", "scenario", location_where="splits = 0")
+
+    assert relative(scenarios, catalog) == [
+        "1a/car.0r/car.0r_4a_0_scenario.json",
+        "2a/car.0r/car.0r_4a_0_scenario.json",
+    ]
+
+
+def test_conditions_without_statistics_fail(catalog):
+    assert len(query(catalog, kind="location")) == 4
+    # Conditions that do not need statistics still work
+    assert len(query(catalog, "path LIKE '%/1a/%'", kind="scenario")) == 2
+
+    with pytest.raises(ValueError, match="statistics"):
+        query(catalog, kind="scenario", location_where="splits > 0")
+    with pytest.raises(ValueError, match="statistics"):
+        query(catalog, "incoming >= 4", kind="scenario")
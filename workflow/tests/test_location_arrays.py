@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+from location_arrays import LocationArrays, memmap_npz
+from protobuf_to_tors_location import graph_to_location
+
+
+def assert_arrays_equal(arrays: LocationArrays, expected: LocationArrays):
+    for name, array in vars(expected).items():
+        np.testing.assert_array_equal(getattr(arrays, name), array, err_msg=name)
+
+
+def test_neighbours_are_the_connections(mapf_graph):
+    location = graph_to_location(mapf_graph)
+    arrays = LocationArrays.from_location(location)
+
+    for i, track_part in enumerate(location.trackParts):
+        a_side = arrays.a_indices[arrays.a_indptr[i] : arrays.a_indptr[i + 1]]
+        b_side = arrays.b_indices[arrays.b_indptr[i] : arrays.b_indptr[i + 1]]
+        assert list(arrays.ids[a_side]) == list(track_part.aSide)
+        assert list(arrays.ids[b_side]) == list(track_part.bSide)
+    assert list(arrays.index_of([location.trackParts[2].id, 9999])) == [2, -1]
+
+
+def test_saved_arrays_are_memory_mapped(tmp_path: Path, mapf_graph):
+    arrays = LocationArrays.from_location(graph_to_location(mapf_graph))
+    path = tmp_path / "location.npz"
+    arrays.save(path)
+
+    mapped = LocationArrays.load(path)
+
+    assert_arrays_equal(mapped, arrays)
+    assert_arrays_equal(LocationArrays.load(path, mmap=False), arrays)
+    assert isinstance(mapped.a_indices, np.memmap)
+    assert not mapped.lengths.flags.writeable
+
+
+def test_compressed_npz_is_not_memory_mapped(tmp_path: Path):
+    path = tmp_path / "compressed.npz"
+    np.savez_compressed(path, values=np.arange(10))
+
+    with pytest.raises(ValueError, match="compressed"):
+        memmap_npz(path)
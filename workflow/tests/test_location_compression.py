@@ -0,0 +1,126 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+import protobuf_to_tors_scenario_sweep
+from location_compression import (
+    compress_chains,
+    find_chains,
+    mapping_path,
+    read_location,
+    read_track_mapping,
+)
+from protobuf_to_tors_location import graph_to_location, write_location_json
+from protobuf_to_tors_scenario import mapf_scenario_to_tors
+from protos.Location_pb2 import TrackPartType
+
+
+def neighbors(track_part) -> list[int]:
+    return [*track_part.aSide, *track_part.bSide]
+
+
+def test_compression_keeps_the_location(mapf_graph):
+    location = graph_to_location(mapf_graph)
+    compressed, mapping = compress_chains(location)
+    by_id = {track_part.id: track_part for track_part in compressed.trackParts}
+
+    # Every original track part is in exactly one compressed track part
+    original_ids = sorted(
+        original_id for ids in mapping.original_ids.values() for original_id in ids
+    )
+    assert original_ids == sorted(track_part.id for track_part in location.trackParts)
+    assert sum(track_part.length for track_part in compressed.trackParts) == sum(
+        track_part.length for track_part in location.trackParts
+    )
+    # Connections are symmetric, and no track part connects to itself
+    for track_part in compressed.trackParts:
+        for neighbor in neighbors(track_part):
+            assert neighbor != track_part.id
+            assert track_part.id in neighbors(by_id[neighbor])
+    assert sum(
+        track_part.type == TrackPartType.Bumper for track_part in compressed.trackParts
+    ) == sum(
+        track_part.type == TrackPartType.Bumper for track_part in location.trackParts
+    )
+
+
+def test_shuffleboard_branches_are_merged(layout, mapf_graph):
+    if layout != "shuf":
+        pytest.skip("only the shuffleboard yard has branches of several parts")
+    location = graph_to_location(mapf_graph)
+    names = {track_part.id: track_part.name for track_part in location.trackParts}
+
+    chains = [
+        [names[track_id] for track_id in chain] for chain in find_chains(location)
+    ]
+
+    assert ["b-1-p-1", "b-1-p-2", "b-1-p-3"] in chains
+    assert ["b-2-p-1", "b-2-p-2"] in chains
+    compressed, mapping = compress_chains(location)
+    assert len(compressed.trackParts) < len(location.trackParts)
+    assert mapping.by_original_name["b-1-p-2"] == mapping.by_original_name["b-1-p-3"]
+
+
+def test_mapping_round_trip(tmp_path: Path, mapf_graph):
+    location_path = tmp_path / "location.json"
+    _, mapping = compress_chains(graph_to_location(mapf_graph))
+    mapping.save(mapping_path(location_path))
+
+    assert read_track_mapping(location_path) == mapping
+    assert read_track_mapping(tmp_path / "uncompressed.json") is None
+
+
+def test_scenario_is_placed_on_merged_track_parts(mapf_graph, mapf_scenario):
+    location = graph_to_location(mapf_graph)
+    compressed, mapping = compress_chains(location)
+    names = {track_part.id: track_part.name for track_part in location.trackParts}
+
+    scenario = mapf_scenario_to_tors(mapf_scenario, location)
+    compressed_scenario = mapf_scenario_to_tors(
+        mapf_scenario, compressed, track_mapping=mapping
+    )
+
+    for trains, compressed_trains in [
+        (scenario.inStanding, compressed_scenario.inStanding),
+        (scenario.outStanding, compressed_scenario.outStanding),
+    ]:
+        assert len(trains) == len(compressed_trains) > 0
+        for train, compressed_train in zip(trains, compressed_trains):
+            assert (
+                mapping.by_original_name[names[train.parkingTrackPart]]
+                == compressed_train.parkingTrackPart
+            )
+
+
+def test_sweep_on_compressed_location(
+    tmp_path: Path, monkeypatch, mapf_graph, mapf_scenario
+):
+    compressed, mapping = compress_chains(graph_to_location(mapf_graph))
+    location_path = tmp_path / "location.json"
+    with open(location_path, "w") as location_file:
+        write_location_json(compressed, location_file)
+    mapping.save(mapping_path(location_path))
+    scenario_path = tmp_path / "scenario.scen.pb"
+    scenario_path.write_bytes(mapf_scenario.SerializeToString())
+    output_directory = tmp_path / "sweep"
+
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "protobuf_to_tors_scenario_sweep.py",
+            str(scenario_path),
+            str(location_path),
+            str(output_directory),
+            "--n-carriages",
+            "1",
+            "2",
+        ],
+    )
+    protobuf_to_tors_scenario_sweep.main()
+
+    assert len(list(output_directory.glob("*.json"))) == 2
+    assert read_location(location_path) == compressed
@@ -0,0 +1,62 @@
+import heapq
+
+import pytest
+
+pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+
+from location_arrays import LocationArrays
+from location_compression import compress_chains
+from protobuf_to_tors_location import graph_to_location
+from routing_tables import UNREACHABLE_LENGTH, compute_routing_tables
+
+
+def shortest_lengths(arrays: LocationArrays, source: int) -> list[float]:
+    """
+    Dijkstra over the track parts, counting the length of every track part entered.
+    """
+    indptr, indices = arrays.undirected_csr()
+    lengths = [float("inf")] * len(arrays)
+    lengths[source] = 0
+    queue = [(0, source)]
+    while queue:
+        length, node = heapq.heappop(queue)
+        if length > lengths[node]:
+            continue
+        for neighbor in indices[indptr[node] : indptr[node + 1]]:
+            candidate = length + int(arrays.lengths[neighbor])
+            if candidate < lengths[neighbor]:
+                lengths[neighbor] = candidate
+                heapq.heappush(queue, (candidate, neighbor))
+    return lengths
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_lengths_are_shortest(mapf_graph, compress: bool):
+    location = graph_to_location(mapf_graph)
+    if compress:
+        location, _ = compress_chains(location)
+    arrays = LocationArrays.from_location(location)
+
+    tables = compute_routing_tables(arrays)
+
+    for source in range(len(arrays)):
+        expected = [
+            UNREACHABLE_LENGTH if length == float("inf") else length
+            for length in shortest_lengths(arrays, source)
+        ]
+        assert tables.lengths[source].tolist() == expected
+
+
+def test_lengths_with_long_track_parts(mapf_graph):
+    location = graph_to_location(mapf_graph)
+    # The path with the fewest track parts is no longer the shortest when it
+    # passes the first branch
+    for track_part in location.trackParts:
+        if track_part.name.startswith("b-1-"):
+            track_part.length = 1000
+    arrays = LocationArrays.from_location(location)
+
+    tables = compute_routing_tables(arrays)
+
+    for source in range(len(arrays)):
+        assert tables.lengths[source].tolist() == shortest_lengths(arrays, source)
@@ -0,0 +1,136 @@
+"""
+Dry runs of the Snakefile on a tree in which the instances are already generated.
+"""
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+WORKFLOW = Path(__file__).parent.parent
+GENERATOR = "Shuntyard-Instance-Generator"
+# The layout of SCEN_FILE in rules/setup.smk
+LAYOUT = "shuffleboard_arrival_0t_50n_3b_20g_0.0r"
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("snakemake") is None, reason="snakemake is not installed"
+)
+
+
+def touch_in_order(paths: list[Path]):
+    """
+    Creates the files with increasing modification times, so that Snakemake
+    considers each one up to date with respect to the ones before it.
+    """
+    for i, path in enumerate(paths):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        os.utime(path, (1_000_000 + i, 1_000_000 + i))
+
+
+@pytest.fixture
+def workspace(tmp_path: Path) -> Path:
+    shutil.copytree(
+        WORKFLOW, tmp_path / "workflow", ignore=shutil.ignore_patterns("tests")
+    )
+    experiments = ["1a", "2b"]
+    (tmp_path / GENERATOR).mkdir()
+    (tmp_path / GENERATOR / "settings.ini").write_text(
+        "".join(f"[{experiment}]\n" for experiment in experiments)
+    )
+    protos = [
+        tmp_path / f"{GENERATOR}/protos/graph.proto",
+        tmp_path / "cTORS/protos/Location.proto",
+        tmp_path / f"protos/{GENERATOR}/graph.proto",
+        tmp_path / "protos/cTORS/Location.proto",
+    ]
+    compiled = [
+        tmp_path / f"protos/{name}_pb2{extension}"
+        for name in ["graph", "Location"]
+        for extension in [".py", ".pyi"]
+    ]
+    instances = [
+        tmp_path
+        / f"{GENERATOR}/quasi_real_instances/exp/{experiment}/{LAYOUT}/{LAYOUT}{suffix}"
+        for experiment in experiments
+        for suffix in [".graph", "_2a_0gs_0ss_0types_0.scen"]
+    ]
+    touch_in_order(
+        protos
+        + compiled
+        + [tmp_path / GENERATOR / "settings.ini"]
+        + list((tmp_path / "workflow").rglob("*"))
+        + instances
+    )
+    # The experiment directories are the outputs of create_experiment
+    for experiment in experiments:
+        experiment_directory = (
+            tmp_path / f"{GENERATOR}/quasi_real_instances/exp/{experiment}"
+        )
+        os.utime(experiment_directory / LAYOUT, (2_000_000, 2_000_000))
+        os.utime(experiment_directory, (2_000_000, 2_000_000))
+    return tmp_path
+
+
+def snakemake(workspace: Path, *arguments: str) -> str:
+    result = subprocess.run(
+        ["snakemake", "--cores", "2", *arguments],
+        check=False,
+        cwd=workspace,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_sharded_generation_converts_each_experiment(workspace: Path, fan_out: bool):
+    output = snakemake(
+        workspace, "-n", "--config", "sharded_generation=True", f"fan_out={fan_out}"
+    )
+
+    # Every experiment is already generated, and no conversion depends on
+    # generating all experiments at once
+    assert "rule create_instances:" not in output
+    assert "rule create_experiment:" not in output
+    assert output.count("rule convert_experiment:") == 2
+    for experiment in ["1a", "2b"]:
+        assert f"tors_instances/{experiment}/{LAYOUT}_location.json" in output
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+def test_one_generation_rule(workspace: Path, sharded: bool):
+    # The outputs of create_instances contain the experiment directories
+    rules = snakemake(
+        workspace, "--list-rules", "--config", f"sharded_generation={sharded}"
+    ).split()
+
+    assert ("create_instances" in rules) != sharded
+    assert ("create_experiment" in rules) == sharded
+
+
+def test_catalog_query_without_statistics_fails(workspace: Path):
+    pytest.importorskip("protos.Location_pb2", reason="the protos are not compiled")
+    from instance_catalog import index_sources
+
+    index_sources(
+        workspace / "catalog.sqlite",
+        workspace / f"{GENERATOR}/quasi_real_instances/exp",
+        Path("tors_instances"),
+    )
+    arguments = ["-n", "--config", "catalog=catalog.sqlite"]
+
+    # Without a query, every indexed instance is a target
+    output = snakemake(workspace, *arguments)
+    assert output.count("rule protobuf_to_tors_scenario:") == 2
+    result = subprocess.run(
+        ["snakemake", "--cores", "2", *arguments, "catalog_query=splits > 0"],
+        check=False,
+        cwd=workspace,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert "has statistics" in result.stdout + result.stderr